@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity between standalone questions needed for a hit
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 2000))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+
+
+class CacheHit(NamedTuple):
+    answer: str
+    question: str
+    similarity: float
+
+
+def answer_chunks(answer: str) -> Iterator[str]:
+    """
+    A stored answer split into word-sized pieces, to stream it like the LLM
+    """
+    return iter(re.findall(r"\s*\S+", answer) or [answer])
+
+
+class SemanticAnswerCache:
+    """
+    Chat answers keyed by the embedding of the standalone question and a
+    scope (the retrieval mode and explicit filters). A lookup is a single
+    matrix product over all slots; the least recently used entry is evicted
+    when full and entries expire after `ttl_seconds`.
+
+    `invalidate` drops everything when the graph changes. Answers whose
+    lookup happened before an invalidation are not stored afterwards.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        enabled: bool = ANSWER_CACHE_ENABLED,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.vectors: Optional[np.ndarray] = None
+        self.occupied = np.zeros(max_entries, dtype=bool)
+        self.scopes = np.full(max_entries, None, dtype=object)
+        self.expires = np.zeros(max_entries)
+        self.last_used = np.zeros(max_entries)
+        self.questions: List[Optional[str]] = [None] * max_entries
+        self.answers: List[Optional[str]] = [None] * max_entries
+        self.generation = 0
+        self.counts = {
+            "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0
+        }
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, scope: str, vector) -> Optional[CacheHit]:
+        if not self.enabled:
+            return None
+        query = self._normalize(vector)
+        with self.lock:
+            now = time.time()
+            live = self.occupied & (self.scopes == scope) & (self.expires > now)
+            if self.vectors is None or not live.any():
+                self.counts["misses"] += 1
+                return None
+            scores = np.where(live, self.vectors @ query, -np.inf)
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.counts["misses"] += 1
+                return None
+            self.counts["hits"] += 1
+            self.last_used[slot] = now
+            return CacheHit(self.answers[slot], self.questions[slot], float(scores[slot]))
+
+    def store(self, scope: str, question: str, vector, answer: str, generation: int) -> None:
+        """
+        Keep an answer computed after a lookup at `generation`
+        """
+        if not self.enabled or not answer:
+            return
+        vector = self._normalize(vector)
+        with self.lock:
+            if generation != self.generation:
+                return
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            now = time.time()
+            free = np.flatnonzero(~self.occupied | (self.expires <= now))
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self.last_used))
+                self.counts["evictions"] += 1
+            self.occupied[slot] = True
+            self.vectors[slot] = vector
+            self.scopes[slot] = scope
+            self.expires[slot] = now + self.ttl_seconds
+            self.last_used[slot] = now
+            self.questions[slot] = question
+            self.answers[slot] = answer
+            self.counts["stores"] += 1
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.occupied[:] = False
+            self.scopes[:] = None
+            self.questions = [None] * self.max_entries
+            self.answers = [None] * self.max_entries
+            self.generation += 1
+            self.counts["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": int((self.occupied & (self.expires > time.time())).sum()),
+                "maxEntries": self.max_entries,
+                "threshold": self.threshold,
+                "generation": self.generation,
+                **self.counts,
+                "hitRate": round(self.counts["hits"] / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,63 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from neo4j import AsyncGraphDatabase, Query
+from neo4j.exceptions import CypherSyntaxError
+
+NEO4J_ASYNC_POOL_SIZE = int(os.environ.get("NEO4J_ASYNC_POOL_SIZE", 200))
+
+
+class AsyncNeo4jGraph:
+    """
+    Async counterpart of `Neo4jGraph.query` on `neo4j.AsyncGraphDatabase`,
+    using the same NEO4J_* settings. Awaiting a query yields the event loop
+    instead of holding a worker thread for the Bolt round trip.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        database: Optional[str] = None,
+        timeout: Optional[float] = None,
+        pool_size: int = NEO4J_ASYNC_POOL_SIZE,
+    ):
+        self.driver = AsyncGraphDatabase.driver(
+            url or os.environ["NEO4J_URI"],
+            auth=(
+                username or os.environ["NEO4J_USERNAME"],
+                password or os.environ["NEO4J_PASSWORD"],
+            ),
+            max_connection_pool_size=pool_size,
+        )
+        self.database = database or os.environ.get("NEO4J_DATABASE", "neo4j")
+        self.timeout = timeout
+
+    async def query(
+        self, query: str, params: Optional[Dict] = None, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        async with self.driver.session(database=self.database) as session:
+            try:
+                result = await session.run(
+                    Query(text=query, timeout=timeout if timeout is not None else self.timeout),
+                    params or {},
+                )
+                return await result.data()
+            except CypherSyntaxError as e:
+                raise ValueError(f"Generated Cypher Statement is not valid\n{e}")
+
+    async def explain(
+        self, query: str, params: Optional[Dict] = None
+    ) -> Tuple[Optional[Dict], str]:
+        """
+        The EXPLAIN plan and query type ('r', 'rw', 'w' or 's') without running
+        the query
+        """
+        async with self.driver.session(database=self.database) as session:
+            result = await session.run("EXPLAIN " + query, params or {})
+            summary = await result.consume()
+            return summary.plan, summary.query_type
+
+    async def close(self) -> None:
+        await self.driver.close()
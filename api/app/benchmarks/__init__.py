@@ -0,0 +1,5 @@
+"""
+Offline performance benchmarks. Run from the app directory, e.g.
+`python -m benchmarks.import_throughput`. None of them need Neo4j or
+OpenAI; `benchmarks.synthetic` generates dumps of any size.
+"""
@@ -0,0 +1,102 @@
+"""
+Load test for the streaming chat endpoint of a running API, e.g.
+
+    python -m benchmarks.chat_load --url http://localhost:8000 --concurrency 300
+
+Opens `concurrency` simultaneous /chat/stream_log streams until `requests`
+have completed and reports time to first event, total latency and errors.
+Run it against a single uvicorn worker to check that concurrent chats are
+bounded by the event loop rather than by the thread pool.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "What does a data entry clerk do on a typical day?",
+    "Which jobs in healthcare do not need a college degree?",
+    "What is the salary of a retail store associate in large cities?",
+    "Which aptitudes matter most for a lab technician?",
+    "Who are well known employers for telecom technicians?",
+]
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None}
+    values = np.asarray(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+    }
+
+
+async def stream_chat(client: httpx.AsyncClient, url: str, question: str, mode: str):
+    start = time.perf_counter()
+    first_event = None
+    async with client.stream(
+        "POST",
+        f"{url}/chat/stream_log",
+        json={"input": {"question": question, "mode": mode}, "config": {}, "kwargs": {}},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_event is None and line.startswith("data:"):
+                first_event = time.perf_counter() - start
+    return first_event, time.perf_counter() - start
+
+
+async def run(url: str, concurrency: int, requests: int, mode: str, timeout: float) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    first_events, totals, errors = [], [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+
+        async def one(i: int):
+            async with semaphore:
+                try:
+                    first_event, total = await stream_chat(
+                        client, url, QUESTIONS[i % len(QUESTIONS)], mode
+                    )
+                except Exception as e:
+                    errors.append(type(e).__name__)
+                    return
+                if first_event is not None:
+                    first_events.append(first_event)
+                totals.append(total)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "mode": mode,
+        "completed": len(totals),
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(len(totals) / elapsed, 2),
+        "first_event": percentiles(first_events),
+        "total": percentiles(totals),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent streaming chat load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--mode", default="basic_hybrid_search_node_neighborhood")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    result = asyncio.run(
+        run(args.url, args.concurrency, args.requests, args.mode, args.timeout)
+    )
+    print(json.dumps(result))
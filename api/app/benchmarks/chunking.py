@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import time
+from itertools import islice
+
+from chunking import CHUNK_POOL_CHUNKSIZE, ChunkingPool
+from importing import ARTICLES_FILE
+from streaming import iter_json_records
+
+
+def load_articles(path: str, count: int):
+    articles = list(iter_json_records(path))
+    return [dict(article) for article in islice(_cycle(articles), count)]
+
+
+def _cycle(items):
+    while True:
+        yield from items
+
+
+def run(count: int, chunksize: int, path: str = ARTICLES_FILE):
+    articles = load_articles(path, count)
+    baseline = None
+    results = []
+    workers = 1
+    max_workers = os.cpu_count() or 1
+    while True:
+        pool = ChunkingPool(workers=workers, chunksize=chunksize, parallel_threshold=0)
+        # Warm up: spawn workers and load the tokenizer outside the timing
+        pool.map(articles[: max(workers * chunksize, 1)])
+        start = time.perf_counter()
+        output = pool.map(articles)
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        output = [(el.text, el.chunks) for el in output]
+        if baseline is None:
+            baseline, reference = elapsed, output
+        assert output == reference, "parallel output differs from serial output"
+        results.append(
+            {
+                "workers": workers,
+                "articles": count,
+                "chunks": sum(len(chunks) for _, chunks in output),
+                "seconds": round(elapsed, 3),
+                "articles_per_second": round(count / elapsed, 1),
+                "speedup": round(baseline / elapsed, 2),
+            }
+        )
+        print(json.dumps(results[-1]))
+        if workers == max_workers:
+            return results
+        workers = min(workers * 2, max_workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render + chunk scaling benchmark")
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_POOL_CHUNKSIZE)
+    parser.add_argument("--path", default=ARTICLES_FILE)
+    args = parser.parse_args()
+    run(args.articles, args.chunksize, args.path)
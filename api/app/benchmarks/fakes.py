@@ -0,0 +1,87 @@
+"""
+Offline stand-ins for OpenAI embeddings and Neo4j, for benchmarks
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from embedding import EMBEDDING_DIMENSIONS
+from importing import removed_profiles_query
+
+
+class FakeEmbeddings:
+    """
+    Deterministic embedder: each text maps to a fixed unit vector derived from
+    its hash. `latency` seconds are slept per call to mimic the API round trip.
+    """
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        vectors = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i] = self._vector(text)
+        with self.lock:
+            self.calls += 1
+            self.texts += len(texts)
+            self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text).tolist()
+
+
+class RecordingGraph:
+    """
+    Records every query instead of running it: call count, rows sent and
+    time spent per distinct statement. Lookups made by the importer get
+    empty answers, so every profile looks new. `latency` seconds are slept
+    per call to mimic a database round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.stats: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"calls": 0, "rows": 0, "seconds": 0.0}
+        )
+
+    def query(self, query: str, params: Optional[Dict] = None) -> List[Dict]:
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        params = params or {}
+        stats = self.stats[query]
+        stats["calls"] += 1
+        stats["rows"] += len(params.get("rows") or params.get("ids") or [])
+        stats["seconds"] += time.perf_counter() - start
+        if query == removed_profiles_query:
+            return [{"removed": 0}]
+        return []
+
+    @property
+    def calls(self) -> int:
+        return sum(stats["calls"] for stats in self.stats.values())
+
+    @property
+    def rows(self) -> int:
+        return sum(stats["rows"] for stats in self.stats.values())
@@ -0,0 +1,125 @@
+"""
+End-to-end import throughput on synthetic profiles, with a fake embedder and
+a recording graph. Each scale runs in a fresh interpreter so peak RSS is not
+shared, and prints one JSON result per line, e.g.
+
+    python -m benchmarks.import_throughput --profiles 1000 10000 100000
+
+Write timings cover building and batching the rows plus the simulated
+database latency, not Neo4j itself.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbeddings, RecordingGraph
+from benchmarks.synthetic import write_dump
+from chunking import CHUNK_WORKERS, ChunkingPool
+from embedding import EMBEDDING_DIMENSIONS, EmbeddingStage
+from importing import IMPORT_BATCH_SIZE, ImportProgress, import_articles
+
+STAGES = ["parse", "render", "chunk", "embed", "write"]
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(
+    profiles: int,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = CHUNK_WORKERS,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    embed_latency: float = 0.0,
+    write_latency: float = 0.0,
+    ndjson: bool = False,
+) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_dump(
+            os.path.join(directory, "profiles.json"), profiles, ndjson=ndjson
+        )
+        embeddings = FakeEmbeddings(dimensions, latency=embed_latency)
+        embedding_stage = EmbeddingStage(embeddings)
+        chunking_pool = ChunkingPool(workers=workers)
+        graph = RecordingGraph(latency=write_latency)
+        progress = ImportProgress()
+        baseline = max_rss_mb()
+        start = time.perf_counter()
+        import_articles(
+            graph, embedding_stage, chunking_pool, path, batch_size, progress=progress
+        )
+        elapsed = time.perf_counter() - start
+        embedding_stage.shutdown()
+        chunking_pool.shutdown()
+    return {
+        "profiles": profiles,
+        "format": "ndjson" if ndjson else "json",
+        "batch_size": batch_size,
+        "chunk_workers": workers,
+        "chunks": progress.chunks_embedded,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(progress.rows_written / elapsed, 1),
+        "chunks_per_second": round(progress.chunks_embedded / elapsed, 1),
+        # render and chunk are summed over workers; embed is time blocked on
+        # vectors, embedder_seconds the time the embedder itself was busy
+        "stage_seconds": {
+            stage: round(progress.timings[stage], 3) for stage in STAGES
+        },
+        "embedder_seconds": round(embeddings.seconds, 3),
+        "queries": graph.calls,
+        "rows_sent": graph.rows,
+        "peak_rss_mb": round(max_rss_mb(), 1),
+        "peak_rss_delta_mb": round(max_rss_mb() - baseline, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import throughput benchmark")
+    parser.add_argument("--profiles", type=int, nargs="+", default=[1000])
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=CHUNK_WORKERS)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--write-latency-ms", type=float, default=0.0)
+    parser.add_argument("--ndjson", action="store_true")
+    parser.add_argument("--output", help="Also write all results to this file")
+    args = parser.parse_args()
+
+    if len(args.profiles) == 1 and not args.output:
+        result = measure(
+            args.profiles[0],
+            args.batch_size,
+            args.workers,
+            args.dimensions,
+            args.embed_latency_ms / 1000,
+            args.write_latency_ms / 1000,
+            args.ndjson,
+        )
+        print(json.dumps(result))
+    else:
+        results = []
+        for profiles in args.profiles:
+            command = [
+                sys.executable, "-m", "benchmarks.import_throughput",
+                "--profiles", str(profiles),
+                "--batch-size", str(args.batch_size),
+                "--workers", str(args.workers),
+                "--dimensions", str(args.dimensions),
+                "--embed-latency-ms", str(args.embed_latency_ms),
+                "--write-latency-ms", str(args.write_latency_ms),
+            ]
+            if args.ndjson:
+                command.append("--ndjson")
+            output = subprocess.run(
+                command, check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.splitlines()[-1]))
+            print(json.dumps(results[-1]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
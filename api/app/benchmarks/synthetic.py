@@ -0,0 +1,207 @@
+"""
+Synthetic job profiles shaped like the TransformerService dumps. Output is
+deterministic for a given seed, and dimension values (attributes, employers,
+pathways, roles) repeat across profiles like they do in the real data.
+"""
+import argparse
+import json
+import random
+import re
+from typing import Dict, Iterator
+
+SECTORS = {
+    "Healthcare": ["Allied Health", "Nursing", "Diagnostics", "Pharmacy"],
+    "Retail": ["Store Operations", "E-commerce", "Merchandising"],
+    "Telecom/Electronics": ["Network Services", "Device Repair"],
+    "IT / ITeS (Information Technology / Information Technology enabled Services)": [
+        "Data Management",
+        "Software Development",
+        "Customer Support",
+    ],
+    "Automotive": ["Vehicle Servicing", "Manufacturing"],
+    "BFSI (Banking, Financial Services, and Insurance)": ["Banking", "Insurance"],
+    "Hospitality & Tourism": ["Food & Beverage", "Front Office"],
+    "Construction and Real Estate": ["Site Operations", "Interiors"],
+}
+APTITUDES = [
+    "Creative Thinking and Innovation",
+    "Entrepreneurial Skills",
+    "Interpersonal Skills",
+    "Logical Reasoning and Analytical Skills",
+    "Numerical Aptitude",
+    "Organizational Skills",
+    "Physical and Manual Skills",
+    "Spatial Awareness",
+    "Technical Proficiency",
+    "Verbal Ability and Communication Skills",
+]
+INTERESTS = ["Artistic", "Conventional", "Enterprising", "Investigative", "Realistic", "Social"]
+VALUES = [
+    "Achievement",
+    "Compensation",
+    "Independence",
+    "Recognition",
+    "Security",
+    "Supportive Environment",
+    "Work-Life Balance",
+]
+GEOGRAPHIC_OPTIONS = ["Large Cities", "Medium & Small Cities", "Towns & Villages"]
+AVAILABILITY = ["High", "Medium", "Low to None"]
+YEARS = ["0-2", "2-4", "2-5", "3-5", "3-7", "4-8", "5-10", "6-10", "8-10"]
+ROLE_WORDS = [
+    "Assistant", "Technician", "Executive", "Coordinator", "Analyst", "Specialist",
+    "Operator", "Associate", "Supervisor", "Manager", "Officer", "Consultant",
+]
+FIELD_WORDS = [
+    "Data", "Lab", "Sales", "Service", "Network", "Quality", "Store", "Medical",
+    "Field", "Accounts", "Billing", "Safety", "Logistics", "Design", "Support",
+]
+WORDS = (
+    "the role involves working with teams customers systems records tools and "
+    "equipment to deliver reliable results every day while learning new skills "
+    "in a structured environment with clear goals regular feedback and steady "
+    "growth across different cities towns and sectors of the economy"
+).split()
+
+EMPLOYERS = [f"Employer {i}" for i in range(400)]
+PATHWAYS = [f"{field} {role} Pathway" for field in FIELD_WORDS for role in ROLE_WORDS]
+ROLES = [f"{field} {role}" for field in FIELD_WORDS for role in ROLE_WORDS]
+
+
+def _sentences(rng: random.Random, count: int) -> str:
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 20))).capitalize() + "."
+        for _ in range(count)
+    )
+
+
+def _ratings(rng: random.Random, attributes, count: int):
+    return [
+        {
+            "attribute": attribute,
+            "score": str(rng.randint(1, 10)),
+            "reason": _sentences(rng, 1),
+        }
+        for attribute in rng.sample(attributes, count)
+    ]
+
+
+def _salary_range(rng: random.Random) -> str:
+    low = rng.randrange(8_000, 60_000, 1_000)
+    return f"₹{low:,} - ₹{low + rng.randrange(5_000, 40_000, 1_000):,}"
+
+
+def _key(*parts: str) -> str:
+    return "_".join(re.sub(r"[^a-z0-9]+", "_", part.lower()).strip("_") for part in parts)
+
+
+def generate_profile(index: int, seed: int = 0) -> Dict:
+    rng = random.Random(f"{seed}-{index}")
+    sector = rng.choice(list(SECTORS))
+    sub_sector = rng.choice(SECTORS[sector])
+    role = rng.choice(ROLES)
+    category = rng.choice(["College", "Non-College"])
+    return {
+        "_id": {"$oid": f"{seed:08x}{index:016x}"},
+        "createdAt": [{"$date": "2024-06-05T15:29:33.368Z"}],
+        "updatedAt": {"$date": "2024-08-16T15:10:49.688Z"},
+        "deleted": False,
+        "sector": sector,
+        "collegeCategory": category,
+        "subSector": sub_sector,
+        "jobProfile": {
+            "generalDescription": {
+                "text": _sentences(rng, 4),
+                "mediaURL": f"https://example.com/images/{index}.png",
+                "mediaURLs": {
+                    "male": f"https://example.com/images/{index}-male.png",
+                    "female": f"https://example.com/images/{index}-female.png",
+                },
+            },
+            "dayInTheLife": {"text": _sentences(rng, 6)},
+            "reasonsLiked": [{"reason": _sentences(rng, 1)} for _ in range(5)],
+            "reasonsDisliked": [{"reason": _sentences(rng, 1)} for _ in range(5)],
+            "prepareForRole": {
+                "educationVsDegreeHeading": rng.choice(
+                    ["Education Needed", "College Degree Needed"]
+                ),
+                "educationVsDegree": _sentences(rng, 3),
+                "trainingNeeded": _sentences(rng, 3),
+                "priorWorkExperience": _sentences(rng, 3),
+            },
+        },
+        "aptitudeRatings": _ratings(rng, APTITUDES, 10),
+        "interestRatings": _ratings(rng, INTERESTS, 6),
+        "valueRatings": _ratings(rng, VALUES, 7),
+        "careerPathways": [
+            {
+                "pathwayTitle": rng.choice(PATHWAYS),
+                "description": _sentences(rng, 1),
+                "jobRoles": [
+                    {"title": rng.choice(ROLES), "years": rng.choice(YEARS)}
+                    for _ in range(3)
+                ],
+            }
+            for _ in range(5)
+        ],
+        "jobLocation": "India",
+        "jobRole": role,
+        "employers": {
+            "wellKnownEmployers": [
+                {
+                    "name": name,
+                    "description": _sentences(rng, 1),
+                    "website": f"https://www.{_key(name)}.example.com",
+                }
+                for name in rng.sample(EMPLOYERS, 5)
+            ],
+            "employerProfiles": [
+                {"geographicOption": option, "profiles": _sentences(rng, 1)}
+                for option in GEOGRAPHIC_OPTIONS
+            ],
+        },
+        "geographicJobDetails": [
+            {
+                "geographicOption": option,
+                "jobAvailability": rng.choice(AVAILABILITY),
+                "estimatedSalaryRange": _salary_range(rng),
+            }
+            for option in GEOGRAPHIC_OPTIONS
+        ],
+        "generatedBy": "Synthetic",
+        "languageCode": "en",
+        "jobRoleKey": _key("india", sector, sub_sector, "entry-level", category, role),
+        "experienceLevel": "entry-level",
+    }
+
+
+def generate_profiles(count: int, seed: int = 0) -> Iterator[Dict]:
+    for index in range(count):
+        yield generate_profile(index, seed)
+
+
+def write_dump(path: str, count: int, seed: int = 0, ndjson: bool = False) -> str:
+    """
+    Write `count` profiles as a JSON array, or one per line, without holding
+    them all in memory
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        if ndjson:
+            for profile in generate_profiles(count, seed):
+                f.write(json.dumps(profile, ensure_ascii=False) + "\n")
+        else:
+            f.write("[")
+            for index, profile in enumerate(generate_profiles(count, seed)):
+                f.write((",\n" if index else "\n") + json.dumps(profile, ensure_ascii=False))
+            f.write("\n]\n")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic job profile dump")
+    parser.add_argument("path")
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ndjson", action="store_true")
+    args = parser.parse_args()
+    write_dump(args.path, args.profiles, args.seed, args.ndjson)
@@ -0,0 +1,91 @@
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+
+from embedding import EMBEDDING_DIMENSIONS, EmbeddingStage
+from importing import attach_embeddings, chunk_texts
+
+
+class ListEmbeddings:
+    """
+    Returns lists of Python floats, like the OpenAI client does
+    """
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts):
+        rng = random.Random(len(texts))
+        return [[rng.random() for _ in range(self.dimensions)] for _ in texts]
+
+
+def make_params(chunks: int, per_profile: int = 5):
+    return [
+        {
+            "id": f"profile-{p}",
+            "chunks": [
+                {"text": f"chunk {p}-{i} " * 40, "index": f"profile-{p}-{i}"}
+                for i in range(per_profile)
+            ],
+        }
+        for p in range(chunks // per_profile)
+    ]
+
+
+def attach_embeddings_lists(params, embedded_documents):
+    # The list-of-floats path used before vectors were kept in float32 arrays
+    all_chunks = [chunk for param in params for chunk in param["chunks"]]
+    chunk_embedding_map = {
+        chunk["index"]: embedded_documents[i] for i, chunk in enumerate(all_chunks)
+    }
+    for param in params:
+        param["chunks"] = [
+            {**chunk, "embedding": chunk_embedding_map.get(chunk["index"], None)}
+            for chunk in param["chunks"]
+        ]
+    return params
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode: str, chunks: int, dimensions: int) -> dict:
+    params = make_params(chunks)
+    embeddings = ListEmbeddings(dimensions)
+    baseline = max_rss_mb()
+    if mode == "lists":
+        vectors = embeddings.embed_documents(chunk_texts(params))
+        params = attach_embeddings_lists(params, vectors)
+    else:
+        stage = EmbeddingStage(embeddings, max_workers=1)
+        params = attach_embeddings(params, stage.embed(chunk_texts(params)))
+        stage.shutdown()
+    return {
+        "mode": mode,
+        "chunks": chunks,
+        "dimensions": dimensions,
+        "peak_rss_delta_mb": round(max_rss_mb() - baseline, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak RSS of the chunk embedding path")
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--mode", choices=["lists", "float32"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.chunks, args.dimensions)))
+    else:
+        # Each mode runs in a fresh interpreter so peak RSS is not shared
+        for mode in ("lists", "float32"):
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.vector_memory", "--mode", mode,
+                 "--chunks", str(args.chunks), "--dimensions", str(args.dimensions)],
+                check=True,
+            )
@@ -0,0 +1,148 @@
+"""
+Recall@k and latency of the in-process vector mirror. Offline it searches
+synthetic clustered vectors against a full, unblocked sort of all scores:
+
+    python -m benchmarks.vector_search --chunks 100000
+
+With --neo4j it mirrors the Chunk embeddings of the configured database and
+compares the mirror (exact) with the chunk_vector ANN index and with the
+hybrid JobProfile search the chat retriever used before.
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+from embedding import EMBEDDING_DIMENSIONS
+from vector_mirror import VectorMirror, iter_chunk_pages
+
+
+def percentiles(latencies) -> dict:
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def synthetic_pages(chunks: int, dimensions: int, page_size: int = 5000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((64, dimensions), dtype=np.float32)
+    for start in range(0, chunks, page_size):
+        count = min(page_size, chunks - start)
+        vectors = centers[rng.integers(0, len(centers), count)]
+        vectors = vectors + 0.5 * rng.standard_normal((count, dimensions), dtype=np.float32)
+        yield [
+            {"id": f"chunk-{start + i:09d}", "profileId": f"profile-{(start + i) // 5}",
+             "text": f"chunk {start + i}", "embedding": vector}
+            for i, vector in enumerate(vectors)
+        ]
+
+
+def sample_queries(snapshot, count: int, seed: int = 1) -> np.ndarray:
+    # Perturbed copies of stored chunks, like questions close to a passage
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(snapshot), size=min(count, len(snapshot)), replace=False)
+    vectors = np.asarray(snapshot.vectors[rows])
+    return vectors + 0.02 * rng.standard_normal(vectors.shape, dtype=np.float32)
+
+
+def recall(found, expected) -> float:
+    return len(set(found) & set(expected)) / len(expected) if len(expected) else 1.0
+
+
+def run_offline(chunks: int, queries: int, k: int, dimensions: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = VectorMirror(directory, enabled=True)
+        snapshot, build_seconds = timed(mirror.build, synthetic_pages(chunks, dimensions))
+        recalls, latencies = [], []
+        for query in sample_queries(snapshot, queries):
+            (rows, _), elapsed = timed(snapshot.search, query, k)
+            expected = np.argsort(-(snapshot.vectors @ query))[:k]
+            recalls.append(recall(rows.tolist(), expected.tolist()))
+            latencies.append(elapsed)
+    return {
+        "source": "synthetic",
+        "chunks": chunks,
+        "dimensions": dimensions,
+        "k": k,
+        "queries": len(latencies),
+        "build_seconds": round(build_seconds, 2),
+        "mirror": {"recall_at_k": round(float(np.mean(recalls)), 4), **percentiles(latencies)},
+    }
+
+
+def run_neo4j(queries: int, k: int) -> dict:
+    from langchain_community.graphs import Neo4jGraph
+    from langchain_community.vectorstores import Neo4jVector
+    from benchmarks.fakes import FakeEmbeddings
+    from migrations import chunk_index_name, index_name, keyword_index_name
+
+    graph = Neo4jGraph(refresh_schema=False)
+    hybrid_index = Neo4jVector.from_existing_index(
+        FakeEmbeddings(),
+        graph=graph,
+        index_name=index_name,
+        keyword_index_name=keyword_index_name,
+        search_type="hybrid",
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = VectorMirror(directory, enabled=True)
+        snapshot, build_seconds = timed(mirror.build, iter_chunk_pages(graph))
+        mirror_latencies, ann_latencies, hybrid_latencies, recalls = [], [], [], []
+        for query in sample_queries(snapshot, queries):
+            docs, elapsed = timed(mirror.similarity_search_by_vector, query, k)
+            mirror_latencies.append(elapsed)
+            expected = [doc.metadata["id"] for doc in docs]
+
+            result, elapsed = timed(
+                graph.query,
+                "CALL db.index.vector.queryNodes($index, $k, $vector) YIELD node "
+                "RETURN node.id AS id",
+                {"index": chunk_index_name, "k": k, "vector": query.tolist()},
+            )
+            ann_latencies.append(elapsed)
+            recalls.append(recall([el["id"] for el in result], expected))
+
+            _, elapsed = timed(
+                hybrid_index.similarity_search_by_vector,
+                query.tolist(),
+                k,
+                query=docs[0].page_content[:200],
+            )
+            hybrid_latencies.append(elapsed)
+    return {
+        "source": "neo4j",
+        "chunks": len(snapshot),
+        "k": k,
+        "queries": len(mirror_latencies),
+        "build_seconds": round(build_seconds, 2),
+        "mirror": {"recall_at_k": 1.0, **percentiles(mirror_latencies)},
+        "neo4j_chunk_vector": {
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            **percentiles(ann_latencies),
+        },
+        "neo4j_hybrid": percentiles(hybrid_latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector mirror recall and latency")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--neo4j", action="store_true", help="Compare against the configured database")
+    args = parser.parse_args()
+
+    if args.neo4j:
+        print(json.dumps(run_neo4j(args.queries, args.k)))
+    else:
+        print(json.dumps(run_offline(args.chunks, args.queries, args.k, args.dimensions)))
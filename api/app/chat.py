@@ -1,5 +1,11 @@
+import asyncio
+import json
 import logging
-from typing import List, Tuple
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import partial
+from typing import List, Optional, Tuple
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
@@ -10,23 +16,41 @@ from langchain_core.prompts import (
 
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain.chains import LLMChain
-from langchain.chains import GraphCypherQAChain
 from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+from langchain_community.chains.graph_qa.cypher import extract_cypher
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain.callbacks import get_openai_callback
 
 from langchain_core.runnables import (
     RunnableBranch,
+    RunnableGenerator,
     RunnableLambda,
     RunnableParallel,
     RunnablePassthrough,
 )
+from answer_cache import CacheHit, SemanticAnswerCache, answer_chunks
+from graph_context import format_profiles
+from latency import LatencyRecorder
+from retrieval_filters import RETRIEVAL_FILTER_EXTRACTION, RetrievalFilters
 from utils import (
     _format_chat_history,
+    afact_card_search,
+    asimilarity_search,
+    asimilarity_search_with_profiles,
+    async_graph,
+    cypher_cache,
+    cypher_guard,
+    embeddings,
+    fact_card_search,
     format_docs,
     graph,
+    graph_schema,
+    intent_router,
     llm,
-    vector_index,
+    profile_catalog,
+    prompt_schema,
+    similarity_search,
+    similarity_search_with_profiles,
 )
 
 from prompt import (
@@ -43,6 +67,27 @@ Follow Up Input: {question}
 """
 CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(rewrite_template)
 
+# Vector and Cypher retrieval run side by side; a branch that misses its
+# timeout is dropped from the context
+VECTOR_RETRIEVAL_TIMEOUT = float(os.environ.get("VECTOR_RETRIEVAL_TIMEOUT", 10))
+STRUCTURED_RETRIEVAL_TIMEOUT = float(os.environ.get("STRUCTURED_RETRIEVAL_TIMEOUT", 30))
+RETRIEVAL_MAX_WORKERS = int(os.environ.get("RETRIEVAL_MAX_WORKERS", 16))
+
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval"
+)
+retrieval_latency = LatencyRecorder()
+# Invalidated by imports that change the graph
+answer_cache = SemanticAnswerCache()
+
+NODE_NEIGHBORHOOD_MODE = "basic_hybrid_search_node_neighborhood"
+# Structured context comes from expanding the matched chunks' profiles in the
+# retrieval query instead of LLM-generated Cypher
+GRAPH_EXPANDED_MODE = "graph_expanded_search"
+# One precomputed fact card per matched profile instead of raw chunks
+FACT_CARD_MODE = "fact_card_search"
+FACT_CARD_TOP_K = int(os.environ.get("FACT_CARD_TOP_K", 3))
+
 # RAG answer synthesis prompt
 
 ANSWER_PROMPT = ChatPromptTemplate.from_messages(
@@ -53,6 +98,8 @@ ANSWER_PROMPT = ChatPromptTemplate.from_messages(
     ]
 )
 
+answer_chain = ANSWER_PROMPT | llm | StrOutputParser()
+
 _search_query = RunnableBranch(
     # If input includes chat_history, we condense it with the follow-up question
     (
@@ -70,13 +117,11 @@ _search_query = RunnableBranch(
 )
 
 
-def query_generate(question):
-    
-    CYPHER_GENERATION_PROMPT = PromptTemplate(
-        input_variables=["schema", "question"], template=CYPHER_GENERATION_PROMPT_TEMPLATE
-    )
+CYPHER_GENERATION_PROMPT = PromptTemplate(
+    input_variables=["schema", "question"], template=CYPHER_GENERATION_PROMPT_TEMPLATE
+)
 
-    QA_TEMPLATE = """You are an assistant that helps to form nice and human understandable answers.
+QA_TEMPLATE = """You are an assistant that helps to form nice and human understandable answers.
     The information part contains the provided information that you must use to construct an answer.
     The provided information is authoritative, you must never doubt it or try to use your internal knowledge to correct it.
     Make the answer sound as a response to the question. Do not mention that you based the result on the given information.
@@ -95,43 +140,455 @@ def query_generate(question):
 
     Question: {question}
     Helpful Answer:"""
-    QA_PROMPT = PromptTemplate(
-        input_variables=["context", "question"], template=QA_TEMPLATE
-    )
-    cypher_llm_chain = GraphCypherQAChain.from_llm(
-        llm=llm,
-        graph=graph,
-        verbose=True,
-        cypher_prompt=CYPHER_GENERATION_PROMPT,
-        qa_prompt=QA_PROMPT
-    )
-    response = cypher_llm_chain.invoke(question)
-    return response['result']
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question"], template=QA_TEMPLATE
+)
+
+# Rows of generated Cypher passed to the answer prompt, as in GraphCypherQAChain
+CYPHER_TOP_K = 10
+
+cypher_generation_chain = CYPHER_GENERATION_PROMPT | llm | StrOutputParser()
+cypher_qa_chain = QA_PROMPT | llm | StrOutputParser()
+
+
+def query_generate(question: str) -> str:
+    """
+    Same steps as GraphCypherQAChain, skipping generation when Cypher for
+    a question of the same shape is cached
+    """
+    template = cypher_cache.template(question)
+    generated_cypher = cypher_cache.lookup(template, graph_schema.fingerprint)
+    cached = generated_cypher is not None
+    if not cached:
+        generated_cypher = extract_cypher(
+            cypher_generation_chain.invoke(
+                {"question": question, "schema": prompt_schema(question)}
+            )
+        )
+    params = template.params if cached else {}
+    logging.info(f"{'Cached' if cached else 'Generated'} Cypher: {generated_cypher} {params}")
+    context = []
+    if generated_cypher:
+        if not cached:
+            # Cached queries passed the guard when they were stored
+            generated_cypher = cypher_guard.check(graph, generated_cypher, params).query
+        context = cypher_guard.execute(graph, generated_cypher, params)[:CYPHER_TOP_K]
+        if not cached:
+            cypher_cache.store(template, generated_cypher, graph_schema.fingerprint)
+    return cypher_qa_chain.invoke({"question": question, "context": context})
+
+
+async def aquery_generate(question: str) -> str:
+    template = cypher_cache.template(question)
+    generated_cypher = cypher_cache.lookup(template, graph_schema.fingerprint)
+    cached = generated_cypher is not None
+    if not cached:
+        generated_cypher = extract_cypher(
+            await cypher_generation_chain.ainvoke(
+                {"question": question, "schema": prompt_schema(question)}
+            )
+        )
+    params = template.params if cached else {}
+    logging.info(f"{'Cached' if cached else 'Generated'} Cypher: {generated_cypher} {params}")
+    context = []
+    if generated_cypher:
+        if not cached:
+            generated_cypher = (
+                await cypher_guard.acheck(async_graph, generated_cypher, params)
+            ).query
+        context = (
+            await cypher_guard.aexecute(async_graph, generated_cypher, params)
+        )[:CYPHER_TOP_K]
+        if not cached:
+            cypher_cache.store(template, generated_cypher, graph_schema.fingerprint)
+    return await cypher_qa_chain.ainvoke({"question": question, "context": context})
+
 
 def structured_retriever(question: str) -> str:
     """
     Collects the neighborhood of entities mentioned
-    in the question
+    in the question, from curated Cypher when the intent router recognises
+    the question and from generated Cypher otherwise
     """
-    response = query_generate(question)
+    response = intent_router.answer(question, graph)
+    if response is None:
+        response = query_generate(question)
     return response
 
-def retriever(input) -> str:
+
+async def astructured_retriever(question: str) -> str:
+    response = await intent_router.aanswer(question, async_graph)
+    if response is None:
+        response = await aquery_generate(question)
+    return response
+
+
+def unstructured_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    return format_docs(similarity_search(question, 5, filters, boosts))
+
+
+async def aunstructured_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    return format_docs(await asimilarity_search(question, 5, filters, boosts))
+
+
+def graph_expanded_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    documents, profiles = similarity_search_with_profiles(question, 5, filters, boosts)
+    return _combine_context(
+        format_docs(documents),
+        format_profiles(profiles, [doc.metadata["profileId"] for doc in documents]),
+    )
+
+
+async def agraph_expanded_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    documents, profiles = await asimilarity_search_with_profiles(question, 5, filters, boosts)
+    return _combine_context(
+        format_docs(documents),
+        format_profiles(profiles, [doc.metadata["profileId"] for doc in documents]),
+    )
+
+
+def _search_text(input) -> str:
     query = input.get("search_query")
-    if not isinstance(query, str):
-        query = query.content
-    documents = format_docs(vector_index.similarity_search(query, 5))
-    print(documents, "================================")
-    if input.get("question", {}).get("mode") == "basic_hybrid_search_node_neighborhood":
-        structured_data = structured_retriever(query)
-        if (structured_data != "I don't know the answer."):
-            documents = f"""Structured data:
+    # A condensed follow-up question arrives as the LLM message
+    return query if isinstance(query, str) else query.content
+
+
+def _requested_filters(input) -> RetrievalFilters:
+    requested = input.get("question", {}).get("filters") or {}
+    if isinstance(requested, RetrievalFilters):
+        return requested
+    return RetrievalFilters(**requested)
+
+
+def fact_card_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    return format_docs(fact_card_search(question, FACT_CARD_TOP_K, filters, boosts))
+
+
+async def afact_card_retriever(
+    question: str,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> str:
+    return format_docs(await afact_card_search(question, FACT_CARD_TOP_K, filters, boosts))
+
+
+# Modes whose whole context comes from one retrieval call
+SINGLE_BRANCH_MODES = {
+    GRAPH_EXPANDED_MODE: ("graph_expanded", graph_expanded_retriever, agraph_expanded_retriever),
+    FACT_CARD_MODE: ("fact_card", fact_card_retriever, afact_card_retriever),
+}
+
+
+def retrieval_filters(
+    input, query: str
+) -> Tuple[Optional[RetrievalFilters], Optional[RetrievalFilters]]:
+    """
+    Filters sent with the question, completed with filter values the
+    question itself mentions unambiguously, and the ambiguously mentioned
+    values as boosts
+    """
+    filters = _requested_filters(input)
+    boosts = RetrievalFilters()
+    if RETRIEVAL_FILTER_EXTRACTION and profile_catalog.ready:
+        extracted = profile_catalog.extract(query)
+        filters = filters.merge(extracted.filters)
+        # A field that is already filtered on needs no boost
+        boosts = RetrievalFilters(
+            **{
+                field: value
+                for field, value in extracted.boosts.dict().items()
+                if getattr(filters, field) is None
+            }
+        )
+    filters = None if filters.is_empty() else filters
+    boosts = None if boosts.is_empty() else boosts
+    if filters is not None or boosts is not None:
+        logging.info(
+            f"Retrieval filters: {(filters or RetrievalFilters()).dict(exclude_none=True)}, "
+            f"boosts: {(boosts or RetrievalFilters()).dict(exclude_none=True)}"
+        )
+    return filters, boosts
+
+
+class RetrievalReport:
+    """
+    What happened to one request's retrieval, so that an answer built from
+    partial or no context is not cached
+    """
+
+    def __init__(self):
+        self.dropped: List[str] = []
+        self.empty = False
+
+    @property
+    def complete(self) -> bool:
+        return not self.dropped and not self.empty
+
+
+def _branch_result(
+    name: str, future, started: float, timeout: float, report: Optional[RetrievalReport] = None
+):
+    """
+    Wait for a retrieval branch until `timeout` seconds after it started,
+    recording its latency. Returns None if it failed or timed out.
+    """
+    try:
+        result = future.result(timeout=max(started + timeout - time.perf_counter(), 0))
+    except TimeoutError:
+        retrieval_latency.record(name, timeout, "timeout")
+        logging.warning(f"{name} retrieval timed out after {timeout}s, dropping it")
+    except Exception:
+        retrieval_latency.record(name, time.perf_counter() - started, "error")
+        logging.exception(f"{name} retrieval failed, dropping it")
+    else:
+        retrieval_latency.record(name, time.perf_counter() - started)
+        return result
+    if report is not None:
+        report.dropped.append(name)
+    return None
+
+
+async def _abranch_result(
+    name: str, task, started: float, timeout: float, report: Optional[RetrievalReport] = None
+):
+    try:
+        result = await asyncio.wait_for(
+            task, max(started + timeout - time.perf_counter(), 0)
+        )
+    except asyncio.TimeoutError:
+        retrieval_latency.record(name, timeout, "timeout")
+        logging.warning(f"{name} retrieval timed out after {timeout}s, dropping it")
+    except Exception:
+        retrieval_latency.record(name, time.perf_counter() - started, "error")
+        logging.exception(f"{name} retrieval failed, dropping it")
+    else:
+        retrieval_latency.record(name, time.perf_counter() - started)
+        return result
+    if report is not None:
+        report.dropped.append(name)
+    return None
+
+
+def _finish_report(report: Optional[RetrievalReport], documents: str) -> str:
+    if report is not None:
+        report.empty = not documents.strip()
+    return documents
+
+
+def _combine_context(documents: str, structured_data) -> str:
+    if structured_data and structured_data != "I don't know the answer.":
+        documents = f"""Structured data:
             {structured_data}
             Unstructured data:
             {documents}"""
     return documents
 
 
+def retriever(input, report: Optional[RetrievalReport] = None) -> str:
+    query = _search_text(input)
+    started = time.perf_counter()
+    mode = input.get("question", {}).get("mode")
+    filters, boosts = retrieval_filters(input, query)
+    if mode in SINGLE_BRANCH_MODES:
+        name, retrieve, _ = SINGLE_BRANCH_MODES[mode]
+        documents = _branch_result(
+            name,
+            retrieval_executor.submit(retrieve, query, filters, boosts),
+            started,
+            VECTOR_RETRIEVAL_TIMEOUT,
+            report,
+        ) or ""
+        retrieval_latency.record("total", time.perf_counter() - started)
+        return _finish_report(report, documents)
+    unstructured = retrieval_executor.submit(unstructured_retriever, query, filters, boosts)
+    structured = None
+    if mode == NODE_NEIGHBORHOOD_MODE:
+        structured = retrieval_executor.submit(structured_retriever, query)
+
+    documents = _branch_result(
+        "unstructured", unstructured, started, VECTOR_RETRIEVAL_TIMEOUT, report
+    ) or ""
+    logging.debug(f"Unstructured context:\n{documents}")
+    if structured is not None:
+        documents = _combine_context(
+            documents,
+            _branch_result(
+                "structured", structured, started, STRUCTURED_RETRIEVAL_TIMEOUT, report
+            ),
+        )
+    retrieval_latency.record("total", time.perf_counter() - started)
+    return _finish_report(report, documents)
+
+
+async def aretriever(input, report: Optional[RetrievalReport] = None) -> str:
+    """
+    Async twin of `retriever` used by ainvoke/astream, where the branches are
+    tasks on the event loop and a timed-out branch is cancelled
+    """
+    query = _search_text(input)
+    started = time.perf_counter()
+    mode = input.get("question", {}).get("mode")
+    filters, boosts = retrieval_filters(input, query)
+    if mode in SINGLE_BRANCH_MODES:
+        name, _, aretrieve = SINGLE_BRANCH_MODES[mode]
+        documents = await _abranch_result(
+            name,
+            aretrieve(query, filters, boosts),
+            started,
+            VECTOR_RETRIEVAL_TIMEOUT,
+            report,
+        ) or ""
+        retrieval_latency.record("total", time.perf_counter() - started)
+        return _finish_report(report, documents)
+    unstructured = asyncio.ensure_future(aunstructured_retriever(query, filters, boosts))
+    structured = None
+    if mode == NODE_NEIGHBORHOOD_MODE:
+        structured = asyncio.ensure_future(astructured_retriever(query))
+    try:
+        documents = await _abranch_result(
+            "unstructured", unstructured, started, VECTOR_RETRIEVAL_TIMEOUT, report
+        ) or ""
+        if structured is not None:
+            documents = _combine_context(
+                documents,
+                await _abranch_result(
+                    "structured", structured, started, STRUCTURED_RETRIEVAL_TIMEOUT, report
+                ),
+            )
+    finally:
+        for task in (unstructured, structured):
+            if task is not None:
+                task.cancel()
+    retrieval_latency.record("total", time.perf_counter() - started)
+    return _finish_report(report, documents)
+
+
+def _retrieve_and_answer(report: Optional[RetrievalReport] = None):
+    return (
+        RunnableParallel(
+            {
+                "question": lambda x: x["question"],
+                "chat_history": lambda x: [],
+                "context": RunnableLambda(
+                    partial(retriever, report=report), afunc=partial(aretriever, report=report)
+                ).with_config(run_name="retriever"),
+            }
+        )
+        | answer_chain
+    )
+
+
+retrieve_and_answer = _retrieve_and_answer()
+
+
+def _cache_scope(input) -> str:
+    return json.dumps(
+        {
+            "mode": input["question"].get("mode"),
+            "filters": _requested_filters(input).dict(exclude_none=True),
+        },
+        sort_keys=True,
+    )
+
+
+def _cached_stream(hit: CacheHit):
+    def stream(_):
+        yield from answer_chunks(hit.answer)
+
+    async def astream(_):
+        for chunk in answer_chunks(hit.answer):
+            yield chunk
+
+    return RunnableLambda(stream, afunc=astream).with_config(run_name="CachedAnswer")
+
+
+def _storing(scope: str, question: str, vector, generation: int, report: RetrievalReport):
+    """
+    Passes the streamed answer through and caches it once complete, unless
+    its context was partial or empty
+    """
+
+    def store(answer: str) -> None:
+        if not report.complete:
+            logging.info(
+                f"Not caching the answer to {question!r}: "
+                f"{'dropped ' + ', '.join(report.dropped) if report.dropped else 'empty context'}"
+            )
+            return
+        answer_cache.store(scope, question, vector, answer, generation)
+
+    def transform(chunks):
+        answer = ""
+        for chunk in chunks:
+            answer += chunk
+            yield chunk
+        store(answer)
+
+    async def atransform(chunks):
+        answer = ""
+        async for chunk in chunks:
+            answer += chunk
+            yield chunk
+        store(answer)
+
+    return RunnableGenerator(transform, atransform).with_config(run_name="StoreAnswer")
+
+
+def _answer_route(input, question: str, vector, generation: int):
+    scope = _cache_scope(input)
+    hit = answer_cache.lookup(scope, vector)
+    if hit is not None:
+        logging.info(
+            f"Answer cache hit for {question!r} "
+            f"({hit.similarity:.3f} to {hit.question!r})"
+        )
+        return _cached_stream(hit)
+    # Filled in by this request's retrieval, read before storing its answer
+    report = RetrievalReport()
+    return _retrieve_and_answer(report) | _storing(scope, question, vector, generation, report)
+
+
+def cached_answer(input):
+    """
+    Answer from the semantic cache when a close enough standalone question
+    was answered in the same mode, otherwise retrieve, answer and cache
+    """
+    if not answer_cache.enabled:
+        return retrieve_and_answer
+    question = _search_text(input)
+    generation = answer_cache.generation
+    return _answer_route(input, question, embeddings.embed_query(question), generation)
+
+
+async def acached_answer(input):
+    if not answer_cache.enabled:
+        return retrieve_and_answer
+    question = _search_text(input)
+    generation = answer_cache.generation
+    vector = await embeddings.aembed_query(question)
+    return _answer_route(input, question, vector, generation)
+
+
 chain = (
     RunnableParallel(
         {
@@ -140,16 +597,7 @@ chain = (
             "search_query": _search_query,
         }
     )
-    | RunnableParallel(
-        {
-            "question": lambda x: x["question"],
-            "chat_history": lambda x: [],
-            "context": retriever,
-        }
-    )
-    | ANSWER_PROMPT
-    | llm
-    | StrOutputParser()
+    | RunnableLambda(cached_answer, afunc=acached_answer)
 )
 
 
@@ -157,6 +605,7 @@ chain = (
 class ChainInput(BaseModel):
     question: str
     mode: str
+    filters: Optional[RetrievalFilters] = None
 
 
 chain = chain.with_types(input_type=ChainInput)
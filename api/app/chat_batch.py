@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List
+
+from chat import ChainInput, answer_chain, aretriever
+from utils import embeddings
+
+CHAT_BATCH_CONCURRENCY = int(os.environ.get("CHAT_BATCH_CONCURRENCY", 8))
+CHAT_BATCH_RETRIEVAL_CONCURRENCY = int(os.environ.get("CHAT_BATCH_RETRIEVAL_CONCURRENCY", 32))
+# Largest answer concurrency a request may ask for
+CHAT_BATCH_MAX_CONCURRENCY = int(os.environ.get("CHAT_BATCH_MAX_CONCURRENCY", 32))
+
+
+def _key(input: ChainInput) -> str:
+    return json.dumps(input.dict(), sort_keys=True)
+
+
+async def _answer(input: ChainInput, retrieval_slots, answer_slots) -> Dict:
+    """
+    Retrieval and answer for one distinct input, the same steps the /chat
+    chain runs for a question without chat history
+    """
+    payload = input.dict()
+    started = time.perf_counter()
+    async with retrieval_slots:
+        retrieval_started = time.perf_counter()
+        context = await aretriever({"search_query": input.question, "question": payload})
+        retrieval_seconds = time.perf_counter() - retrieval_started
+    async with answer_slots:
+        answer_started = time.perf_counter()
+        answer = await answer_chain.ainvoke(
+            {"question": payload, "chat_history": [], "context": context}
+        )
+        answer_seconds = time.perf_counter() - answer_started
+    return {
+        "answer": answer,
+        "retrievalSeconds": round(retrieval_seconds, 3),
+        "answerSeconds": round(answer_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def _run(rows: List[int], input: ChainInput, retrieval_slots, answer_slots):
+    try:
+        return rows, input, await _answer(input, retrieval_slots, answer_slots)
+    except Exception as e:
+        logging.exception(f"Batch chat input {rows[0]} failed")
+        return rows, input, {"error": f"{type(e).__name__}: {e}"}
+
+
+async def answer_batch(
+    inputs: List[ChainInput],
+    concurrency: int = CHAT_BATCH_CONCURRENCY,
+    retrieval_concurrency: int = CHAT_BATCH_RETRIEVAL_CONCURRENCY,
+) -> AsyncIterator[Dict]:
+    """
+    Answer many chat inputs, yielding one result per input in completion
+    order. Identical inputs are answered once, all distinct questions are
+    embedded in a single request up front (later lookups hit the embedding
+    cache), and at most `concurrency` answer LLM calls run at a time.
+    """
+    if concurrency < 1 or retrieval_concurrency < 1:
+        raise ValueError("Batch concurrency must be at least 1")
+    groups: Dict[str, List[int]] = {}
+    for i, input in enumerate(inputs):
+        groups.setdefault(_key(input), []).append(i)
+
+    questions = list(dict.fromkeys(input.question for input in inputs))
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(embeddings.embed_documents, questions)
+    except Exception:
+        # Retrieval embeds each question itself if the batch request failed
+        logging.exception("Batch question embedding failed")
+    logging.info(
+        f"Embedded {len(questions)} distinct questions for a batch of {len(inputs)} "
+        f"in {time.perf_counter() - start:.2f}s."
+    )
+
+    retrieval_slots = asyncio.Semaphore(retrieval_concurrency)
+    answer_slots = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.ensure_future(_run(rows, inputs[rows[0]], retrieval_slots, answer_slots))
+        for rows in groups.values()
+    ]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            rows, input, result = await completed
+            for i in rows:
+                yield {"index": i, "question": input.question, "mode": input.mode, **result}
+    finally:
+        # The client went away or the caller stopped iterating
+        for task in tasks:
+            task.cancel()
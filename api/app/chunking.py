@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from convert import process_json_element
+from langchain_text_splitters import TokenTextSplitter
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", os.cpu_count() or 1))
+CHUNK_POOL_CHUNKSIZE = int(os.environ.get("CHUNK_POOL_CHUNKSIZE", 8))
+# Below this many articles the pool overhead outweighs the parallelism
+CHUNK_PARALLEL_THRESHOLD = int(os.environ.get("CHUNK_PARALLEL_THRESHOLD", 32))
+
+
+def make_text_splitter() -> TokenTextSplitter:
+    return TokenTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+_text_splitter: Optional[TokenTextSplitter] = None
+
+
+class RenderedArticle(NamedTuple):
+    text: str
+    chunks: List[str]
+    # Measured in the worker, so they add up to CPU time rather than wall time
+    render_seconds: float
+    chunk_seconds: float
+
+
+def render_and_split(article: Dict) -> RenderedArticle:
+    """
+    Render an article to text and split it into token chunks
+    """
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = make_text_splitter()
+    start = time.perf_counter()
+    # Delta imports render the text up front to fingerprint it
+    text = article.get("text") or process_json_element(article)
+    rendered = time.perf_counter()
+    chunks = _text_splitter.split_text(text)
+    return RenderedArticle(
+        text, chunks, rendered - start, time.perf_counter() - rendered
+    )
+
+
+def render_article(article: Dict) -> RenderedArticle:
+    """
+    Render an article to text without splitting it, for delta imports to
+    fingerprint
+    """
+    start = time.perf_counter()
+    text = process_json_element(article)
+    return RenderedArticle(text, [], time.perf_counter() - start, 0.0)
+
+
+class ChunkingPool:
+    """
+    Fans rendering and tokenization out over a process pool, returning
+    results in input order. Small inputs are handled in-process.
+    """
+
+    def __init__(
+        self,
+        workers: int = CHUNK_WORKERS,
+        chunksize: int = CHUNK_POOL_CHUNKSIZE,
+        parallel_threshold: int = CHUNK_PARALLEL_THRESHOLD,
+    ):
+        self.workers = workers
+        self.chunksize = chunksize
+        self.parallel_threshold = parallel_threshold
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def map(self, articles: List[Dict]) -> List[RenderedArticle]:
+        return self._map(render_and_split, articles)
+
+    def render(self, articles: List[Dict]) -> List[RenderedArticle]:
+        """
+        Rendered text only, without chunks
+        """
+        return self._map(render_article, articles)
+
+    def _map(
+        self, function: Callable[[Dict], RenderedArticle], articles: List[Dict]
+    ) -> List[RenderedArticle]:
+        if self.workers <= 1 or len(articles) < self.parallel_threshold:
+            return [function(article) for article in articles]
+        if self.executor is None:
+            # Spawned workers only import this module, never the Neo4j/OpenAI clients
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return list(
+            self.executor.map(function, articles, chunksize=self.chunksize)
+        )
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,104 @@
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+
+CONTEXT_MODEL = "gpt-4o-mini"
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 2000))
+# Shorter suffix/prefix matches between chunks are treated as coincidence
+MIN_OVERLAP_CHARS = 16
+# Upper bound on the splitter overlap in characters (50 tokens)
+MAX_OVERLAP_CHARS = 1000
+# A profile cut shorter than this is dropped rather than sent as a stub
+MIN_TRIMMED_TOKENS = 32
+GAP = " … "
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = CONTEXT_MODEL) -> tiktoken.Encoding:
+    """
+    tiktoken encoders are expensive to build, so one is kept per model
+    """
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text: str, model: str = CONTEXT_MODEL) -> int:
+    return len(get_encoder(model).encode(text))
+
+
+def _position(doc: Document) -> Optional[int]:
+    # Chunk ids are "<profile id>-<chunk number>"
+    try:
+        return int(str(doc.metadata["id"]).rsplit("-", 1)[1])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _overlap(previous: str, following: str) -> int:
+    """
+    Length of the longest suffix of `previous` that starts `following`
+    """
+    head = following[:MAX_OVERLAP_CHARS]
+    for start in range(max(len(previous) - len(head), 0), len(previous) - MIN_OVERLAP_CHARS + 1):
+        if head.startswith(previous[start:]):
+            return len(previous) - start
+    return 0
+
+
+def _merge_profile(docs: List[Document]) -> str:
+    """
+    Join one profile's chunks in chunk order, dropping the text adjacent
+    chunks share and marking gaps between non-adjacent ones
+    """
+    docs = sorted(docs, key=lambda doc: _position(doc) or 0)
+    text, last = "", None
+    for doc in docs:
+        position = _position(doc)
+        content = doc.page_content
+        if not text:
+            text = content
+        elif position is not None and last is not None and position == last + 1:
+            text += content[_overlap(text, content):]
+        else:
+            text += GAP + content
+        last = position
+    return text
+
+
+def pack_context(
+    docs: List[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    model: str = CONTEXT_MODEL,
+) -> str:
+    """
+    Assemble retrieved chunks into prompt context: duplicates removed,
+    chunks grouped by JobProfile (best-ranked profile first) and merged in
+    chunk order, and the result cut to `token_budget` tokens of `model`.
+    """
+    groups: Dict[str, List[Document]] = {}
+    seen = set()
+    for doc in docs:
+        key = doc.metadata.get("id") or doc.page_content
+        if key in seen:
+            continue
+        seen.add(key)
+        profile = doc.metadata.get("profileId") or f"chunk:{key}"
+        groups.setdefault(profile, []).append(doc)
+
+    encoder = get_encoder(model)
+    separator_tokens = len(encoder.encode("\n\n"))
+    sections, remaining = [], token_budget
+    for profile_docs in groups.values():
+        tokens = encoder.encode(_merge_profile(profile_docs))
+        cost = len(tokens) + (separator_tokens if sections else 0)
+        if cost <= remaining:
+            sections.append(encoder.decode(tokens))
+            remaining -= cost
+            continue
+        room = remaining - (separator_tokens if sections else 0)
+        if room >= MIN_TRIMMED_TOKENS:
+            sections.append(encoder.decode(tokens[:room]))
+        break
+    return "\n\n".join(sections)
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from retrieval_filters import MentionIndex, mention_phrases, normalize_text
+
+CYPHER_CACHE_ENABLED = os.environ.get("CYPHER_CACHE_ENABLED", "true").lower() == "true"
+CYPHER_CACHE_MAX_ENTRIES = int(os.environ.get("CYPHER_CACHE_MAX_ENTRIES", 500))
+
+# Entities swapped for placeholders, in the order their parameters are named
+TEMPLATE_FIELDS = ("jobRole", "sector", "geographicOption")
+
+# Generated Cypher that writes is never cached
+_write_clause = re.compile(
+    r"\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|LOAD\s+CSV)\b", re.IGNORECASE
+)
+
+
+class QuestionTemplate(NamedTuple):
+    # Normalized question with entities replaced by {placeholders}
+    key: str
+    # Placeholder name to database value
+    params: Dict[str, str]
+
+
+class CypherTemplateCache:
+    """
+    Generated Cypher keyed by the shape of the question. Job roles, sectors
+    and geographic options in the question become placeholders, and the
+    matching string literals in the generated Cypher become parameters, so
+    "salary of a Data Entry Clerk in big cities" and "salary of a Nurse in
+    metros" share one query. Only queries that ran without error are kept,
+    the least recently used one is evicted when full and everything is
+    dropped when the graph schema changes.
+    """
+
+    def __init__(
+        self,
+        catalog=None,
+        max_entries: int = CYPHER_CACHE_MAX_ENTRIES,
+        enabled: bool = CYPHER_CACHE_ENABLED,
+    ):
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.schema_version: Optional[str] = None
+        self.vocabulary = MentionIndex()
+        self._profiles = None
+        self.counts = {
+            "hits": 0, "misses": 0, "stores": 0, "uncacheable": 0,
+            "evictions": 0, "invalidations": 0,
+        }
+
+    def _vocabulary(self) -> MentionIndex:
+        # Rebuilt whenever the catalog reloads its profiles
+        profiles = self.catalog.profiles if self.catalog is not None else {}
+        if profiles is self._profiles:
+            return self.vocabulary
+        phrases = []
+        for field in TEMPLATE_FIELDS:
+            values = {
+                value
+                for row in profiles.values()
+                for value in (
+                    row["geographicOptions"] if field == "geographicOption"
+                    else [row.get(field)]
+                )
+                if value
+            }
+            phrases.extend(mention_phrases(field, values))
+        self.vocabulary, self._profiles = MentionIndex(phrases), profiles
+        return self.vocabulary
+
+    def template(self, question: str) -> QuestionTemplate:
+        text = normalize_text(question)
+        mentions = self._vocabulary().find(text)
+        params: Dict[str, str] = {}
+        names: Dict = {}
+        parts, last = [], 0
+        for start, stop, field, value in mentions:
+            if (field, value) not in names:
+                count = sum(1 for known in names if known[0] == field)
+                names[(field, value)] = field if not count else f"{field}{count + 1}"
+                params[names[(field, value)]] = value
+            parts.extend([text[last:start], "{" + names[(field, value)] + "}"])
+            last = stop
+        parts.append(text[last:])
+        return QuestionTemplate(" ".join("".join(parts).split()), params)
+
+    @staticmethod
+    def parameterize(query: str, template: QuestionTemplate) -> Optional[str]:
+        """
+        The query with each entity's string literal replaced by its parameter,
+        or None when the query cannot be reused for other entities
+        """
+        if not query or _write_clause.search(query):
+            return None
+        for name, value in template.params.items():
+            literal = re.compile(r"(['\"])" + re.escape(value) + r"\1")
+            query, replaced = literal.subn("$" + name, query)
+            if not replaced:
+                # The entity is matched some other way, e.g. with CONTAINS
+                return None
+        return query
+
+    def _check_schema(self, schema: str) -> None:
+        # Callers hold the lock
+        version = hashlib.sha1(schema.encode()).hexdigest()
+        if version != self.schema_version:
+            if self.schema_version is not None:
+                self._clear()
+                logging.info("Graph schema changed, dropped cached Cypher.")
+            self.schema_version = version
+
+    def _clear(self) -> None:
+        self.entries.clear()
+        self.counts["invalidations"] += 1
+
+    def lookup(self, template: QuestionTemplate, schema: str) -> Optional[str]:
+        """
+        Parameterized Cypher for the question shape; run it with
+        `template.params`
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            self._check_schema(schema)
+            query = self.entries.get(template.key)
+            if query is None:
+                self.counts["misses"] += 1
+                return None
+            self.entries.move_to_end(template.key)
+            self.counts["hits"] += 1
+            return query
+
+    def store(self, template: QuestionTemplate, query: str, schema: str) -> None:
+        """
+        Keep Cypher generated for the question, after it ran without error
+        """
+        if not self.enabled:
+            return
+        query = self.parameterize(query, template)
+        with self.lock:
+            if query is None:
+                self.counts["uncacheable"] += 1
+                return
+            self._check_schema(schema)
+            self.entries[template.key] = query
+            self.entries.move_to_end(template.key)
+            self.counts["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "maxEntries": self.max_entries,
+                "schemaVersion": self.schema_version,
+                **self.counts,
+                "hitRate": round(self.counts["hits"] / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,222 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from neo4j import Query
+from neo4j.exceptions import CypherSyntaxError
+
+# Largest number of rows any plan operator may be estimated to produce
+CYPHER_GUARD_MAX_ROWS = float(os.environ.get("CYPHER_GUARD_MAX_ROWS", 1_000_000))
+# Lower bound for cartesian products, all-node scans and unbounded expands
+CYPHER_GUARD_MAX_FLAGGED_ROWS = float(os.environ.get("CYPHER_GUARD_MAX_FLAGGED_ROWS", 100_000))
+CYPHER_GUARD_ROW_LIMIT = int(os.environ.get("CYPHER_GUARD_ROW_LIMIT", 100))
+# Upper bound given to variable-length patterns that have none
+CYPHER_GUARD_MAX_HOPS = int(os.environ.get("CYPHER_GUARD_MAX_HOPS", 4))
+CYPHER_GUARD_TIMEOUT = float(os.environ.get("CYPHER_GUARD_TIMEOUT", 10))
+
+FLAGGED_OPERATORS = ("CartesianProduct", "AllNodesScan")
+
+# `*`, `*2..`, `*..` and `*1..3` in a relationship pattern
+_var_length = re.compile(r"\*\s*(\d*)\s*(\.\.\s*(\d*))?(?=\s*[\]{])")
+_trailing_limit = re.compile(r"\bLIMIT\s+(\S+)\s*$", re.IGNORECASE)
+
+
+class CypherRejected(ValueError):
+    pass
+
+
+class GuardDecision(NamedTuple):
+    query: str
+    estimated_rows: float
+    flags: List[str]
+    rewrites: List[str]
+
+
+def _unbounded(match: "re.Match") -> bool:
+    # `*3` is an exact length, `*..3` and `*1..3` have an upper bound
+    return (match.group(2) is None and not match.group(1)) or (
+        match.group(2) is not None and not match.group(3)
+    )
+
+
+def _operators(plan: Dict) -> List[Tuple[str, float, str]]:
+    """
+    (operator, estimated rows, details) for every operator of an EXPLAIN plan
+    """
+    arguments = plan.get("args", {})
+    operators = [
+        (
+            plan["operatorType"].split("@")[0],
+            float(arguments.get("EstimatedRows", 0)),
+            str(arguments.get("Details", "")),
+        )
+    ]
+    for child in plan.get("children", []):
+        operators.extend(_operators(child))
+    return operators
+
+
+class CypherGuard:
+    """
+    Checks LLM-generated Cypher before it runs. Unbounded variable-length
+    patterns get an upper bound and results a LIMIT; the rewritten query is
+    then EXPLAINed and rejected if it writes, if any operator is estimated to
+    produce more than `max_rows` rows, or if a cartesian product, all-node
+    scan or unbounded expand is estimated above `max_flagged_rows`. Queries
+    that pass run with a transaction timeout.
+    """
+
+    def __init__(
+        self,
+        max_rows: float = CYPHER_GUARD_MAX_ROWS,
+        max_flagged_rows: float = CYPHER_GUARD_MAX_FLAGGED_ROWS,
+        row_limit: int = CYPHER_GUARD_ROW_LIMIT,
+        max_hops: int = CYPHER_GUARD_MAX_HOPS,
+        timeout: float = CYPHER_GUARD_TIMEOUT,
+    ):
+        self.max_rows = max_rows
+        self.max_flagged_rows = max_flagged_rows
+        self.row_limit = row_limit
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.counts = {"run": 0, "rewritten": 0, "rejected": 0}
+
+    def rewrite(self, query: str, limit: bool = True) -> Tuple[str, List[str]]:
+        rewrites = []
+
+        def bound(match: "re.Match") -> str:
+            if not _unbounded(match):
+                return match.group(0)
+            lower = match.group(1)
+            upper = max(self.max_hops, int(lower or 0))
+            rewrites.append(f"capped {match.group(0).strip()} at {upper} hops")
+            return f"*{lower}..{upper}"
+
+        query = _var_length.sub(bound, query.strip().rstrip(";").strip())
+        if not limit:
+            return query, rewrites
+        limit = _trailing_limit.search(query)
+        if re.search(r"\bUNION\b", query, re.IGNORECASE) or (
+            limit and not limit.group(1).isdigit()
+        ):
+            # A trailing LIMIT would only apply to the last part of a UNION
+            query = f"CALL {{\n{query}\n}}\nRETURN * LIMIT {self.row_limit}"
+            rewrites.append(f"wrapped with LIMIT {self.row_limit}")
+        elif limit is None:
+            query = f"{query}\nLIMIT {self.row_limit}"
+            rewrites.append(f"added LIMIT {self.row_limit}")
+        elif int(limit.group(1)) > self.row_limit:
+            query = query[: limit.start()] + f"LIMIT {self.row_limit}"
+            rewrites.append(f"lowered LIMIT {limit.group(1)} to {self.row_limit}")
+        return query, rewrites
+
+    def _count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def decide(
+        self, query: str, rewrites: List[str], plan: Optional[Dict], query_type: str
+    ) -> GuardDecision:
+        operators = _operators(plan) if plan else []
+        estimated_rows = max((rows for _, rows, _ in operators), default=0.0)
+        flagged = [
+            (operator, rows)
+            for operator, rows, details in operators
+            if operator in FLAGGED_OPERATORS
+            or (
+                operator.startswith("VarLengthExpand")
+                and any(_unbounded(match) for match in _var_length.finditer(details))
+            )
+        ]
+        flags = [f"{operator} (~{rows:.0f} rows)" for operator, rows in flagged]
+        reasons = []
+        if query_type != "r":
+            reasons.append(f"query type '{query_type}' is not read-only")
+        if estimated_rows > self.max_rows:
+            reasons.append(f"estimated {estimated_rows:.0f} rows exceeds {self.max_rows:.0f}")
+        expensive = [flag for flag, (_, rows) in zip(flags, flagged) if rows > self.max_flagged_rows]
+        if expensive:
+            reasons.append(
+                f"{', '.join(expensive)} estimated above {self.max_flagged_rows:.0f} rows"
+            )
+        decision = GuardDecision(query, estimated_rows, flags, rewrites)
+        if reasons:
+            self._count("rejected")
+            logging.warning(
+                f"Cypher guard rejected query (estimated {estimated_rows:.0f} rows, "
+                f"flags {flags}): {'; '.join(reasons)}\n{query}"
+            )
+            raise CypherRejected(
+                "The generated Cypher query was rejected as too expensive or unsafe: "
+                + "; ".join(reasons)
+            )
+        self._count("run")
+        if rewrites:
+            self._count("rewritten")
+        logging.info(
+            f"Cypher guard accepted query (estimated {estimated_rows:.0f} rows, "
+            f"flags {flags}, rewrites {rewrites})\n{query}"
+        )
+        return decision
+
+    def check(self, graph, query: str, params: Optional[Dict] = None) -> GuardDecision:
+        """
+        The rewritten query if its plan is acceptable; raises CypherRejected
+        otherwise
+        """
+        rewritten, rewrites = self.rewrite(query)
+        with graph._driver.session(database=graph._database) as session:
+            try:
+                summary = session.run("EXPLAIN " + rewritten, params or {}).consume()
+            except CypherSyntaxError:
+                # The LIMIT did not fit the query, e.g. one without a RETURN
+                unlimited, unlimited_rewrites = self.rewrite(query, limit=False)
+                if unlimited == rewritten:
+                    raise
+                rewritten, rewrites = unlimited, unlimited_rewrites
+                summary = session.run("EXPLAIN " + rewritten, params or {}).consume()
+        return self.decide(rewritten, rewrites, summary.plan, summary.query_type)
+
+    async def acheck(self, async_graph, query: str, params: Optional[Dict] = None) -> GuardDecision:
+        rewritten, rewrites = self.rewrite(query)
+        try:
+            plan, query_type = await async_graph.explain(rewritten, params)
+        except CypherSyntaxError:
+            unlimited, unlimited_rewrites = self.rewrite(query, limit=False)
+            if unlimited == rewritten:
+                raise
+            rewritten, rewrites = unlimited, unlimited_rewrites
+            plan, query_type = await async_graph.explain(rewritten, params)
+        return self.decide(rewritten, rewrites, plan, query_type)
+
+    def execute(self, graph, query: str, params: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """
+        Run an accepted query with the guard's transaction timeout
+        """
+        with graph._driver.session(database=graph._database) as session:
+            try:
+                result = session.run(Query(text=query, timeout=self.timeout), params or {})
+                return [record.data() for record in result]
+            except CypherSyntaxError as e:
+                raise ValueError(f"Generated Cypher Statement is not valid\n{e}")
+
+    async def aexecute(
+        self, async_graph, query: str, params: Optional[Dict] = None
+    ) -> List[Dict[str, Any]]:
+        return await async_graph.query(query, params, timeout=self.timeout)
+
+    def run(self, graph, query: str, params: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        return self.execute(graph, self.check(graph, query, params).query, params)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "maxRows": self.max_rows,
+                "maxFlaggedRows": self.max_flagged_rows,
+                "rowLimit": self.row_limit,
+                "timeout": self.timeout,
+                **self.counts,
+            }
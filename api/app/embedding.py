@@ -0,0 +1,100 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+from streaming import batched
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 256))
+EMBEDDING_MAX_WORKERS = int(os.environ.get("EMBEDDING_MAX_WORKERS", 4))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", 5))
+EMBEDDING_BACKOFF_SECONDS = float(os.environ.get("EMBEDDING_BACKOFF_SECONDS", 1.0))
+
+
+class EmbeddingJob:
+    """
+    Handle for a set of embedding batches that are in flight
+    """
+
+    def __init__(self, futures: List[Future]):
+        self.futures = futures
+
+    def result(self) -> np.ndarray:
+        """
+        All vectors as one contiguous float32 matrix, in input order
+        """
+        if not self.futures:
+            return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        return np.concatenate([future.result() for future in self.futures])
+
+    def cancel(self) -> None:
+        for future in self.futures:
+            future.cancel()
+
+
+class EmbeddingStage:
+    """
+    Embeds texts in fixed-size batches on a bounded thread pool, retrying each
+    batch with exponential backoff. `embeddings` can be any object exposing
+    `embed_documents`, e.g. `OpenAIEmbeddings` or a fake in tests. Vectors are
+    kept as float32 arrays rather than lists of Python floats.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_workers: int = EMBEDDING_MAX_WORKERS,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_seconds: float = EMBEDDING_BACKOFF_SECONDS,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="embedding"
+        )
+
+    def submit(self, texts: List[str]) -> EmbeddingJob:
+        """
+        Schedule `texts` for embedding and return immediately; the vectors are
+        returned in input order by `EmbeddingJob.result()`
+        """
+        return EmbeddingJob(
+            [
+                self.executor.submit(self._embed_batch, batch)
+                for batch in batched(texts, self.batch_size)
+            ]
+        )
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        embed_array = getattr(self.embeddings, "embed_documents_array", None)
+        attempt = 0
+        while True:
+            try:
+                if embed_array is not None:
+                    return embed_array(texts)
+                return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = self.backoff_seconds * 2 ** (attempt - 1)
+                delay += random.uniform(0, self.backoff_seconds)
+                logging.warning(
+                    f"Embedding batch of {len(texts)} failed ({e}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "cache/embeddings")
+EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 250_000)
+)
+# Share of the cache freed at once when it is full, so eviction is amortised
+EVICTION_FRACTION = 0.05
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embedding vectors.
+
+    Vectors live in a memory-mapped float32 matrix with one row per slot and
+    SQLite maps the hash of each text to its slot. One cache file pair exists
+    per (model, dimensions), so entries are effectively keyed by
+    (model, dimensions, sha256(text)). When full, the least recently used
+    entries are evicted.
+
+    Several processes (e.g. server workers) may share the files: slots are
+    taken from a free list inside an IMMEDIATE transaction, evicted slots are
+    only reused once the eviction committed, and lookups read the matrix
+    inside a read transaction so an eviction waits for them.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        dimensions: int,
+        directory: str = EMBEDDING_CACHE_DIR,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", f"{model}-{dimensions}")
+        # Transactions are begun explicitly, see _transaction
+        self.db = sqlite3.connect(
+            os.path.join(directory, f"{name}.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        matrix_path = os.path.join(directory, f"{name}.f32")
+        shape = (max_entries, dimensions)
+        with self._transaction("IMMEDIATE"):
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+            )
+            seeded = self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'free_slots'"
+            ).fetchone()
+            if not seeded:
+                self.db.execute("CREATE TABLE free_slots (slot INTEGER PRIMARY KEY)")
+                used = {slot for (slot,) in self.db.execute("SELECT slot FROM embeddings")}
+                self.db.executemany(
+                    "INSERT INTO free_slots (slot) VALUES (?)",
+                    ((slot,) for slot in range(max_entries) if slot not in used),
+                )
+            if os.path.exists(matrix_path):
+                self.matrix = np.memmap(matrix_path, dtype=np.float32, mode="r+")
+                if self.matrix.size != max_entries * dimensions:
+                    raise ValueError(
+                        f"Embedding cache {matrix_path} does not match "
+                        f"max_entries={max_entries}, dimensions={dimensions}"
+                    )
+                self.matrix = self.matrix.reshape(shape)
+            else:
+                self.matrix = np.memmap(matrix_path, dtype=np.float32, mode="w+", shape=shape)
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _transaction(self, mode: str = "DEFERRED") -> Iterator[None]:
+        self.db.execute(f"BEGIN {mode}")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _slots(self, keys: List[str]) -> Dict[str, int]:
+        slots: Dict[str, int] = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            slots.update(
+                self.db.execute(
+                    "SELECT key, slot FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+            )
+        return slots
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.key(text) for text in texts]
+        with self.lock:
+            # Evictions cannot commit, and so slots cannot be overwritten,
+            # while the vectors are copied out
+            with self._transaction():
+                slots = self._slots(keys)
+                vectors = [
+                    np.array(self.matrix[slots[key]]) if key in slots else None
+                    for key in keys
+                ]
+            if slots:
+                now = time.time()
+                with self._transaction("IMMEDIATE"):
+                    self.db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in slots],
+                    )
+            found = sum(vector is not None for vector in vectors)
+            self.hits += found
+            self.misses += len(keys) - found
+        return vectors
+
+    def _take_slots(self, count: int) -> List[int]:
+        slots = [
+            slot
+            for (slot,) in self.db.execute("SELECT slot FROM free_slots LIMIT ?", (count,))
+        ]
+        self.db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots])
+        return slots
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        entries = dict(zip((self.key(text) for text in texts), vectors))
+        with self.lock:
+            with self._transaction("IMMEDIATE"):
+                needed = len(entries) - len(self._slots(list(entries)))
+                free = self.db.execute("SELECT COUNT(*) FROM free_slots").fetchone()[0]
+                if needed > free:
+                    self._evict(min(needed, self.max_entries) - free)
+            with self._transaction("IMMEDIATE"):
+                existing = self._slots(list(entries))
+                new = [(key, vector) for key, vector in entries.items() if key not in existing]
+                if len(new) > self.max_entries:
+                    new = new[-self.max_entries :]
+                # Another process may have used up freed slots; the rest of
+                # the entries are simply not cached
+                slots = self._take_slots(len(new))
+                now = time.time()
+                rows = []
+                for (key, vector), slot in zip(new, slots):
+                    self.matrix[slot] = vector
+                    rows.append((key, slot, now))
+                # Vectors hit the disk before their keys become visible
+                self.matrix.flush()
+                self.db.executemany(
+                    "INSERT INTO embeddings (key, slot, last_used) VALUES (?, ?, ?)", rows
+                )
+
+    def _evict(self, needed: int) -> None:
+        count = max(needed, int(self.max_entries * EVICTION_FRACTION))
+        evicted = self.db.execute(
+            "SELECT key, slot FROM embeddings ORDER BY last_used LIMIT ?", (count,)
+        ).fetchall()
+        self.db.executemany(
+            "DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in evicted]
+        )
+        self.db.executemany(
+            "INSERT INTO free_slots (slot) VALUES (?)", [(slot,) for _, slot in evicted]
+        )
+        logging.info(f"Evicted {len(evicted)} entries from the embedding cache.")
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            size = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": size,
+                "max_entries": self.max_entries,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends cache misses to the wrapped model
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        cached = self.cache.get_many(texts)
+        vectors = np.empty((len(texts), self.cache.dimensions), dtype=np.float32)
+        missing = {}
+        for i, (text, vector) in enumerate(zip(texts, cached)):
+            if vector is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                vectors[i] = vector
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing))
+            self.cache.put_many(list(missing), computed)
+            for rows, vector in zip(missing.values(), computed):
+                vectors[rows] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many([text])[0]
+        if cached is not None:
+            return cached.tolist()
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many([text], [vector])
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # SQLite and the memory map block, and may wait on another process
+        cached = (await asyncio.to_thread(self.cache.get_many, [text]))[0]
+        if cached is not None:
+            return cached.tolist()
+        vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self.cache.put_many, [text], [vector])
+        return vector
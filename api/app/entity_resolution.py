@@ -0,0 +1,268 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+
+from migrations import ENTITY_NAME_PROPERTIES, entity_index_name
+
+# Similarity (1 - edit distance / length) needed to map a name on its own
+ENTITY_MATCH_THRESHOLD = float(os.environ.get("ENTITY_MATCH_THRESHOLD", 0.8))
+# Lower bar for the options offered when a name is ambiguous
+ENTITY_CANDIDATE_THRESHOLD = float(os.environ.get("ENTITY_CANDIDATE_THRESHOLD", 0.5))
+# Names sharing the most trigrams that are compared by edit distance
+ENTITY_SHORTLIST = int(os.environ.get("ENTITY_SHORTLIST", 20))
+
+names_query = "\nUNION\n".join(
+    f"MATCH (n:{label}) WHERE n.{prop} IS NOT NULL RETURN '{label}' AS label, n.{prop} AS name"
+    for label, prop in ENTITY_NAME_PROPERTIES.items()
+)
+
+# One round trip for all names the in-memory index could not resolve
+fallback_query = f"""
+UNWIND $entities AS entity
+CALL {{
+    WITH entity
+    CALL db.index.fulltext.queryNodes('{entity_index_name}', entity.query, {{limit: 1}})
+    YIELD node
+    RETURN coalesce({', '.join(sorted({f'node.{prop}' for prop in ENTITY_NAME_PROPERTIES.values()}))}) AS result
+}}
+RETURN entity.name AS name, result
+"""
+
+
+def generate_full_text_query(input: str) -> str:
+    """
+    Generate a full-text search query for a given input string.
+
+    This function constructs a query string suitable for a full-text search.
+    It processes the input string by splitting it into words and appending a
+    similarity threshold (~2 changed characters) to each word, then combines
+    them using the AND operator. Useful for mapping entities from user questions
+    to database values, and allows for some misspelings.
+    """
+    full_text_query = ""
+    words = [el for el in remove_lucene_chars(input).split() if el]
+    for word in words[:-1]:
+        full_text_query += f" {word}~2 AND"
+    full_text_query += f" {words[-1]}~2"
+    return full_text_query.strip()
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9&+#]+", " ", text.lower()).split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, bound: int) -> int:
+    """
+    Levenshtein distance, or `bound + 1` once it is known to exceed `bound`.
+    Only the cells within `bound` of the diagonal are computed.
+    """
+    over = bound + 1
+    if abs(len(a) - len(b)) > bound:
+        return over
+    previous = [j if j <= bound else over for j in range(len(b) + 1)]
+    for i, char in enumerate(a, 1):
+        current = [i if i <= bound else over] + [over] * len(b)
+        best = current[0]
+        for j in range(max(1, i - bound), min(len(b), i + bound) + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > bound:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class EntityMatch(NamedTuple):
+    name: str
+    label: str
+    score: float
+
+
+class EntityResolver:
+    """
+    Canonical entity names (job roles, employers, career pathways and
+    ratings attributes) in a trigram index kept in memory. A name is
+    shortlisted by shared trigrams and scored by edit distance, so small
+    misspellings and plurals resolve without a database round trip. Names
+    the index cannot place go to the `entity` fulltext index in one batched
+    query.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ENTITY_MATCH_THRESHOLD,
+        candidate_threshold: float = ENTITY_CANDIDATE_THRESHOLD,
+        shortlist: int = ENTITY_SHORTLIST,
+    ):
+        self.threshold = threshold
+        self.candidate_threshold = candidate_threshold
+        self.shortlist = shortlist
+        self.entries: List[EntityMatch] = []
+        self.keys: List[str] = []
+        self.gram_counts: List[int] = []
+        self.exact: Dict[str, List[int]] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.lock = threading.Lock()
+        self.counts = {"resolved": 0, "fallback": 0, "unresolved": 0}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.entries)
+
+    def refresh(self, graph) -> None:
+        rows = graph.query(names_query)
+        entries, keys, gram_counts = [], [], []
+        exact: Dict[str, List[int]] = defaultdict(list)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for row in rows:
+            key = _normalize(row["name"])
+            if not key:
+                continue
+            id = len(entries)
+            entries.append(EntityMatch(row["name"], row["label"], 1.0))
+            keys.append(key)
+            exact[key].append(id)
+            grams = _trigrams(key)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(id)
+        # Swapped in whole so lookups never see a half-built index
+        self.entries, self.keys, self.gram_counts, self.exact, self.postings = (
+            entries, keys, gram_counts, dict(exact), dict(postings)
+        )
+        logging.info(f"Loaded {len(entries)} entity names for resolution.")
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self.lock:
+            self.counts[key] += value
+
+    def search(
+        self, name: str, threshold: float, labels: Optional[Sequence[str]] = None
+    ) -> List[EntityMatch]:
+        """
+        Known names similar to `name`, best first
+        """
+        entries, keys = self.entries, self.keys
+        key = _normalize(name)
+        if not key:
+            return []
+        exact = [
+            entries[id] for id in self.exact.get(key, [])
+            if labels is None or entries[id].label in labels
+        ]
+        if exact:
+            return exact
+        grams = _trigrams(key)
+        shared = Counter(
+            chain.from_iterable(self.postings.get(gram, ()) for gram in grams)
+        )
+        matches = []
+        for id, count in shared.most_common(self.shortlist):
+            entry, other = entries[id], keys[id]
+            if labels is not None and entry.label not in labels:
+                continue
+            length = max(len(key), len(other))
+            bound = int(length * (1 - threshold) + 1e-9)
+            # Each edit changes at most three trigrams, so names sharing
+            # fewer cannot be within `bound` edits
+            if count < max(len(grams), self.gram_counts[id]) - 3 * bound:
+                continue
+            distance = _edit_distance(key, other, bound)
+            if distance <= bound:
+                matches.append(entry._replace(score=round(1 - distance / length, 3)))
+        return sorted(matches, key=lambda match: -match.score)
+
+    def resolve(self, names: List[str]) -> List[Optional[str]]:
+        """
+        The canonical name for each of `names`, None where the in-memory
+        index has no close enough match
+        """
+        resolved = []
+        for name in names:
+            matches = self.search(name, self.threshold)
+            resolved.append(matches[0].name if matches else None)
+        return resolved
+
+    def candidates(
+        self, name: str, limit: int = 25, labels: Optional[Sequence[str]] = None
+    ) -> List[str]:
+        """
+        The matching name if there is an exact one, otherwise the closest options
+        """
+        matches = self.search(name, self.candidate_threshold, labels)
+        return list(dict.fromkeys(match.name for match in matches))[:limit]
+
+    @staticmethod
+    def _fallback_params(names: List[str]) -> Dict:
+        return {
+            "entities": [
+                {"name": name, "query": generate_full_text_query(name)}
+                for name in names
+                if remove_lucene_chars(name).split()
+            ]
+        }
+
+    def _merge(self, names: List[str], resolved: List[Optional[str]], rows) -> List[Optional[str]]:
+        found = {row["name"]: row["result"] for row in rows}
+        merged = [value or found.get(name) for name, value in zip(names, resolved)]
+        self._count("resolved", sum(value is not None for value in resolved))
+        self._count("fallback", sum(1 for name in names if name in found))
+        self._count("unresolved", sum(value is None for value in merged))
+        return merged
+
+    def map(self, names: List[str], graph) -> List[Optional[str]]:
+        """
+        `resolve`, with the names it missed looked up in the fulltext index
+        """
+        start = time.perf_counter()
+        resolved = self.resolve(names)
+        missing = [name for name, value in zip(names, resolved) if value is None]
+        logging.info(
+            f"Resolved {len(names) - len(missing)}/{len(names)} entities in memory "
+            f"in {(time.perf_counter() - start) * 1e6:.0f}us."
+        )
+        rows = []
+        if missing:
+            try:
+                rows = graph.query(fallback_query, self._fallback_params(missing))
+            except Exception:
+                logging.exception("Entity fulltext fallback failed")
+        return self._merge(names, resolved, rows)
+
+    async def amap(self, names: List[str], async_graph) -> List[Optional[str]]:
+        start = time.perf_counter()
+        resolved = self.resolve(names)
+        missing = [name for name, value in zip(names, resolved) if value is None]
+        logging.info(
+            f"Resolved {len(names) - len(missing)}/{len(names)} entities in memory "
+            f"in {(time.perf_counter() - start) * 1e6:.0f}us."
+        )
+        rows = []
+        if missing:
+            try:
+                rows = await async_graph.query(fallback_query, self._fallback_params(missing))
+            except Exception:
+                logging.exception("Entity fulltext fallback failed")
+        return self._merge(names, resolved, rows)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"names": len(self.entries), **self.counts}
@@ -0,0 +1,147 @@
+import os
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from migrations import fact_card_index_name
+from retrieval_filters import (
+    FILTER_BOOST_RANKS,
+    FILTER_EXACT_SELECTIVITY,
+    RetrievalFilters,
+    filter_predicate,
+    oversample_factor,
+)
+
+FACT_CARD_APTITUDES = int(os.environ.get("FACT_CARD_APTITUDES", 5))
+FACT_CARD_EMPLOYERS = int(os.environ.get("FACT_CARD_EMPLOYERS", 5))
+
+
+def render_fact_card(article: Dict) -> str:
+    """
+    A few lines with the facts most questions about a role ask for: role,
+    sector, top aptitudes with scores, salary range per geography and
+    employers. Rendered from the raw article so delta imports can
+    fingerprint it before preparing params.
+    """
+    lines = [
+        f"{article['jobRole']} | {article['sector']} / {article['subSector']} | "
+        f"{article['collegeCategory']} | {article['experienceLevel']}"
+    ]
+    aptitudes = sorted(
+        article.get("aptitudeRatings", []), key=lambda el: -float(el["score"])
+    )[:FACT_CARD_APTITUDES]
+    if aptitudes:
+        lines.append(
+            "Top aptitudes: "
+            + ", ".join(f"{el['attribute']} {el['score']}" for el in aptitudes)
+        )
+    salaries = [
+        f"{el['geographicOption']} {el['estimatedSalaryRange']} "
+        f"(availability {el['jobAvailability']})"
+        for el in article.get("geographicJobDetails", [])
+    ]
+    if salaries:
+        lines.append("Salary: " + "; ".join(salaries))
+    employers = [
+        el["name"] for el in article["employers"].get("wellKnownEmployers", [])
+    ][:FACT_CARD_EMPLOYERS]
+    if employers:
+        lines.append("Employers: " + ", ".join(employers))
+    return "\n".join(lines)
+
+
+_index_search = """
+CALL db.index.vector.queryNodes($index, $fetch, $embedding)
+YIELD node AS j, score
+WHERE PREDICATE
+RETURN j.id AS id, j.factCard AS text, score
+ORDER BY score DESC LIMIT $k
+"""
+
+# Filters matching at most FILTER_EXACT_SELECTIVITY of the profiles score
+# them exactly; broader filters post-filter oversampled index hits
+_exact_search = """
+MATCH (j:JobProfile)
+WHERE PREDICATE AND j.factCardEmbedding IS NOT NULL
+WITH j, vector.similarity.cosine(j.factCardEmbedding, $embedding) AS score
+RETURN j.id AS id, j.factCard AS text, score
+ORDER BY score DESC LIMIT $k
+"""
+
+
+class FactCardRetriever:
+    """
+    Vector search over JobProfile fact cards, one compact card per profile
+    instead of several raw chunks
+    """
+
+    def __init__(self, graph, async_graph, embeddings, catalog=None):
+        self.graph = graph
+        self.async_graph = async_graph
+        self.embeddings = embeddings
+        self.catalog = catalog
+
+    def _plan(self, embedding: List[float], k: int, filters: Optional[RetrievalFilters]):
+        predicate = "true"
+        exact, fetch = False, k
+        if filters is not None and not filters.is_empty():
+            predicate = filter_predicate(filters)
+            selectivity = 0.0
+            if self.catalog is not None and self.catalog.ready:
+                profiles = self.catalog.matching(filters)
+                selectivity = len(profiles) / max(len(self.catalog.profiles), 1)
+            exact = selectivity <= FILTER_EXACT_SELECTIVITY
+            fetch = k * oversample_factor(selectivity)
+        query = (_exact_search if exact else _index_search).replace("PREDICATE", predicate)
+        params = {
+            "index": fact_card_index_name,
+            "fetch": fetch,
+            "k": k,
+            "embedding": embedding,
+            "filters": filters.dict() if filters is not None else {},
+        }
+        return query, params
+
+    @staticmethod
+    def _documents(rows: List[Dict]) -> List[Document]:
+        return [
+            Document(
+                page_content=row["text"] or "",
+                metadata={"id": row["id"], "profileId": row["id"], "score": row["score"]},
+            )
+            for row in rows
+        ]
+
+    def _fetch(self, k: int, boosts: Optional[RetrievalFilters]) -> int:
+        # Boosted cards can come from a few places below the top `k`
+        if boosts is None or self.catalog is None or not self.catalog.ready:
+            return k
+        return k + FILTER_BOOST_RANKS
+
+    def _boosted(self, documents: List[Document], k: int, boosts: Optional[RetrievalFilters]):
+        if self._fetch(k, boosts) == k:
+            return documents
+        return self.catalog.boost(documents, boosts, k)
+
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> List[Document]:
+        embedding = self.embeddings.embed_query(query)
+        cypher, params = self._plan(embedding, self._fetch(k, boosts), filters)
+        return self._boosted(self._documents(self.graph.query(cypher, params)), k, boosts)
+
+    async def asearch(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        cypher, params = self._plan(embedding, self._fetch(k, boosts), filters)
+        documents = self._documents(await self.async_graph.query(cypher, params))
+        return self._boosted(documents, k, boosts)
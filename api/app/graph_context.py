@@ -0,0 +1,70 @@
+import os
+from typing import Dict, List
+
+GRAPH_CONTEXT_APTITUDES = int(os.environ.get("GRAPH_CONTEXT_APTITUDES", 5))
+GRAPH_CONTEXT_EMPLOYERS = int(os.environ.get("GRAPH_CONTEXT_EMPLOYERS", 5))
+
+# Appended to a retrieval query that has `profileIds` in scope: the profiles
+# behind the matched chunks with the facts structured questions ask about,
+# fetched in the same round trip as the chunks themselves
+profile_expansion = """
+CALL {
+    WITH profileIds
+    UNWIND profileIds AS profileId
+    WITH DISTINCT profileId
+    MATCH (j:JobProfile {id: profileId})
+    RETURN collect(j {
+        .id, .jobRole, .sector, .subSector, .collegeCategory, .experienceLevel,
+        aptitudes: [(j)-[r:HAS_APTITUDE]->(a:Aptitude) | {attribute: a.attribute, score: r.score}],
+        salaries: [(j)-[r:HAS_GEOGRAPHIC_DETAIL]->(g:GeographicDetail) | {
+            option: g.option, range: r.estimatedSalaryRange, availability: r.jobAvailability
+        }],
+        employers: [(j)-[:EMPLOYED_BY]->(e:Employer) | e.name],
+        pathways: [(j)-[:HAS_CAREER_PATHWAY]->(p:CareerPathway) | {
+            title: p.title,
+            roles: [(p)-[:HAS_JOB_ROLE]->(r:JobRole) | r.title + ' (' + r.years + ' years)']
+        }]
+    }) AS profiles
+}
+"""
+
+# Used when no search branch has to run in Neo4j
+profiles_query = "WITH $profileIds AS profileIds" + profile_expansion + "RETURN profiles"
+
+
+def _format_profile(profile: Dict) -> str:
+    lines = [
+        f"Job profile: {profile['jobRole']} ({profile['sector']} / {profile['subSector']}; "
+        f"college: {profile['collegeCategory']}; experience: {profile['experienceLevel']})"
+    ]
+    aptitudes = sorted(profile["aptitudes"], key=lambda a: -float(a["score"] or 0))
+    if aptitudes:
+        lines.append(
+            "Top aptitudes: "
+            + ", ".join(
+                f"{a['attribute']} ({a['score']:g})"
+                for a in aptitudes[:GRAPH_CONTEXT_APTITUDES]
+            )
+        )
+    for salary in sorted(profile["salaries"], key=lambda s: s["option"]):
+        lines.append(
+            f"Salary in {salary['option']}: {salary['range']} "
+            f"(availability: {salary['availability']})"
+        )
+    if profile["employers"]:
+        lines.append(
+            "Employers: " + ", ".join(sorted(profile["employers"])[:GRAPH_CONTEXT_EMPLOYERS])
+        )
+    for pathway in profile["pathways"]:
+        lines.append(f"Pathway {pathway['title']}: " + " -> ".join(pathway["roles"]))
+    return "\n".join(lines)
+
+
+def format_profiles(profiles: List[Dict], order: List[str]) -> str:
+    """
+    Render expanded profiles as compact structured context, in the order
+    their ids appear in `order` (the ranking of the matched chunks)
+    """
+    by_id = {profile["id"]: profile for profile in profiles}
+    ranked = [by_id[id] for id in dict.fromkeys(order) if id in by_id]
+    return "\n\n".join(_format_profile(profile) for profile in ranked)
@@ -3,45 +3,50 @@ from typing import Any, Dict, List, Optional, Tuple, Type
 from langchain.agents import AgentExecutor
 from langchain.agents.format_scratchpad import format_to_openai_function_messages
 from langchain.agents.output_parsers import OpenAIFunctionsAgentOutputParser
-from langchain.callbacks.manager import CallbackManagerForToolRun
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForToolRun,
+    CallbackManagerForToolRun,
+)
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import BaseTool
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.utils.function_calling import convert_to_openai_function
-from utils import embeddings, generate_full_text_query, graph, llm, vector_index
+from utils import (
+    asimilarity_search,
+    async_graph,
+    embeddings,
+    entity_resolver,
+    graph,
+    llm,
+    similarity_search,
+)
 
-candidate_query = """
-CALL db.index.fulltext.queryNodes('entity', $fulltextQuery, {limit: $limit})
-YIELD node
-WHERE node:Organization // Filter organization nodes
-RETURN distinct node.name AS candidate
-"""
+# Organizations in this graph are the employers
+ORGANIZATION_LABELS = ("Employer",)
 
 
-def get_candidates(input: str, limit: int = 25) -> List[Dict[str, str]]:
+def get_candidates(input: str, limit: int = 25) -> List[str]:
     """
-    Retrieve a list of candidate entities from database based on the input string.
+    Retrieve a list of candidate entities based on the input string.
 
-    This function queries the Neo4j database using a full-text search. It takes the
-    input string, generates a full-text query, and executes this query against the
-    specified index in the database. The function returns a list of candidates
-    matching the query.
+    Candidates come from the in-memory entity index: the exact match if
+    there is one, otherwise all close options. When nothing is close the
+    fulltext index is asked for its best match.
     """
-    ft_query = generate_full_text_query(input)
-    print(ft_query)
-    candidates = graph.query(
-        candidate_query, {"fulltextQuery": ft_query, "index": "entity", "limit": limit}
-    )
-    print(candidates)
-    # If there is direct match return only that, otherwise return all options
-    direct_match = [
-        el["candidate"] for el in candidates if el["candidate"].lower() == input.lower()
-    ]
-    if direct_match:
-        return direct_match
+    candidates = entity_resolver.candidates(input, limit, ORGANIZATION_LABELS)
+    if not candidates:
+        candidates = [name for name in entity_resolver.map([input], graph) if name]
+    return candidates
+
 
-    return [el["candidate"] for el in candidates]
+async def aget_candidates(input: str, limit: int = 25) -> List[str]:
+    candidates = entity_resolver.candidates(input, limit, ORGANIZATION_LABELS)
+    if not candidates:
+        candidates = [
+            name for name in await entity_resolver.amap([input], async_graph) if name
+        ]
+    return candidates
 
 
 def get_organization_news(
@@ -51,7 +56,53 @@ def get_organization_news(
 ) -> str:
     # If there is no prefiltering, we can use vector index
     if topic and not organization and not sentiment:
-        return vector_index.similarity_search(topic)
+        return similarity_search(topic)
+    if organization:
+        # Map to database
+        candidates = get_candidates(organization)
+        if len(candidates) > 1:  # Ask for follow up if too many options
+            return _follow_up_question(candidates)
+        organization = candidates[0]
+    embedding = embeddings.embed_query(topic) if topic else None
+    complete_query, params = _news_query(topic, organization, sentiment, embedding)
+    return _format_news(complete_query, params, graph.query(complete_query, params))
+
+
+async def aget_organization_news(
+    topic: Optional[str] = None,
+    organization: Optional[str] = None,
+    sentiment: Optional[str] = None,
+) -> str:
+    if topic and not organization and not sentiment:
+        return await asimilarity_search(topic)
+    if organization:
+        candidates = await aget_candidates(organization)
+        if len(candidates) > 1:
+            return _follow_up_question(candidates)
+        organization = candidates[0]
+    embedding = await embeddings.aembed_query(topic) if topic else None
+    complete_query, params = _news_query(topic, organization, sentiment, embedding)
+    data = await async_graph.query(complete_query, params)
+    return _format_news(complete_query, params, data)
+
+
+def _follow_up_question(candidates: List[str]) -> str:
+    return (
+        "Ask a follow up question which of the available organizations "
+        f"did the user mean. Available options: {candidates}"
+    )
+
+
+def _news_query(
+    topic: Optional[str],
+    organization: Optional[str],
+    sentiment: Optional[str],
+    embedding: Optional[List[float]],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the prefiltered news query once the organization is resolved and
+    the topic, if any, is embedded
+    """
     # Uses parallel runtime where available
     base_query = (
         "CYPHER runtime = parallel parallelRuntimeSupport=all "
@@ -60,17 +111,10 @@ def get_organization_news(
     where_queries = []
     params = {"k": 5}  # Define the number of text chunks to retrieve
     if organization:
-        # Map to database
-        candidates = get_candidates(organization)
-        if len(candidates) > 1:  # Ask for follow up if too many options
-            return (
-                "Ask a follow up question which of the available organizations "
-                f"did the user mean. Available options: {candidates}"
-            )
         where_queries.append(
             "EXISTS {(a)-[:MENTIONS]->(:Organization {name: $organization})}"
         )
-        params["organization"] = candidates[0]
+        params["organization"] = organization
     if sentiment:
         if sentiment == "positive":
             where_queries.append("a.sentiment > $sentiment")
@@ -83,7 +127,7 @@ def get_organization_news(
             " WITH c, a, vector.similarity.cosine(c.embedding,$embedding) AS score "
             "ORDER BY score DESC LIMIT toInteger($k) "
         )
-        params["embedding"] = embeddings.embed_query(topic)
+        params["embedding"] = embedding
         params["topic"] = topic
     else:  # Just return the latest data
         vector_snippet = " WITH c, a ORDER BY a.date DESC LIMIT toInteger($k) "
@@ -93,7 +137,10 @@ def get_organization_news(
     complete_query = (
         base_query + " AND ".join(where_queries) + vector_snippet + return_snippet
     )
-    data = graph.query(complete_query, params)
+    return complete_query, params
+
+
+def _format_news(complete_query: str, params: Dict[str, Any], data) -> str:
     print(f"Cypher: {complete_query}\n")
     # Safely remove embedding before printing
     params.pop("embedding", None)
@@ -141,10 +188,10 @@ class NewsTool(BaseTool):
         topic: Optional[str] = None,
         organization: Optional[str] = None,
         sentiment: Optional[str] = None,
-        run_manager: Optional[CallbackManagerForToolRun] = None,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
     ) -> str:
         """Use the tool asynchronously."""
-        return get_organization_news(topic, organization, sentiment)
+        return await aget_organization_news(topic, organization, sentiment)
 
 
 tools = [NewsTool()]
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+GRAPH_SCHEMA_CACHE_PATH = os.environ.get("GRAPH_SCHEMA_CACHE_PATH", "cache/graph_schema.json")
+GRAPH_SCHEMA_COMPACT = os.environ.get("GRAPH_SCHEMA_COMPACT", "true").lower() == "true"
+
+# Every question is about job profiles; other labels are reached from here
+HUB_LABEL = "JobProfile"
+HIDDEN_LABELS = {"_SchemaMigration"}
+# Vectors, hashes and long text are of no use for writing Cypher
+HIDDEN_PROPERTIES = {"embedding", "factCardEmbedding", "contentHash", "text", "factCard"}
+# Property name words too common to tell labels apart
+GENERIC_WORDS = {
+    "id", "name", "description", "title", "type", "score", "attribute", "option",
+    "heading", "job", "role", "profile", "has", "for", "by", "to", "of",
+}
+# Question words that point at a label or relationship type the schema
+# names differently
+SCHEMA_SYNONYMS = {
+    "salary": "HAS_GEOGRAPHIC_DETAIL", "salaries": "HAS_GEOGRAPHIC_DETAIL",
+    "pay": "HAS_GEOGRAPHIC_DETAIL", "paid": "HAS_GEOGRAPHIC_DETAIL",
+    "paying": "HAS_GEOGRAPHIC_DETAIL", "earn": "HAS_GEOGRAPHIC_DETAIL",
+    "city": "GeographicDetail", "cities": "GeographicDetail",
+    "town": "GeographicDetail", "village": "GeographicDetail", "rural": "GeographicDetail",
+    "company": "Employer", "companies": "Employer", "hiring": "Employer", "hire": "Employer",
+    "skill": "Aptitude", "skills": "Aptitude", "ability": "Aptitude",
+    "interests": "Interest", "values": "Value",
+    "education": "PrepareForRole", "educational": "PrepareForRole",
+    "qualification": "PrepareForRole", "qualifications": "PrepareForRole",
+    "degree": "PrepareForRole", "training": "PrepareForRole", "prepare": "PrepareForRole",
+    "career": "CareerPathway", "pathway": "CareerPathway", "progression": "CareerPathway",
+    "like": "ReasonLiked", "liked": "ReasonLiked",
+    "dislike": "ReasonDisliked", "disliked": "ReasonDisliked",
+}
+
+# Names only: cheap enough to run after every import to see whether the
+# full introspection has to run again
+fingerprint_query = """
+CALL db.labels() YIELD label
+WITH collect(label) AS labels
+CALL db.relationshipTypes() YIELD relationshipType
+WITH labels, collect(relationshipType) AS types
+CALL db.propertyKeys() YIELD propertyKey
+RETURN labels, types, collect(propertyKey) AS keys
+"""
+
+
+def _words(name: str) -> List[str]:
+    # "estimatedSalaryRange" and "HAS_GEOGRAPHIC_DETAIL" alike
+    spaced = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return [word for word in re.split(r"[^a-z0-9]+", spaced.lower()) if word]
+
+
+def _props(props: List[Dict]) -> str:
+    return ", ".join(
+        f"{prop['property']}: {prop['type']}"
+        for prop in props
+        if prop["property"] not in HIDDEN_PROPERTIES
+    )
+
+
+class GraphSchema:
+    """
+    The introspected graph schema with a version stamp, shared by the
+    Cypher generation prompts, the relationship direction corrector and the
+    Cypher cache. `refresh` compares a fingerprint of the label, type and
+    property key names and only introspects again when it changed; the last
+    introspection is kept on disk so a restart against an unchanged graph
+    skips it.
+
+    `render` with a question gives only the labels the question points at,
+    by name, synonym or mentioned entity, plus those connecting them to
+    JobProfile.
+    """
+
+    def __init__(self, path: str = GRAPH_SCHEMA_CACHE_PATH, compact: bool = GRAPH_SCHEMA_COMPACT):
+        self.path = path
+        self.compact = compact
+        self.lock = threading.Lock()
+        self.fingerprint: Optional[str] = None
+        self.version = 0
+        self.structured: Dict = {"node_props": {}, "rel_props": {}, "relationships": []}
+        self.corrector = CypherQueryCorrector([])
+        self.full = ""
+        self.terms: Dict[str, Set[str]] = {}
+        self.counts = {"introspections": 0, "unchanged": 0, "compact": 0, "full": 0}
+
+    def _fingerprint(self, graph) -> str:
+        row = graph.query(fingerprint_query)[0]
+        names = {key: sorted(values) for key, values in row.items()}
+        return hashlib.sha1(json.dumps(names, sort_keys=True).encode()).hexdigest()
+
+    def _load(self) -> Optional[Dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, fingerprint: str, structured: Dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump({"fingerprint": fingerprint, "schema": structured}, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            logging.exception("Could not save the graph schema")
+
+    def refresh(self, graph, force: bool = False) -> bool:
+        """
+        Bring the schema up to date; returns whether it changed
+        """
+        fingerprint = self._fingerprint(graph)
+        if fingerprint == self.fingerprint and not force:
+            self.counts["unchanged"] += 1
+            return False
+        cached = self._load() if not force else None
+        if cached is not None and cached.get("fingerprint") == fingerprint:
+            structured = cached["schema"]
+            logging.info("Loaded graph schema from cache.")
+        else:
+            graph.refresh_schema()
+            structured = {
+                key: graph.structured_schema[key]
+                for key in ("node_props", "rel_props", "relationships")
+            }
+            self.counts["introspections"] += 1
+            self._save(fingerprint, structured)
+        self._install(fingerprint, structured)
+        logging.info(f"Graph schema version {self.version} ({fingerprint[:12]}).")
+        return True
+
+    def _install(self, fingerprint: str, structured: Dict) -> None:
+        structured = {
+            "node_props": {
+                label: props for label, props in structured["node_props"].items()
+                if label not in HIDDEN_LABELS
+            },
+            "rel_props": structured["rel_props"],
+            "relationships": [
+                rel for rel in structured["relationships"]
+                if rel["start"] not in HIDDEN_LABELS and rel["end"] not in HIDDEN_LABELS
+            ],
+        }
+        terms: Dict[str, Set[str]] = {}
+        for label, props in structured["node_props"].items():
+            for name in [label] + [prop["property"] for prop in props]:
+                for word in _words(name):
+                    terms.setdefault(word, set()).add(label)
+        for rel in structured["relationships"]:
+            names = [rel["type"]] + [
+                prop["property"] for prop in structured["rel_props"].get(rel["type"], [])
+            ]
+            for name in names:
+                for word in _words(name):
+                    terms.setdefault(word, set()).update((rel["start"], rel["end"]))
+        for word, target in SCHEMA_SYNONYMS.items():
+            for rel in structured["relationships"]:
+                if target in (rel["type"], rel["start"], rel["end"]):
+                    terms.setdefault(word, set()).update(
+                        (rel["start"], rel["end"]) if target == rel["type"] else (target,)
+                    )
+        corrector = CypherQueryCorrector(
+            [Schema(rel["start"], rel["type"], rel["end"]) for rel in structured["relationships"]]
+        )
+        full = self._format(structured, set(structured["node_props"]))
+        with self.lock:
+            self.structured, self.terms, self.corrector, self.full = (
+                structured, terms, corrector, full
+            )
+            self.fingerprint = fingerprint
+            self.version += 1
+
+    def correct(self, query: str) -> str:
+        """
+        The query with relationship directions fixed, or "" if it cannot be
+        """
+        return self.corrector(query)
+
+    def _connected(self, seeds: Set[str]) -> Set[str]:
+        # Seeds plus the labels on a shortest path from each to the hub
+        neighbours: Dict[str, Set[str]] = {}
+        for rel in self.structured["relationships"]:
+            neighbours.setdefault(rel["start"], set()).add(rel["end"])
+            neighbours.setdefault(rel["end"], set()).add(rel["start"])
+        labels = set(seeds) | {HUB_LABEL}
+        parents = {HUB_LABEL: None}
+        queue = deque([HUB_LABEL])
+        while queue:
+            label = queue.popleft()
+            for neighbour in neighbours.get(label, ()):
+                if neighbour not in parents:
+                    parents[neighbour] = label
+                    queue.append(neighbour)
+        for seed in seeds:
+            label = parents.get(seed)
+            while label is not None:
+                labels.add(label)
+                label = parents[label]
+        return labels
+
+    def _format(self, structured: Dict, labels: Set[str]) -> str:
+        relationships = [
+            rel for rel in structured["relationships"]
+            if rel["start"] in labels and rel["end"] in labels
+        ]
+        types = {rel["type"] for rel in relationships}
+        lines = ["Node properties:"]
+        lines.extend(
+            f"{label} {{{_props(props)}}}"
+            for label, props in structured["node_props"].items()
+            if label in labels
+        )
+        lines.append("Relationship properties:")
+        lines.extend(
+            f"{type} {{{_props(props)}}}"
+            for type, props in structured["rel_props"].items()
+            if type in types and _props(props)
+        )
+        lines.append("The relationships:")
+        lines.extend(
+            f"(:{rel['start']})-[:{rel['type']}]->(:{rel['end']})" for rel in relationships
+        )
+        return "\n".join(lines)
+
+    def labels_for(self, question: str) -> Set[str]:
+        """
+        Labels the question's words point at
+        """
+        labels: Set[str] = set()
+        for word in re.split(r"[^a-z0-9]+", question.lower()):
+            if not word or word in GENERIC_WORDS:
+                continue
+            for form in {word, word.rstrip("s")}:
+                labels.update(self.terms.get(form, ()))
+        return labels
+
+    def render(self, question: Optional[str] = None, labels: Iterable[str] = ()) -> str:
+        """
+        The schema for a Cypher generation prompt. With a question, only the
+        part relevant to it: labels it names or whose entities it mentions
+        (`labels`), and the path from each to JobProfile. The full schema
+        when nothing beyond JobProfile is recognised.
+        """
+        if not self.compact or question is None:
+            return self.full
+        structured = self.structured
+        seeds = (self.labels_for(question) | set(labels)) & set(structured["node_props"])
+        if not seeds - {HUB_LABEL}:
+            self.counts["full"] += 1
+            return self.full
+        self.counts["compact"] += 1
+        return self._format(structured, self._connected(seeds))
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "labels": len(self.structured["node_props"]),
+            "compact": self.compact,
+            **self.counts,
+        }
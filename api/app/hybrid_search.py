@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+from langchain_core.documents import Document
+
+from graph_context import profile_expansion, profiles_query
+from migrations import chunk_fulltext_index_name, chunk_index_name
+from retrieval_filters import (
+    FILTER_BOOST_RANKS,
+    FILTER_EXACT_SELECTIVITY,
+    RetrievalFilters,
+    filter_predicate,
+    oversample_factor,
+)
+
+RRF_K = int(os.environ.get("RRF_K", 60))
+HYBRID_VECTOR_CANDIDATES = int(os.environ.get("HYBRID_VECTOR_CANDIDATES", 20))
+HYBRID_KEYWORD_CANDIDATES = int(os.environ.get("HYBRID_KEYWORD_CANDIDATES", 20))
+HYBRID_VECTOR_WEIGHT = float(os.environ.get("HYBRID_VECTOR_WEIGHT", 1.0))
+HYBRID_KEYWORD_WEIGHT = float(os.environ.get("HYBRID_KEYWORD_WEIGHT", 1.0))
+
+_vector_branch = """
+CALL {
+    CALL db.index.vector.queryNodes($vectorIndex, $vectorCandidates, $embedding)
+    YIELD node, score
+    RETURN collect({
+        id: node.id, text: node.text, score: score,
+        profileId: [(j:JobProfile)-[:HAS_CHUNK]->(node) | j.id][0]
+    }) AS vectorHits
+}
+"""
+
+_keyword_branch = """
+CALL {
+    CALL db.index.fulltext.queryNodes($keywordIndex, $keywordQuery, {limit: $keywordCandidates})
+    YIELD node, score
+    RETURN collect({
+        id: node.id, text: node.text, score: score,
+        profileId: [(j:JobProfile)-[:HAS_CHUNK]->(node) | j.id][0]
+    }) AS keywordHits
+}
+"""
+
+# Filtered variants, with PREDICATE replaced by a retrieval_filters predicate
+# on the chunk's JobProfile `j`. Index hits are fetched oversampled and
+# post-filtered; the exact branch scores only the chunks of matching profiles.
+_filtered_vector_branch = """
+CALL {
+    CALL db.index.vector.queryNodes($vectorIndex, $vectorFetch, $embedding)
+    YIELD node, score
+    MATCH (j:JobProfile)-[:HAS_CHUNK]->(node)
+    WHERE PREDICATE
+    WITH node, score, j ORDER BY score DESC LIMIT $vectorCandidates
+    RETURN collect({id: node.id, text: node.text, score: score, profileId: j.id}) AS vectorHits
+}
+"""
+
+_exact_vector_branch = """
+CALL {
+    MATCH (j:JobProfile)-[:HAS_CHUNK]->(node:Chunk)
+    WHERE PREDICATE AND node.embedding IS NOT NULL
+    WITH node, j, vector.similarity.cosine(node.embedding, $embedding) AS score
+    ORDER BY score DESC LIMIT $vectorCandidates
+    RETURN collect({id: node.id, text: node.text, score: score, profileId: j.id}) AS vectorHits
+}
+"""
+
+_filtered_keyword_branch = """
+CALL {
+    CALL db.index.fulltext.queryNodes($keywordIndex, $keywordQuery, {limit: $keywordFetch})
+    YIELD node, score
+    MATCH (j:JobProfile)-[:HAS_CHUNK]->(node)
+    WHERE PREDICATE
+    WITH node, score, j ORDER BY score DESC LIMIT $keywordCandidates
+    RETURN collect({id: node.id, text: node.text, score: score, profileId: j.id}) AS keywordHits
+}
+"""
+
+
+@lru_cache(maxsize=None)
+def retrieval_query(
+    vector: Optional[str], keyword: bool, expand: bool, predicate: str = "true"
+) -> Optional[str]:
+    """
+    Both ranked candidate lists come back in one round trip and are fused
+    client side. `vector` is "index", "exact" or None when the mirror already
+    supplied the vector hits; the keyword branch is left out when the
+    question has no searchable keywords. With `expand` the profiles behind
+    the leading candidates of each list come back too.
+    """
+    filtered = predicate != "true"
+    vector_branch = {
+        "index": _filtered_vector_branch if filtered else _vector_branch,
+        "exact": _exact_vector_branch,
+    }.get(vector)
+    keyword_branch = _filtered_keyword_branch if filtered else _keyword_branch
+    branches = [
+        (cypher.replace("PREDICATE", predicate), name)
+        for cypher, name in (
+            (vector_branch, "vectorHits"),
+            (keyword_branch if keyword else None, "keywordHits"),
+        )
+        if cypher
+    ]
+    hits = ", ".join(name for _, name in branches)
+    if not expand:
+        return "".join(cypher for cypher, _ in branches) + f"RETURN {hits}" if branches else None
+    if not branches:
+        return profiles_query
+    leading = " + ".join(f"{name}[..$expandCandidates]" for _, name in branches)
+    return (
+        "".join(cypher for cypher, _ in branches)
+        + f"WITH {hits}, [hit IN {leading} | hit.profileId] + $profileIds AS profileIds"
+        + profile_expansion
+        + f"RETURN {hits}, profiles"
+    )
+
+
+def reciprocal_rank_fusion(
+    ranked: Dict[str, List[Dict]],
+    weights: Dict[str, float],
+    k: int,
+    rrf_k: int = RRF_K,
+) -> List[Document]:
+    """
+    Fuse ranked hit lists: each hit scores weight / (rrf_k + rank) per list it
+    appears in, ranks starting at 1. Returns the top `k` chunks.
+    """
+    fused: Dict[str, Dict] = {}
+    for source, hits in ranked.items():
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(
+                hit["id"],
+                {"text": hit["text"], "profileId": hit["profileId"], "score": 0.0},
+            )
+            entry["score"] += weights[source] / (rrf_k + rank)
+            entry[f"{source}Rank"] = rank
+            entry[f"{source}Score"] = hit["score"]
+    top = sorted(fused.items(), key=lambda item: item[1]["score"], reverse=True)[:k]
+    return [
+        Document(page_content=entry.pop("text") or "", metadata={"id": id, **entry})
+        for id, entry in top
+    ]
+
+
+class HybridRetriever:
+    """
+    Vector plus fulltext search over Chunk nodes, fused with reciprocal rank
+    fusion. When the vector mirror is ready the vector candidates come from
+    it and only the fulltext branch goes to Neo4j; either way it is at most
+    one round trip. Searches can be restricted with RetrievalFilters, whose
+    selectivity from the profile catalog picks exact or oversampled search,
+    or only ranked towards profiles matching `boosts`.
+    """
+
+    def __init__(
+        self,
+        graph,
+        async_graph,
+        embeddings,
+        vector_mirror=None,
+        catalog=None,
+        rrf_k: int = RRF_K,
+        vector_candidates: int = HYBRID_VECTOR_CANDIDATES,
+        keyword_candidates: int = HYBRID_KEYWORD_CANDIDATES,
+        vector_weight: float = HYBRID_VECTOR_WEIGHT,
+        keyword_weight: float = HYBRID_KEYWORD_WEIGHT,
+        exact_selectivity: float = FILTER_EXACT_SELECTIVITY,
+    ):
+        self.graph = graph
+        self.async_graph = async_graph
+        self.embeddings = embeddings
+        self.vector_mirror = vector_mirror
+        self.catalog = catalog
+        self.rrf_k = rrf_k
+        self.vector_candidates = vector_candidates
+        self.keyword_candidates = keyword_candidates
+        self.weights = {"vector": vector_weight, "keyword": keyword_weight}
+        self.exact_selectivity = exact_selectivity
+
+    def _scope(self, filters: Optional[RetrievalFilters]):
+        """
+        The matching profile ids and their share of all chunks, when the
+        catalog can tell
+        """
+        if filters is None or filters.is_empty() or self.catalog is None or not self.catalog.ready:
+            return None, None
+        profile_ids = self.catalog.matching(filters)
+        return profile_ids, self.catalog.selectivity(profile_ids)
+
+    def _plan(
+        self,
+        query: str,
+        embedding: List[float],
+        mirror_hits: Optional[List[Dict]],
+        k: int,
+        expand: bool,
+        filters: Optional[RetrievalFilters] = None,
+        selectivity: Optional[float] = None,
+    ):
+        """
+        The Cypher and parameters for the branches that still have to run in
+        Neo4j, or None when there are none
+        """
+        keywords = remove_lucene_chars(query).strip()
+        predicate = "true" if filters is None or filters.is_empty() else filter_predicate(filters)
+        oversample = 1
+        if predicate != "true":
+            # Unknown selectivity oversamples as much as allowed
+            oversample = oversample_factor(selectivity if selectivity is not None else 0)
+        vector = None
+        if mirror_hits is None:
+            exact = selectivity is not None and selectivity <= self.exact_selectivity
+            vector = "exact" if predicate != "true" and exact else "index"
+        params = {
+            "keywordIndex": chunk_fulltext_index_name,
+            "keywordQuery": keywords,
+            "keywordCandidates": self.keyword_candidates,
+            "keywordFetch": self.keyword_candidates * oversample,
+            "vectorIndex": chunk_index_name,
+            "vectorCandidates": self.vector_candidates,
+            "vectorFetch": self.vector_candidates * oversample,
+            "embedding": embedding,
+            "expandCandidates": k,
+            "profileIds": [hit["profileId"] for hit in (mirror_hits or [])[:k]],
+            "filters": filters.dict() if filters is not None else {},
+        }
+        return retrieval_query(vector, bool(keywords), expand, predicate), params
+
+    def _mirror_hits(
+        self, embedding: List[float], profile_ids: Optional[Set[str]] = None
+    ) -> Optional[List[Dict]]:
+        if self.vector_mirror is None or not self.vector_mirror.ready:
+            return None
+        try:
+            documents = self.vector_mirror.similarity_search_by_vector(
+                embedding, self.vector_candidates, profile_ids
+            )
+        except Exception:
+            logging.exception("Vector mirror search failed, falling back to Neo4j")
+            return None
+        return [
+            {"id": doc.metadata["id"], "text": doc.page_content,
+             "profileId": doc.metadata["profileId"], "score": doc.metadata["score"]}
+            for doc in documents
+        ] or None
+
+    def _use_mirror(self, filters: Optional[RetrievalFilters], profile_ids) -> bool:
+        # Filtered mirror searches need the catalog to resolve profile ids
+        if self.vector_mirror is None or not self.vector_mirror.ready:
+            return False
+        return filters is None or filters.is_empty() or profile_ids is not None
+
+    def _fuse(self, vector_hits, keyword_hits, k: int) -> List[Document]:
+        return reciprocal_rank_fusion(
+            {"vector": vector_hits, "keyword": keyword_hits}, self.weights, k, self.rrf_k
+        )
+
+    def _result(self, result: Dict, mirror_hits, k: int) -> Tuple[List[Document], List[Dict]]:
+        documents = self._fuse(
+            result.get("vectorHits", mirror_hits) or [],
+            result.get("keywordHits", []),
+            k,
+        )
+        return documents, result.get("profiles", [])
+
+    def _fetch(self, k: int, boosts: Optional[RetrievalFilters]) -> int:
+        # Boosted documents can come from a few places below the top `k`
+        if boosts is None or self.catalog is None or not self.catalog.ready:
+            return k
+        return k + FILTER_BOOST_RANKS
+
+    def _boosted(self, found, k: int, boosts: Optional[RetrievalFilters]):
+        documents, profiles = found
+        if self._fetch(k, boosts) == k:
+            return documents, profiles
+        return self.catalog.boost(documents, boosts, k), profiles
+
+    def _search(self, query: str, k: int, expand: bool, filters: Optional[RetrievalFilters]):
+        embedding = self.embeddings.embed_query(query)
+        profile_ids, selectivity = self._scope(filters)
+        mirror_hits = None
+        if self._use_mirror(filters, profile_ids):
+            mirror_hits = self._mirror_hits(embedding, profile_ids)
+        cypher, params = self._plan(
+            query, embedding, mirror_hits, k, expand, filters, selectivity
+        )
+        result = self.graph.query(cypher, params)[0] if cypher else {}
+        return self._result(result, mirror_hits, k)
+
+    async def _asearch(
+        self, query: str, k: int, expand: bool, filters: Optional[RetrievalFilters]
+    ):
+        embedding = await self.embeddings.aembed_query(query)
+        profile_ids, selectivity = self._scope(filters)
+        mirror_hits = None
+        if self._use_mirror(filters, profile_ids):
+            # The scan is NumPy work that releases the GIL, keep it off the loop
+            mirror_hits = await asyncio.to_thread(self._mirror_hits, embedding, profile_ids)
+        cypher, params = self._plan(
+            query, embedding, mirror_hits, k, expand, filters, selectivity
+        )
+        result = (await self.async_graph.query(cypher, params))[0] if cypher else {}
+        return self._result(result, mirror_hits, k)
+
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> List[Document]:
+        found = self._search(query, self._fetch(k, boosts), False, filters)
+        return self._boosted(found, k, boosts)[0]
+
+    async def asearch(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> List[Document]:
+        found = await self._asearch(query, self._fetch(k, boosts), False, filters)
+        return self._boosted(found, k, boosts)[0]
+
+    def search_with_profiles(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> Tuple[List[Document], List[Dict]]:
+        """
+        The top `k` chunks plus the expanded JobProfiles behind them (see
+        graph_context), still in a single round trip
+        """
+        found = self._search(query, self._fetch(k, boosts), True, filters)
+        return self._boosted(found, k, boosts)
+
+    async def asearch_with_profiles(
+        self,
+        query: str,
+        k: int = 4,
+        filters: Optional[RetrievalFilters] = None,
+        boosts: Optional[RetrievalFilters] = None,
+    ) -> Tuple[List[Document], List[Dict]]:
+        found = await self._asearch(query, self._fetch(k, boosts), True, filters)
+        return self._boosted(found, k, boosts)
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from importing import ImportCancelled, ImportProgress
+
+MAX_FINISHED_JOBS = 20
+
+
+class ImportAlreadyRunning(Exception):
+    pass
+
+
+class ImportJob:
+    def __init__(self, delta: bool = False):
+        self.id = uuid.uuid4().hex
+        self.delta = delta
+        self.status = "pending"
+        self.progress = ImportProgress()
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def snapshot(self) -> Dict:
+        progress = self.progress
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        throughput = progress.processed / elapsed if elapsed else 0.0
+        eta = None
+        if self.status == "running" and progress.total is not None and throughput:
+            eta = max(progress.total - progress.processed, 0) / throughput
+        return {
+            "id": self.id,
+            "status": self.status,
+            "delta": self.delta,
+            "total": progress.total,
+            "parsed": progress.parsed,
+            "chunksEmbedded": progress.chunks_embedded,
+            "rowsWritten": progress.rows_written,
+            "processed": progress.processed,
+            "elapsedSeconds": round(elapsed, 1),
+            "rowsPerSecond": round(throughput, 2),
+            "etaSeconds": round(eta, 1) if eta is not None else None,
+            "stageSeconds": {
+                stage: round(seconds, 2) for stage, seconds in progress.stage_seconds().items()
+            },
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ImportJobManager:
+    """
+    Runs imports on a background thread, at most one at a time
+    """
+
+    def __init__(self, run: Callable[[ImportJob], Dict]):
+        self.run = run
+        self.jobs: Dict[str, ImportJob] = {}
+        self.active: Optional[ImportJob] = None
+        self.lock = threading.Lock()
+
+    def start(self, delta: bool = False) -> ImportJob:
+        with self.lock:
+            if self.active is not None:
+                raise ImportAlreadyRunning(self.active.id)
+            job = ImportJob(delta)
+            self.active = job
+            self.jobs[job.id] = job
+            finished = [el for el in self.jobs.values() if el.done.is_set()]
+            for old in finished[:-MAX_FINISHED_JOBS]:
+                del self.jobs[old.id]
+        threading.Thread(
+            target=self._run, args=(job,), name=f"import-{job.id[:8]}", daemon=True
+        ).start()
+        return job
+
+    def _run(self, job: ImportJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = self.run(job)
+            job.status = "succeeded"
+        except ImportCancelled:
+            job.status = "cancelled"
+            logging.info(f"Import job {job.id} cancelled.")
+        except Exception as e:
+            logging.exception(f"Import job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            with self.lock:
+                self.active = None
+            job.done.set()
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[ImportJob]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.progress.cancel()
+        return job
@@ -1,23 +1,44 @@
+import hashlib
 import logging
 import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from typing import Any, Dict, List, Optional
 
-import requests
-from utils import embeddings, text_splitter
-import re
-import json
-from convert import process_json_element
+import numpy as np
+
+from chunking import ChunkingPool
+from embedding import EmbeddingJob, EmbeddingStage
+from fact_cards import render_fact_card
+from streaming import batched, count_json_records, iter_json_records
+from writer import write_profiles
 
 CATEGORY_THRESHOLD = 0.50
-params = []
+ARTICLES_FILE = os.environ.get(
+    "IMPORT_ARTICLES_FILE", "TransformerService.job_profiles_3rdSep_100.json"
+)
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 100))
+# Stages ImportProgress.timings reports, in pipeline order
+IMPORT_STAGES = ("parse", "render", "chunk", "embed", "write")
+
+
+def get_articles(path: str = ARTICLES_FILE):
+    """
+    Stream articles from a JSON array or NDJSON dump, one at a time
+    """
+    return iter_json_records(path)
+
 
-def get_articles():
+def count_articles(
+    path: str = ARTICLES_FILE, progress: Optional["ImportProgress"] = None
+) -> Optional[int]:
     """
-    Fetch relevant articles from json
+    Number of articles in an NDJSON dump, None for a JSON array (no ETA)
     """
-    with open('TransformerService.job_profiles_3rdSep_100.json', 'r') as file:  
-        data = json.load(file)
-    return data
+    return count_json_records(path, check=progress.check_cancelled if progress else None)
 
 
 def getSalary(estimatedSalaryRange: str) -> List[int] :
@@ -28,15 +49,28 @@ def getSalary(estimatedSalaryRange: str) -> List[int] :
     return [matches[0], matches[1]]
 
 
-def process_params(data):
+def prepare_params(
+    data,
+    chunking_pool: ChunkingPool,
+    progress: Optional["ImportProgress"] = None,
+    run: Optional[str] = None,
+):
+    """
+    Render and chunk articles into import rows, without embeddings. `run`
+    is stamped on the profiles as lastImport.
+    """
     params = []
     all_chunks = []
-    for article in data:
-        text = process_json_element(article)
+    for article, rendered in zip(data, chunking_pool.map(data)):
+        text, chunks = rendered.text, rendered.chunks
+        if progress:
+            progress.add_time("render", rendered.render_seconds)
+            progress.add_time("chunk", rendered.chunk_seconds)
         article["text"] = text
+        fact_card = render_fact_card(article)
         split_chunks = [
             {"text": el, "index": f"{article['_id']['$oid']}-{i}"}
-            for i, el in enumerate(text_splitter.split_text(article["text"]))
+            for i, el in enumerate(chunks)
         ]
         all_chunks.extend(split_chunks)
         mediaURLs = article["jobProfile"]["generalDescription"] .get("mediaURLs", {})  
@@ -47,6 +81,7 @@ def process_params(data):
                 "subSector": article["subSector"],
                 "deleted": article["deleted"],
                 "id": article["_id"]["$oid"],
+                "lastImport": run,
                 "jobProfile": {
                     "generalDescription": {
                         "text": article["jobProfile"]["generalDescription"]["text"],
@@ -144,136 +179,283 @@ def process_params(data):
                 "jobRoleKey": article["jobRoleKey"],
                 "experienceLevel": article["experienceLevel"],
                 "text": article["text"],
+                "contentHash": content_hash(article["text"], fact_card),
+                "factCard": fact_card,
                 "chunks": split_chunks,
             }
         )
-        print(params[0]["jobProfile"]["prepareForRole"]["educationVsDegreeHeading"], "==============educationVsDegreeHeading=====================")
     logging.info(f"Number of text chunks: {len(all_chunks)}.")
-    # Make a single request for embeddings
-    embedded_documents = embeddings.embed_documents([el["text"] for el in all_chunks])
-    # Assign embeddings to chunks in params using a dictionary
-    chunk_embedding_map = {
-        chunk["index"]: embedded_documents[i] for i, chunk in enumerate(all_chunks)
-    }
+    return params
+
+
+def chunk_texts(params) -> List[str]:
+    return [chunk["text"] for param in params for chunk in param["chunks"]]
+
+
+def embedding_texts(params) -> List[str]:
+    """
+    Chunk texts followed by one fact card per profile, embedded as one job
+    """
+    return chunk_texts(params) + [param["factCard"] for param in params]
+
+
+def attach_embeddings(params, embedded_documents: np.ndarray):
+    """
+    Point each chunk at its row of the batch's float32 embedding matrix. The
+    rows are views, so no vector is copied until the driver sends it.
+    """
+    row = 0
     for param in params:
-        param["chunks"] = [
-            {**chunk, "embedding": chunk_embedding_map.get(chunk["index"], None)}
-            for chunk in param["chunks"]
-        ]
-        # param["embedding"] = embeddings.embed_documents([param["text"]])[0]
+        for chunk in param["chunks"]:
+            chunk["embedding"] = embedded_documents[row]
+            row += 1
+    return params
+
 
+def attach_fact_card_embeddings(params, embedded_cards: np.ndarray):
+    for param, vector in zip(params, embedded_cards):
+        param["factCardEmbedding"] = vector
     return params
 
 
-import_cypher_query = """
-UNWIND $data AS row  
-// Create or merge a JobProfile node  
-MERGE (j:JobProfile {id: row.id})  
-SET j.id = row.id,
-    j.sector = row.sector,  
-    j.subSector = row.subSector,  
-    j.descriptionText = row.jobProfile.generalDescription.text,  
-    j.mediaURL = row.jobProfile.generalDescription.mediaURL,  
-    j.mediaURLsMale = row.jobProfile.generalDescription.mediaURLs.male,  
-    j.mediaURLsFemale = row.jobProfile.generalDescription.mediaURLs.female,  
-    j.collegeCategory = row.collegeCategory,  
-    j.jobRole = row.jobRole,  
-    j.jobLocation = row.jobLocation,  
-    j.experienceLevel = row.experienceLevel,
-    j.dayInTheLifeText = row.jobProfile.dayInTheLife.text,
-    j.text = row.text,
-    j.deleted = row.deleted
-
-WITH j, row, row.jobProfile.prepareForRole.educationVsDegreeHeading as heading
-MERGE (p:PrepareForRole {heading: heading})
-MERGE (j)-[rel:ForRole]->(p)
-SET rel.educationVsDegree = row.jobProfile.prepareforRole.educationVsDegree,
-    rel.trainingNeeded = row.jobProfile.prepareforRole.trainingNeeded,
-    rel.priorWorkExperience = row.jobProfile.prepareforRole.priorWorkExperience
-
-// Handling Reason Liked  
-WITH j, row
-FOREACH (reasonLiked in row.jobProfile.reasonLiked |  
-  MERGE (rl:ReasonLiked {reason: reasonLiked})  
-  MERGE (j)-[:LIKED_FOR]->(rl)  
-)  
-
-// Handling Reason Disliked 
-WITH j, row 
-FOREACH (reasonDisliked in row.jobProfile.reasonsDisliked |  
-  MERGE (rd:ReasonDisliked {reason: reasonDisliked})  
-  MERGE (j)-[:DISLIKED_FOR]->(rd)  
-)  
-
-// Handling Aptitude Ratings  
-WITH j, row
-FOREACH (aptitude in row.aptitudeRatings |  
-  MERGE (a:Aptitude {attribute: aptitude.attribute})  
-  MERGE (j)-[rel:HAS_APTITUDE]->(a)
-  SET rel.score = toFloat(aptitude.score)  
-)  
-
-// Handling Interested Ratings  
-WITH j, row
-FOREACH (interest in row.interestRatings |  
-  MERGE (ir:Interest {attribute: interest.attribute})  
-  MERGE (j)-[rel:HAS_INTEREST]->(ir)  
-  SET rel.score = toFloat(interest.score)  
-)  
-
-// Handling Value Ratings  
-WITH j, row
-FOREACH (value in row.valueRatings |  
-  MERGE (vr:Value {attribute: value.attribute})  
-  MERGE (j)-[rel:HAS_VALUE]->(vr)  
-  SET rel.score = toFloat(value.score)  
-)  
-
-// Handling Career Pathways  
-WITH j, row
-UNWIND row.careerPathways AS pathway  
-  MERGE (cp:CareerPathway {title: pathway.pathwayTitle})  
-  SET cp.description = pathway.description  
-  MERGE (j)-[:HAS_CAREER_PATHWAY]->(cp)  
-  // Handling Job Roles within Career Pathways  
-  FOREACH (jobRole in pathway.jobRoles |  
-    MERGE (jr:JobRole {title: jobRole.title, years: jobRole.years})  
-    MERGE (cp)-[:HAS_JOB_ROLE]->(jr)  
-  )  
-
-// Handling Employers  
-WITH j, row
-FOREACH (employer in row.employers.wellKnownEmployers |  
-  MERGE (e:Employer {name: employer.name})  
-  SET e.description = employer.description,  
-      e.website = employer.website  
-  MERGE (j)-[:EMPLOYED_BY]->(e)  
-)  
-
-// Handling Employer Profiles  
-WITH j, row
-FOREACH (profile in row.employers.employerProfiles |  
-  MERGE (ep:EmployerProfile {geographicOption: profile.geographicOption})  
-  MERGE (j)-[rel:HAS_EMPLOYER_PROFILE]->(ep)  
-  SET rel.profiles = profile.profiles  
-)  
-
-// Handling Geographic Job Details  
-WITH j, row
-FOREACH (geoDetail in row.geographicJobDetails |  
-  MERGE (g:GeographicDetail {option: geoDetail.geographicOption})  
-  MERGE (j)-[rel:HAS_GEOGRAPHIC_DETAIL]->(g)  
-  SET rel.jobAvailability = geoDetail.jobAvailability,  
-      rel.estimatedSalaryRange = geoDetail.estimatedSalaryRange,  
-      rel.maximumSalary = geoDetail.maximumSalary,  
-      rel.minimumSalary = geoDetail.minimumSalary  
-)
-WITH j, row
-UNWIND row.chunks AS chunk
-  MERGE (c:Chunk {id: chunk.index})
-  SET c.text = chunk.text,
-      c.index = chunk.index
-  MERGE (j)-[:HAS_CHUNK]->(c)
-  WITH c, chunk
-  CALL db.create.setNodeVectorProperty(c, 'embedding', chunk.embedding)
+def attach_all_embeddings(params, embedded: np.ndarray):
+    """
+    Split the matrix of an `embedding_texts` job between chunks and cards
+    """
+    attach_embeddings(params, embedded)
+    return attach_fact_card_embeddings(params, embedded[len(chunk_texts(params)) :])
+
+
+def process_params(data, embedding_stage: EmbeddingStage, chunking_pool: ChunkingPool):
+    params = prepare_params(data, chunking_pool)
+    return attach_all_embeddings(params, embedding_stage.embed(embedding_texts(params)))
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportProgress:
+    """
+    Per-stage counters updated by import_articles, readable from other threads
+    """
+
+    def __init__(self):
+        self.total: Optional[int] = None
+        self.parsed = 0
+        self.chunks_embedded = 0
+        self.rows_written = 0
+        # Profiles written or skipped as unchanged
+        self.processed = 0
+        # Seconds per stage. Render and chunk are summed over pool workers,
+        # embed is only the time spent waiting on vectors that were not ready.
+        self.timings: Dict[str, float] = dict.fromkeys(IMPORT_STAGES, 0.0)
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def stage_seconds(self) -> Dict[str, float]:
+        """
+        A copy of the timings, safe while stages are still adding to them
+        """
+        with self.lock:
+            return dict(self.timings)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled.is_set():
+            raise ImportCancelled()
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def content_hash(text: str, fact_card: str) -> str:
+    # Covers the card too, so a new card format re-imports profiles
+    return fingerprint(f"{text}\n{fact_card}")
+
+
+def select_changed(
+    graph,
+    data,
+    stats: Dict[str, int],
+    progress: Optional[ImportProgress] = None,
+    chunking_pool: Optional[ChunkingPool] = None,
+    run: Optional[str] = None,
+):
+    """
+    Drop articles whose rendered text matches the fingerprint stored on their
+    JobProfile. Returns the remaining articles and the ids of changed ones.
+    The text is rendered on the chunking pool and kept on the article, so
+    the changed ones are not rendered again when they are chunked.
+    Unchanged profiles are stamped with `run` here, the others when written.
+    """
+    progress = progress or ImportProgress()
+    chunking_pool = chunking_pool or ChunkingPool(workers=1)
+    for article, rendered in zip(data, chunking_pool.render(data)):
+        article["text"] = rendered.text
+        progress.add_time("render", rendered.render_seconds)
+    stored = {
+        el["id"]: el["contentHash"]
+        for el in graph.query(
+            existing_profiles_query,
+            params={"ids": [article["_id"]["$oid"] for article in data]},
+        )
+    }
+    selected, changed_ids, unchanged_ids = [], [], []
+    for article in data:
+        id = article["_id"]["$oid"]
+        if id not in stored:
+            stats["added"] += 1
+        elif stored[id] != content_hash(article["text"], render_fact_card(article)):
+            stats["changed"] += 1
+            changed_ids.append(id)
+        else:
+            stats["unchanged"] += 1
+            unchanged_ids.append(id)
+            continue
+        selected.append(article)
+    if run and unchanged_ids:
+        graph.query(mark_imported_query, params={"ids": unchanged_ids, "run": run})
+    return selected, changed_ids
+
+
+def import_articles(
+    graph,
+    embedding_stage: EmbeddingStage,
+    chunking_pool: ChunkingPool,
+    path: str = ARTICLES_FILE,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    delta: bool = False,
+    progress: Optional[ImportProgress] = None,
+) -> Dict[str, int]:
+    """
+    Convert, chunk, embed and write articles in bounded micro-batches so that
+    memory use does not grow with the size of the dump. Embedding of batch N+1
+    is in flight while batch N is written to Neo4j.
+
+    In delta mode only new or changed profiles are re-chunked, re-embedded and
+    re-written, stale chunks and edges of changed profiles are dropped and
+    profiles missing from the dump are removed. Every profile in the dump is
+    stamped with the run's id, so the removal needs no list of seen ids.
+
+    Cancelling `progress` stops the import at the next batch boundary.
+    """
+    progress = progress or ImportProgress()
+    stats = {"rows": 0}
+    if delta:
+        stats.update(added=0, changed=0, unchanged=0, removed=0)
+    run = uuid.uuid4().hex
+    pending = None
+    try:
+        batches = batched(get_articles(path), batch_size)
+        while True:
+            with progress.timed("parse"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            progress.check_cancelled()
+            stats["rows"] += len(batch)
+            progress.parsed += len(batch)
+            changed_ids = []
+            if delta:
+                parsed = len(batch)
+                batch, changed_ids = select_changed(
+                    graph, batch, stats, progress, chunking_pool, run
+                )
+                progress.processed += parsed - len(batch)
+                if not batch:
+                    continue
+            params = prepare_params(batch, chunking_pool, progress, run)
+            job = embedding_stage.submit(embedding_texts(params))
+            if pending:
+                write_params(graph, *pending, progress=progress)
+            pending = (params, job, changed_ids)
+        if pending:
+            write_params(graph, *pending, progress=progress)
+            pending = None
+    finally:
+        if pending:
+            pending[1].cancel()
+    # Never prune after a partial run, the unseen profiles may still exist
+    progress.check_cancelled()
+    if delta:
+        stats["removed"] = graph.query(
+            removed_profiles_query, params={"run": run}
+        )[0]["removed"]
+    logging.info(f"Import finished: {stats}")
+    return stats
+
+
+def write_params(
+    graph,
+    params,
+    job: EmbeddingJob,
+    changed_ids: Optional[List[str]] = None,
+    progress: Optional[ImportProgress] = None,
+):
+    progress = progress or ImportProgress()
+    with progress.timed("embed"):
+        attach_all_embeddings(params, job.result())
+    progress.chunks_embedded += sum(len(param["chunks"]) for param in params)
+    with progress.timed("write"):
+        if changed_ids:
+            graph.query(stale_profile_cleanup_query, params={"ids": changed_ids})
+        write_profiles(graph, params)
+    progress.rows_written += len(params)
+    progress.processed += len(params)
+    logging.info(f"Imported batch of {len(params)} articles.")
+
+
+existing_profiles_query = """
+UNWIND $ids AS id
+MATCH (j:JobProfile {id: id})
+RETURN j.id AS id, j.contentHash AS contentHash
+"""
+
+# Chunks and outgoing edges of changed profiles are rebuilt from scratch
+stale_profile_cleanup_query = """
+UNWIND $ids AS id
+MATCH (j:JobProfile {id: id})
+OPTIONAL MATCH (j)-[:HAS_CHUNK]->(c:Chunk)
+WITH j, collect(c) AS chunks
+FOREACH (c IN chunks | DETACH DELETE c)
+WITH j
+MATCH (j)-[r]->()
+DELETE r
+"""
+
+mark_imported_query = """
+UNWIND $ids AS id
+MATCH (j:JobProfile {id: id})
+SET j.lastImport = $run
+"""
+
+# Profiles this run did not stamp, deleted in batches so a large removal
+# does not build up one huge transaction
+removed_profiles_query = """
+MATCH (j:JobProfile)
+WHERE j.lastImport IS NULL OR j.lastImport <> $run
+CALL {
+  WITH j
+  OPTIONAL MATCH (j)-[:HAS_CHUNK]->(c:Chunk)
+  WITH j, collect(c) AS chunks
+  FOREACH (c IN chunks | DETACH DELETE c)
+  DETACH DELETE j
+} IN TRANSACTIONS OF 1000 ROWS
+RETURN count(j) AS removed
 """
@@ -0,0 +1,378 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cypher_guard import CYPHER_GUARD_ROW_LIMIT
+from retrieval_filters import MentionIndex, mention_phrases, normalize_text
+
+INTENT_ROUTER_ENABLED = os.environ.get("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+# Share of the question's content words a route has to explain
+INTENT_ROUTER_MIN_CONFIDENCE = float(os.environ.get("INTENT_ROUTER_MIN_CONFIDENCE", 0.75))
+# Never more rows than the Cypher guard lets generated queries return
+INTENT_ROUTER_MAX_LIMIT = min(20, CYPHER_GUARD_ROW_LIMIT)
+
+vocabulary_query = """
+RETURN COLLECT { MATCH (j:JobProfile) RETURN DISTINCT j.jobRole } AS jobRoles,
+       COLLECT { MATCH (j:JobProfile) RETURN DISTINCT j.sector } AS sectors,
+       COLLECT { MATCH (j:JobProfile) RETURN DISTINCT j.collegeCategory } AS collegeCategories,
+       COLLECT { MATCH (g:GeographicDetail) RETURN DISTINCT g.option } AS geographicOptions,
+       COLLECT { MATCH (a:Aptitude) RETURN DISTINCT a.attribute } AS aptitudes,
+       COLLECT { MATCH (i:Interest) RETURN DISTINCT i.attribute } AS interests,
+       COLLECT { MATCH (v:Value) RETURN DISTINCT v.attribute } AS values
+"""
+
+# Slot field to the vocabulary_query column its values come from
+VOCABULARY_FIELDS = {
+    "jobRole": "jobRoles",
+    "sector": "sectors",
+    "collegeCategory": "collegeCategories",
+    "geographicOption": "geographicOptions",
+    "aptitude": "aptitudes",
+    "interest": "interests",
+    "value": "values",
+}
+
+# Node label holding each slot field's values
+FIELD_LABELS = {
+    "jobRole": "JobProfile",
+    "sector": "JobProfile",
+    "collegeCategory": "JobProfile",
+    "geographicOption": "GeographicDetail",
+    "aptitude": "Aptitude",
+    "interest": "Interest",
+    "value": "Value",
+}
+
+# Words that say nothing about which intent is meant
+NEUTRAL_WORDS = set(
+    """
+    a about an and any are as at be become being best by can could degree detail
+    details do does excel excelling field for from get give good how i in industry info
+    information is it job jobs kind known like list looking me most my need needed
+    needs notable of offer offering offers on or please position profession recognized
+    require required requires role roles s sector should show some tell the their them
+    there these they this those to top type typical typically up want what which who
+    with work working would you your
+    """.split()
+)
+
+
+class Intent(NamedTuple):
+    name: str
+    # Matched on the question with the recognised entities blanked out
+    trigger: "re.Pattern"
+    required: Tuple[str, ...]
+    optional: Tuple[str, ...]
+    # Slots whose presence means the question is about something else
+    excluded: Tuple[str, ...]
+    query: str
+    heading: str
+    line: str
+    limit: int = 5
+
+
+_employer_words = r"\b(employers?|compan(y|ies)|firms?|organi[sz]ations?|hir\w*|recruit\w*)\b"
+_salary_words = r"\b(salar(y|ies)|pay|pays|paid|paying|earn\w*|income|wages?|ctc|package)\b"
+_role_words = r"\b(roles?|jobs?|careers?|professions?|occupations?)\b"
+
+# Curated, pre-planned queries for the question shapes in the Cypher
+# generation prompt's examples
+INTENTS = [
+    Intent(
+        "top_aptitudes",
+        re.compile(r"\b(aptitudes?|skills?|abilit(y|ies)|strengths?)\b"),
+        ("jobRole",), (), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[r:HAS_APTITUDE]->(a:Aptitude)
+        RETURN a.attribute AS attribute, r.score AS score ORDER BY r.score DESC LIMIT $limit
+        """,
+        "Top aptitudes for {jobRole}", "{attribute} (score {score})",
+    ),
+    Intent(
+        "top_interests",
+        re.compile(r"\binterests?\b"),
+        ("jobRole",), (), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[r:HAS_INTEREST]->(i:Interest)
+        RETURN i.attribute AS attribute, r.score AS score ORDER BY r.score DESC LIMIT $limit
+        """,
+        "Top interests for {jobRole}", "{attribute} (score {score})",
+    ),
+    Intent(
+        "top_values",
+        re.compile(r"\b(values?|motivat\w*)\b"),
+        ("jobRole",), (), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[r:HAS_VALUE]->(v:Value)
+        RETURN v.attribute AS attribute, r.score AS score ORDER BY r.score DESC LIMIT $limit
+        """,
+        "Top work values for {jobRole}", "{attribute} (score {score})",
+    ),
+    Intent(
+        "salary",
+        re.compile(_salary_words),
+        ("jobRole",), ("geographicOption",), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[r:HAS_GEOGRAPHIC_DETAIL]->(g:GeographicDetail)
+        WHERE $geographicOption IS NULL OR g.option = $geographicOption
+        RETURN g.option AS option, r.estimatedSalaryRange AS salaryRange,
+               r.jobAvailability AS availability
+        ORDER BY g.option LIMIT $limit
+        """,
+        "Salary for {jobRole}", "{option}: {salaryRange} (job availability: {availability})",
+    ),
+    Intent(
+        "employers_by_role",
+        re.compile(_employer_words),
+        ("jobRole",), (), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[:EMPLOYED_BY]->(e:Employer)
+        RETURN DISTINCT e.name AS name, e.description AS description LIMIT $limit
+        """,
+        "Employers hiring for {jobRole}", "{name}: {description}",
+        limit=10,
+    ),
+    Intent(
+        "employers_by_sector",
+        re.compile(_employer_words),
+        ("sector",), (), ("jobRole",),
+        """
+        MATCH (j:JobProfile)-[:EMPLOYED_BY]->(e:Employer) WHERE j.sector = $sector
+        RETURN DISTINCT e.name AS name, e.description AS description LIMIT $limit
+        """,
+        "Employers hiring in {sector}", "{name}: {description}",
+        limit=10,
+    ),
+    Intent(
+        "highest_paid_role",
+        re.compile(
+            r"\b((highest|best|top|most)\s+(paid|paying|salar(y|ies))|pays?\s+(the\s+)?most"
+            r"|(highest|maximum|max)\s+(pay|income|earnings?))\b"
+        ),
+        (), ("collegeCategory", "sector", "geographicOption"), ("jobRole",),
+        """
+        MATCH (j:JobProfile)-[r:HAS_GEOGRAPHIC_DETAIL]->(g:GeographicDetail)
+        WHERE ($collegeCategory IS NULL OR j.collegeCategory = $collegeCategory)
+          AND ($sector IS NULL OR j.sector = $sector)
+          AND ($geographicOption IS NULL OR g.option = $geographicOption)
+          AND r.maximumSalary IS NOT NULL
+        RETURN j.jobRole AS jobRole, g.option AS option, r.estimatedSalaryRange AS salaryRange
+        ORDER BY r.maximumSalary DESC LIMIT $limit
+        """,
+        "Highest paid roles", "{jobRole} in {option}: {salaryRange}",
+        limit=1,
+    ),
+    Intent(
+        "education",
+        re.compile(
+            r"\b(qualifications?|qualif\w*|educat\w*|degrees?|stud(y|ies)|courses?|prepar\w*"
+            r"|training)\b"
+        ),
+        ("jobRole",), (), (),
+        """
+        MATCH (j:JobProfile {jobRole: $jobRole})-[r:ForRole]->(p:PrepareForRole)
+        RETURN p.heading AS heading, r.educationVsDegree AS educationVsDegree,
+               r.trainingNeeded AS trainingNeeded LIMIT $limit
+        """,
+        "Preparing for {jobRole}", "{heading}: {educationVsDegree} Training: {trainingNeeded}",
+        limit=1,
+    ),
+] + [
+    Intent(
+        f"roles_by_{field}",
+        re.compile(_role_words),
+        (field,), (), ("jobRole",),
+        f"""
+        MATCH (j:JobProfile)-[r:{relationship}]->(:{label} {{attribute: ${field}}})
+        RETURN j.jobRole AS jobRole, r.score AS score ORDER BY r.score DESC LIMIT $limit
+        """,
+        f"Roles rated highest for {{{field}}}", "{jobRole} (score {score})",
+    )
+    for field, label, relationship in (
+        ("aptitude", "Aptitude", "HAS_APTITUDE"),
+        ("interest", "Interest", "HAS_INTEREST"),
+        ("value", "Value", "HAS_VALUE"),
+    )
+]
+
+
+class Route(NamedTuple):
+    intent: Intent
+    params: Dict
+    confidence: float
+
+
+class IntentRouter:
+    """
+    Answers the common question shapes with curated parameterized Cypher
+    instead of LLM-generated Cypher. Entities are recognised by phrase
+    matching against the graph's job roles, sectors, college categories,
+    geographic options and Aptitude/Interest/Value attributes; an intent
+    needs one of its trigger words and all its required slots.
+
+    The confidence of a route is the share of the question's content words
+    explained by its entities, trigger and limit. Questions that match no
+    intent or several, repeat a slot with different values, fall below the
+    confidence threshold or return no rows are left to the generative chain.
+    """
+
+    def __init__(
+        self,
+        intents: List[Intent] = INTENTS,
+        min_confidence: float = INTENT_ROUTER_MIN_CONFIDENCE,
+        enabled: bool = INTENT_ROUTER_ENABLED,
+    ):
+        self.intents = intents
+        self.min_confidence = min_confidence
+        self.enabled = enabled
+        self.vocabulary = MentionIndex()
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.vocabulary)
+
+    def refresh(self, graph) -> None:
+        rows = graph.query(vocabulary_query)
+        phrases = []
+        for field, column in VOCABULARY_FIELDS.items():
+            phrases.extend(
+                mention_phrases(field, {value for value in rows[0][column] if value})
+            )
+        self.vocabulary = MentionIndex(phrases)
+        logging.info(f"Loaded intent router vocabulary with {len(phrases)} phrases.")
+
+    def _count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _fallback(self, question: str, reason: str) -> None:
+        self._count(f"fallback.{reason}")
+        logging.info(f"Intent router fell back ({reason}): {question}")
+
+    @staticmethod
+    def _confidence(text: str, covered: List[Tuple[int, int]]) -> float:
+        words = [
+            (match.start(), match.group())
+            for match in re.finditer(r"\S+", text)
+            if match.group() not in NEUTRAL_WORDS
+        ]
+        if not words:
+            return 1.0
+        explained = sum(
+            1 for start, _ in words if any(a <= start < b for a, b in covered)
+        )
+        return explained / len(words)
+
+    def route(self, question: str) -> Optional[Route]:
+        if not self.enabled or not self.ready:
+            return None
+        text = normalize_text(question)
+        mentions = self.vocabulary.find(text)
+        slots: Dict[str, str] = {}
+        for _, _, field, value in mentions:
+            if slots.setdefault(field, value) != value:
+                self._fallback(question, "repeated_slot")
+                return None
+        # Triggers must not fire on entity names like "Numerical Aptitude"
+        blanked = text
+        for start, stop, _, _ in mentions:
+            blanked = blanked[:start] + " " * (stop - start) + blanked[stop:]
+        # Only "top 5" and the like; "grew since 2015" is not a limit
+        limit_match = re.search(r"\b(?:top|first|best)\s+(\d+)\b", blanked)
+        limit_span = [limit_match.span()] if limit_match else []
+
+        candidates = []
+        for intent in self.intents:
+            triggers = [match.span() for match in intent.trigger.finditer(blanked)]
+            if (
+                not triggers
+                or any(field not in slots for field in intent.required)
+                or any(field in slots for field in intent.excluded)
+            ):
+                continue
+            used = intent.required + intent.optional
+            spans = triggers + limit_span + [
+                (start, stop) for start, stop, field, _ in mentions if field in used
+            ]
+            candidates.append((self._confidence(text, spans), intent))
+        if not candidates:
+            self._fallback(question, "no_intent")
+            return None
+        if len(candidates) > 1:
+            self._fallback(question, "ambiguous")
+            return None
+        confidence, intent = candidates[0]
+        if confidence < self.min_confidence:
+            self._fallback(question, "low_confidence")
+            return None
+        limit = intent.limit
+        if limit_match:
+            limit = max(1, min(int(limit_match.group(1)), INTENT_ROUTER_MAX_LIMIT))
+        params = {field: slots.get(field) for field in intent.required + intent.optional}
+        params["limit"] = limit
+        self._count(f"routed.{intent.name}")
+        logging.info(
+            f"Intent router chose {intent.name} ({confidence:.2f}) with {params}: {question}"
+        )
+        return Route(intent, params, confidence)
+
+    def labels(self, question: str) -> List[str]:
+        """
+        Labels of the entities the question mentions
+        """
+        mentions = self.vocabulary.find(normalize_text(question))
+        return sorted({FIELD_LABELS[field] for _, _, field, _ in mentions})
+
+    def render(self, route: Route, rows: List[Dict]) -> Optional[str]:
+        if not rows:
+            return None
+        intent = route.intent
+        heading = intent.heading.format(**route.params)
+        scope = [route.params[field] for field in intent.optional if route.params[field]]
+        if scope:
+            heading += f" ({', '.join(scope)})"
+        return heading + ":\n" + "\n".join(f"- {intent.line.format(**row)}" for row in rows)
+
+    def answer(self, question: str, graph) -> Optional[str]:
+        """
+        The curated answer to the question, or None to use the generative chain
+        """
+        route = self.route(question)
+        if route is None:
+            return None
+        try:
+            answer = self.render(route, graph.query(route.intent.query, route.params))
+        except Exception:
+            logging.exception(f"Curated query for {route.intent.name} failed")
+            answer = None
+        if answer is None:
+            self._fallback(question, "no_rows")
+        return answer
+
+    async def aanswer(self, question: str, async_graph) -> Optional[str]:
+        route = self.route(question)
+        if route is None:
+            return None
+        try:
+            answer = self.render(
+                route, await async_graph.query(route.intent.query, route.params)
+            )
+        except Exception:
+            logging.exception(f"Curated query for {route.intent.name} failed")
+            answer = None
+        if answer is None:
+            self._fallback(question, "no_rows")
+        return answer
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "ready": self.ready,
+                "minConfidence": self.min_confidence,
+                **self.counts,
+            }
@@ -0,0 +1,37 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+import numpy as np
+
+LATENCY_WINDOW = 1000
+
+
+class LatencyRecorder:
+    """
+    Rolling per-name latency samples with outcome counts, e.g. one name per
+    retrieval branch
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self.outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, outcome: str = "ok") -> None:
+        with self.lock:
+            self.samples[name].append(seconds)
+            self.outcomes[name][outcome] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        with self.lock:
+            stats = {}
+            for name, samples in self.samples.items():
+                values = np.asarray(samples) * 1000
+                stats[name] = {
+                    **self.outcomes[name],
+                    "p50_ms": round(float(np.percentile(values, 50)), 1),
+                    "p95_ms": round(float(np.percentile(values, 95)), 1),
+                    "mean_ms": round(float(values.mean()), 1),
+                }
+            return stats
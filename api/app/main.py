@@ -1,16 +1,36 @@
+import asyncio
+import json
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-from chat import chain
-from fastapi import FastAPI, HTTPException
+from chat import ChainInput, answer_cache, chain, retrieval_latency
+from chat_batch import CHAT_BATCH_CONCURRENCY, CHAT_BATCH_MAX_CONCURRENCY, answer_batch
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from graph_prefiltering import prefiltering_agent_executor
-from importing import get_articles, import_cypher_query, process_params
+from import_jobs import ImportAlreadyRunning, ImportJob, ImportJobManager
+from importing import count_articles, import_articles
 from langserve import add_routes
 from text2cypher import text2cypher_chain
-from utils import graph, remove_null_properties, token_cost_process, setup_indices
+from utils import (
+    async_graph,
+    chunking_pool,
+    cypher_cache,
+    cypher_guard,
+    embedding_cache,
+    embedding_stage,
+    entity_resolver,
+    graph,
+    graph_schema,
+    intent_router,
+    profile_catalog,
+    remove_null_properties,
+    token_cost_process,
+    vector_mirror,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -30,24 +50,170 @@ app.add_middleware(
 )
 
 
-@app.get("/import_articles/")
-def import_articles_endpoint() -> int:
-    # if not article_data.query and not article_data.tag:
-    #     raise HTTPException(
-    #         status_code=500, detail="Either `query` or `tag` must be provided"
-    #     )
+@app.on_event("shutdown")
+async def close_async_graph():
+    await async_graph.close()
 
-    data = get_articles()
-    
-    # logging.info(f"Articles fetched: {len(data)} articles.")
+
+def _graph_changed(stats: Optional[Dict]) -> bool:
+    # Delta imports report what they touched; anything else may have changed the graph
+    if stats is None or "added" not in stats:
+        return True
+    return any(stats[key] for key in ("added", "changed", "removed"))
+
+
+def _refresh_after_import(stats: Optional[Dict]) -> None:
+    """
+    Reload what is derived from the graph. A failing refresh is logged, so it
+    cannot replace the import's own outcome.
+    """
+    refreshes = [
+        ("vector mirror", vector_mirror.refresh),
+        ("profile catalog", profile_catalog.refresh),
+        ("intent router", intent_router.refresh),
+        ("entity resolver", entity_resolver.refresh),
+        # Only introspected again if labels, types or property keys changed;
+        # cached Cypher is dropped on its next use when it was
+        ("graph schema", graph_schema.refresh),
+    ]
+    for name, refresh in refreshes:
+        try:
+            refresh(graph)
+        except Exception:
+            logging.exception(f"Refreshing the {name} after import failed")
+    if _graph_changed(stats):
+        answer_cache.invalidate()
+
+
+def run_import_job(job: ImportJob) -> Dict:
+    # Counted without decoding for NDJSON; array dumps run without an ETA
+    # rather than being parsed twice
+    job.progress.total = count_articles(progress=job.progress)
+    stats = None
+    try:
+        stats = import_articles(
+            graph, embedding_stage, chunking_pool, delta=job.delta, progress=job.progress
+        )
+    finally:
+        # Even a cancelled or failed import may have changed some chunks
+        _refresh_after_import(stats)
+    logging.info(f"Article import executed successfully: {stats['rows']} rows processed.")
+    logging.info(f"Embedding cache: {embedding_cache.stats()}")
+    return stats
+
+
+import_jobs = ImportJobManager(run_import_job)
+
+
+def _start_import_job(delta: bool) -> ImportJob:
     try:
-        params = process_params(data)
-    except Exception as e:
-        # You could log the exception here if needed
-        raise HTTPException(status_code=500, detail=e)
-    graph.query(import_cypher_query, params={"data": params})
-    logging.info(f"Article import query executed successfully.")
-    return len(params)
+        return import_jobs.start(delta)
+    except ImportAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=f"Import job {e} is already running")
+
+
+def _get_import_job(job_id: str) -> ImportJob:
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown import job {job_id}")
+    return job
+
+
+@app.get("/import_articles/")
+def import_articles_endpoint(delta: bool = False) -> Dict:
+    """
+    Runs an import and waits for it; prefer POST /import_jobs/ for large dumps
+    """
+    job = _start_import_job(delta)
+    job.done.wait()
+    if job.status != "succeeded":
+        raise HTTPException(status_code=500, detail=job.error or job.status)
+    return job.result
+
+
+@app.post("/import_jobs/", status_code=202)
+def create_import_job(delta: bool = False) -> Dict:
+    return _start_import_job(delta).snapshot()
+
+
+@app.get("/import_jobs/{job_id}")
+def get_import_job(job_id: str) -> Dict:
+    return _get_import_job(job_id).snapshot()
+
+
+@app.post("/import_jobs/{job_id}/cancel")
+def cancel_import_job(job_id: str) -> Dict:
+    job = _get_import_job(job_id)
+    import_jobs.cancel(job_id)
+    return job.snapshot()
+
+
+@app.get("/import_jobs/{job_id}/events")
+async def stream_import_job(job_id: str):
+    """
+    Server-sent progress events, one per second until the job finishes
+    """
+    job = _get_import_job(job_id)
+
+    async def events():
+        while True:
+            finished = job.done.is_set()
+            yield f"data: {json.dumps(job.snapshot())}\n\n"
+            if finished:
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.get("/embedding_cache/")
+def embedding_cache_stats() -> Dict:
+    return embedding_cache.stats()
+
+
+@app.get("/vector_mirror/")
+def vector_mirror_stats() -> Dict:
+    return vector_mirror.stats()
+
+
+@app.get("/answer_cache/")
+def answer_cache_stats() -> Dict:
+    return answer_cache.stats()
+
+
+@app.get("/cypher_cache/")
+def cypher_cache_stats() -> Dict:
+    return cypher_cache.stats()
+
+
+@app.get("/intent_router/")
+def intent_router_stats() -> Dict:
+    return intent_router.stats()
+
+
+@app.get("/cypher_guard/")
+def cypher_guard_stats() -> Dict:
+    return cypher_guard.stats()
+
+
+@app.get("/entity_resolver/")
+def entity_resolver_stats() -> Dict:
+    return entity_resolver.stats()
+
+
+@app.get("/graph_schema/")
+def graph_schema_stats() -> Dict:
+    return graph_schema.stats()
+
+
+@app.get("/retrieval_latency/")
+def retrieval_latency_stats() -> Dict:
+    """
+    Per-branch chat retrieval latency; "total" is the wall time of both
+    """
+    return retrieval_latency.stats()
 
 @app.get("/fetch_network/")
 def fetch_network() -> Dict:
@@ -110,6 +276,24 @@ RETURN {
 
 add_routes(app, chain, path="/chat", enabled_endpoints=["stream_log"])
 
+
+@app.post("/chat/batch")
+async def chat_batch(
+    inputs: List[ChainInput],
+    concurrency: int = Query(CHAT_BATCH_CONCURRENCY, ge=1, le=CHAT_BATCH_MAX_CONCURRENCY),
+):
+    """
+    Answers a list of chat inputs, streamed back as NDJSON in completion
+    order with the input index and per-item timings
+    """
+
+    async def lines():
+        async for result in answer_batch(inputs, concurrency):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/chat/stream_log")
 def fetch_stream_log() -> str:
     print("Fetching stream log...")
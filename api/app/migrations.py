@@ -0,0 +1,227 @@
+import argparse
+import json
+import logging
+from typing import Dict, List, NamedTuple
+
+from embedding import EMBEDDING_DIMENSIONS
+
+index_name = "jobProfile_vector"
+keyword_index_name = "jobProfile_fulltext"
+chunk_index_name = "chunk_vector"
+chunk_fulltext_index_name = "chunk_fulltext"
+fact_card_index_name = "fact_card_vector"
+entity_index_name = "entity"
+
+# Canonical names questions refer to, resolved by entity_resolution
+ENTITY_NAME_PROPERTIES = {
+    "JobProfile": "jobRole",
+    "Employer": "name",
+    "CareerPathway": "title",
+    "JobRole": "title",
+    "Aptitude": "attribute",
+    "Interest": "attribute",
+    "Value": "attribute",
+}
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: List[str]
+
+
+def unique_constraint(label: str, *props: str) -> str:
+    name = f"{label[0].lower()}{label[1:]}_{'_'.join(props)}_unique"
+    keys = ", ".join(f"n.{prop}" for prop in props)
+    if len(props) > 1:
+        keys = f"({keys})"
+    return f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE {keys} IS UNIQUE"
+
+
+def node_index(label: str, prop: str) -> str:
+    name = f"{label[0].lower()}{label[1:]}_{prop}"
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})"
+
+
+def relationship_index(type: str, prop: str) -> str:
+    name = f"{type.lower()}_{prop}"
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR ()-[r:{type}]-() ON (r.{prop})"
+
+
+# Append new migrations at the end; applied versions are recorded in the graph
+MIGRATIONS = [
+    Migration(
+        1,
+        "Role lookup, keyword and vector indexes",
+        [
+            "CREATE INDEX jobRole_Range IF NOT EXISTS FOR (n:`JobProfile`) ON (n.jobRole)",
+            f"CREATE FULLTEXT INDEX {keyword_index_name} IF NOT EXISTS FOR (n:JobProfile) ON EACH [n.text]",
+            f"""CREATE VECTOR INDEX {index_name} IF NOT EXISTS
+    FOR (n: JobProfile) ON (n.embedding)
+    OPTIONS {{indexConfig: {{
+    `vector.dimensions`: {EMBEDDING_DIMENSIONS},
+    `vector.similarity_function`: 'cosine'
+    }}}}""",
+        ],
+    ),
+    Migration(
+        2,
+        "Uniqueness constraints for every import MERGE key",
+        [
+            unique_constraint("JobProfile", "id"),
+            unique_constraint("Chunk", "id"),
+            unique_constraint("PrepareForRole", "heading"),
+            unique_constraint("ReasonLiked", "reason"),
+            unique_constraint("ReasonDisliked", "reason"),
+            unique_constraint("Aptitude", "attribute"),
+            unique_constraint("Interest", "attribute"),
+            unique_constraint("Value", "attribute"),
+            unique_constraint("CareerPathway", "title"),
+            unique_constraint("JobRole", "title", "years"),
+            unique_constraint("Employer", "name"),
+            unique_constraint("EmployerProfile", "geographicOption"),
+            unique_constraint("GeographicDetail", "option"),
+        ],
+    ),
+    Migration(
+        3,
+        "Indexes for filters and sorts used by the Cypher generation examples",
+        [
+            node_index("JobProfile", "sector"),
+            node_index("JobProfile", "collegeCategory"),
+            relationship_index("HAS_GEOGRAPHIC_DETAIL", "maximumSalary"),
+            relationship_index("HAS_GEOGRAPHIC_DETAIL", "minimumSalary"),
+            relationship_index("HAS_APTITUDE", "score"),
+            relationship_index("HAS_INTEREST", "score"),
+            relationship_index("HAS_VALUE", "score"),
+        ],
+    ),
+    Migration(
+        4,
+        "Vector index over chunk embeddings",
+        [
+            f"""CREATE VECTOR INDEX {chunk_index_name} IF NOT EXISTS
+    FOR (n: Chunk) ON (n.embedding)
+    OPTIONS {{indexConfig: {{
+    `vector.dimensions`: {EMBEDDING_DIMENSIONS},
+    `vector.similarity_function`: 'cosine'
+    }}}}""",
+        ],
+    ),
+    Migration(
+        5,
+        "Fulltext index over chunk text for hybrid search",
+        [
+            f"CREATE FULLTEXT INDEX {chunk_fulltext_index_name} IF NOT EXISTS FOR (n:Chunk) ON EACH [n.text]",
+        ],
+    ),
+    Migration(
+        6,
+        "Vector index over JobProfile fact card embeddings",
+        [
+            f"""CREATE VECTOR INDEX {fact_card_index_name} IF NOT EXISTS
+    FOR (n: JobProfile) ON (n.factCardEmbedding)
+    OPTIONS {{indexConfig: {{
+    `vector.dimensions`: {EMBEDDING_DIMENSIONS},
+    `vector.similarity_function`: 'cosine'
+    }}}}""",
+        ],
+    ),
+    Migration(
+        7,
+        "Fulltext index over entity names for entity resolution fallback",
+        [
+            f"CREATE FULLTEXT INDEX {entity_index_name} IF NOT EXISTS "
+            f"FOR (n:{'|'.join(ENTITY_NAME_PROPERTIES)}) "
+            f"ON EACH [{', '.join(sorted({f'n.{prop}' for prop in ENTITY_NAME_PROPERTIES.values()}))}]",
+        ],
+    ),
+]
+
+
+def schema_version(graph) -> int:
+    result = graph.query(
+        "MATCH (m:_SchemaMigration) RETURN coalesce(max(m.version), 0) AS version"
+    )
+    return result[0]["version"] if result else 0
+
+
+def apply_migrations(graph, migrations: List[Migration] = MIGRATIONS) -> int:
+    """
+    Apply migrations newer than the recorded schema version. Every statement
+    is idempotent, so re-running a partially applied migration is safe.
+    """
+    current = schema_version(graph)
+    for migration in migrations:
+        if migration.version <= current:
+            continue
+        logging.info(f"Applying schema migration {migration.version}: {migration.description}")
+        for statement in migration.statements:
+            graph.query(statement)
+        graph.query(
+            "MERGE (m:_SchemaMigration {version: $version}) "
+            "SET m.description = $description, m.appliedAt = datetime()",
+            {"version": migration.version, "description": migration.description},
+        )
+        current = migration.version
+    return current
+
+
+def _declared_name(statement: str) -> str:
+    # CREATE [FULLTEXT|VECTOR] INDEX|CONSTRAINT <name> IF NOT EXISTS ...
+    words = statement.split()
+    return words[words.index("IF") - 1]
+
+
+def verify_schema(graph, migrations: List[Migration] = MIGRATIONS) -> Dict:
+    """
+    Compare declared indexes and constraints with the database. Reports
+    declared ones that are missing or not online, and indexes never read.
+    """
+    declared = {
+        _declared_name(statement)
+        for migration in migrations
+        for statement in migration.statements
+    }
+    constraints = {
+        el["name"]: el["ownedIndex"]
+        for el in graph.query("SHOW CONSTRAINTS YIELD name, ownedIndex")
+    }
+    indexes = graph.query(
+        "SHOW INDEXES YIELD name, type, state, readCount, owningConstraint"
+    )
+    online = {el["name"] for el in indexes if el["state"] == "ONLINE"}
+    online |= {name for name, owned in constraints.items() if owned in online}
+    return {
+        "version": schema_version(graph),
+        "latest": migrations[-1].version,
+        "missing": sorted(declared - online),
+        "unused": sorted(
+            el["name"]
+            for el in indexes
+            if el["type"] != "LOOKUP"
+            and not el["owningConstraint"]
+            and not el["readCount"]
+        ),
+        "undeclared": sorted(
+            el["name"]
+            for el in indexes
+            if el["type"] != "LOOKUP"
+            and not el["owningConstraint"]
+            and el["name"] not in declared
+        ),
+    }
+
+
+if __name__ == "__main__":
+    from langchain_community.graphs import Neo4jGraph
+
+    parser = argparse.ArgumentParser(description="Manage the Neo4j schema")
+    parser.add_argument("command", choices=["apply", "verify"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    graph = Neo4jGraph(refresh_schema=False)
+    if args.command == "apply":
+        print(f"Schema version: {apply_migrations(graph)}")
+    print(json.dumps(verify_schema(graph), indent=2, default=str))
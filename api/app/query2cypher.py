@@ -1,7 +1,6 @@
 import re
 from typing import List, Optional, Union
 
-from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 from langchain_core.messages import (
     AIMessage,
     SystemMessage,
@@ -16,16 +15,9 @@ from langchain_core.prompts import (
 )
 from langchain_core.pydantic_v1 import BaseModel
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
-from utils import Entities, entity_chain, graph, llm
+from utils import Entities, cypher_guard, entity_chain, graph, graph_schema, llm
 from prompt import CYPHER_GENERATION_PROMPT_TEMPLATE
 
-# Cypher validation tool for relationship directions
-corrector_schema = [
-    Schema(el["start"], el["type"], el["end"])
-    for el in graph.structured_schema.get("relationships")
-]
-cypher_validation = CypherQueryCorrector(corrector_schema)
-
 CYPHER_GENERATION_PROMPT = PromptTemplate.from_template(CYPHER_GENERATION_PROMPT_TEMPLATE)
 
 cypher_response = CYPHER_GENERATION_PROMPT | llm
@@ -48,7 +40,7 @@ response_prompt = ChatPromptTemplate.from_messages(
 text2cypher_chain = (
     RunnablePassthrough.assign(query=cypher_response)
     | RunnablePassthrough.assign(
-        response=lambda x: graph.query(cypher_validation(x["query"])),
+        response=lambda x: cypher_guard.run(graph, graph_schema.correct(x["query"].content)),
     )
     | response_prompt
     | llm
@@ -0,0 +1,305 @@
+import logging
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+from entity_resolution import names_query
+
+# Below this share of chunks a filtered search scores the matching chunks
+# exactly; above it the index is searched with oversampling and the hits
+# post-filtered
+FILTER_EXACT_SELECTIVITY = float(os.environ.get("FILTER_EXACT_SELECTIVITY", 0.05))
+FILTER_MAX_OVERSAMPLE = int(os.environ.get("FILTER_MAX_OVERSAMPLE", 10))
+RETRIEVAL_FILTER_EXTRACTION = (
+    os.environ.get("RETRIEVAL_FILTER_EXTRACTION", "true").lower() == "true"
+)
+# Places a result whose profile matches an ambiguous filter mention moves up
+FILTER_BOOST_RANKS = int(os.environ.get("FILTER_BOOST_RANKS", 3))
+
+PROFILE_FILTER_FIELDS = ("sector", "subSector", "collegeCategory", "experienceLevel")
+
+# Phrasings of GeographicDetail options and college categories that do not
+# spell out the stored value
+FILTER_ALIASES = {
+    "geographicOption": {
+        "Large Cities": ["large city", "big city", "big cities", "metro", "metros"],
+        "Medium & Small Cities": [
+            "small city", "small cities", "medium city", "medium cities", "mid sized city",
+            "tier 2",
+        ],
+        "Towns & Villages": ["town", "towns", "village", "villages", "rural"],
+    },
+    "collegeCategory": {
+        "Non-College": [
+            "non college", "without college", "without a college", "no college",
+            "not need a college", "don t need a college", "no degree", "without a degree",
+        ],
+    },
+}
+
+catalog_query = """
+MATCH (j:JobProfile)
+RETURN j.id AS id, j.jobRole AS jobRole, j.sector AS sector, j.subSector AS subSector,
+       j.collegeCategory AS collegeCategory, j.experienceLevel AS experienceLevel,
+       coalesce(j.deleted, false) AS deleted,
+       [(j)-[:HAS_GEOGRAPHIC_DETAIL]->(g:GeographicDetail) | g.option] AS geographicOptions,
+       size([(j)-[:HAS_CHUNK]->(c:Chunk) | c]) AS chunks
+"""
+
+
+class RetrievalFilters(BaseModel):
+    sector: Optional[str] = Field(description="JobProfile sector")
+    subSector: Optional[str] = Field(description="JobProfile sub-sector")
+    collegeCategory: Optional[str] = Field(description="College or Non-College")
+    experienceLevel: Optional[str] = Field(description="JobProfile experience level")
+    geographicOption: Optional[str] = Field(description="GeographicDetail option")
+    deleted: Optional[bool] = Field(description="Only (not) deleted profiles")
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self.dict().values())
+
+    def merge(self, other: Optional["RetrievalFilters"]) -> "RetrievalFilters":
+        """
+        These filters with unset fields taken from `other`
+        """
+        if other is None:
+            return self
+        return RetrievalFilters(
+            **{key: value if value is not None else getattr(other, key)
+               for key, value in self.dict().items()}
+        )
+
+
+class ExtractedFilters(NamedTuple):
+    # Unambiguous mentions, applied as hard filters
+    filters: RetrievalFilters
+    # Ambiguous ones, only ranking matching profiles higher
+    boosts: RetrievalFilters
+
+
+def filter_predicate(filters: Optional[RetrievalFilters]) -> str:
+    """
+    Cypher predicate on the JobProfile `j`, reading values from $filters
+    """
+    if filters is None:
+        return "true"
+    clauses = [
+        f"j.{field} = $filters.{field}"
+        for field in PROFILE_FILTER_FIELDS
+        if getattr(filters, field) is not None
+    ]
+    if filters.geographicOption is not None:
+        clauses.append(
+            "EXISTS { (j)-[:HAS_GEOGRAPHIC_DETAIL]->"
+            "(:GeographicDetail {option: $filters.geographicOption}) }"
+        )
+    if filters.deleted is not None:
+        clauses.append("coalesce(j.deleted, false) = $filters.deleted")
+    return " AND ".join(clauses) or "true"
+
+
+def oversample_factor(selectivity: float, max_oversample: int = FILTER_MAX_OVERSAMPLE) -> int:
+    """
+    How many times more index hits to fetch so that about the requested
+    number survive post-filtering
+    """
+    if selectivity <= 0:
+        return max_oversample
+    return max(1, min(max_oversample, math.ceil(1.5 / selectivity)))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lower-case words separated by single spaces, padded with a space on
+    both sides so phrases match on whole words
+    """
+    return " " + " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split()) + " "
+
+
+def mention_phrases(field: str, values) -> List[Tuple[str, str, str]]:
+    """
+    Normalized (phrase, field, value) ways of mentioning each value
+    """
+    phrases = []
+    for value in values:
+        # "IT / ITeS (Information Technology ...)" is also asked for as "IT / ITeS"
+        names = {value, value.split(" (")[0]}
+        names.update(FILTER_ALIASES.get(field, {}).get(value, []))
+        if field == "jobRole":
+            # "Companies hiring Software Engineers"
+            names.add(value + "s")
+        phrases.extend((normalize_text(name), field, value) for name in names)
+    return phrases
+
+
+class MentionIndex:
+    """
+    Phrases from mention_phrases keyed by their text, built once per
+    refresh. A question is matched by looking up its word n-grams rather
+    than searching it for every phrase.
+    """
+
+    def __init__(self, phrases: List = ()):
+        # Phrase to (rank, field, value), the first of identical phrases winning
+        self.phrases: Dict[str, Tuple[int, str, str]] = {}
+        for rank, (phrase, field, value) in enumerate(phrases):
+            if phrase.strip():
+                self.phrases.setdefault(phrase, (rank, field, value))
+        self.longest = max((len(phrase.split()) for phrase in self.phrases), default=0)
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def find(self, text: str) -> List[Tuple[int, int, str, str]]:
+        """
+        Non-overlapping (start, stop, field, value) mentions in normalized
+        `text` in order, longer phrases taking precedence, then earlier ones
+        """
+        spans = [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]
+        words = [text[start:stop] for start, stop in spans]
+        candidates = []
+        for i in range(len(words)):
+            for n in range(1, min(self.longest, len(words) - i) + 1):
+                # Phrases carry their surrounding spaces
+                phrase = " " + " ".join(words[i : i + n]) + " "
+                if phrase in self.phrases:
+                    rank, field, value = self.phrases[phrase]
+                    candidates.append((-len(phrase), rank, i, n, field, value))
+        taken: Set[int] = set()
+        mentions = []
+        # Longest phrases first, so "non college" wins over "college"
+        for _, _, i, n, field, value in sorted(candidates, key=lambda c: c[:3]):
+            if taken.isdisjoint(range(i, i + n)):
+                taken.update(range(i, i + n))
+                mentions.append((spans[i][0], spans[i + n - 1][1], field, value))
+        return sorted(mentions)
+
+
+class ProfileCatalog:
+    """
+    Filterable JobProfile properties with chunk counts, kept in memory to
+    estimate filter selectivity and recognise filter values in questions
+    """
+
+    def __init__(self):
+        self.profiles: Dict[str, Dict] = {}
+        self.total_chunks = 0
+        self.phrases: List = []
+        self.vocabulary = MentionIndex()
+        self.ambiguous: Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.profiles)
+
+    def refresh(self, graph) -> None:
+        rows = graph.query(catalog_query)
+        profiles = {row["id"]: row for row in rows}
+        phrases = []
+        for field in PROFILE_FILTER_FIELDS + ("geographicOption",):
+            values = {
+                value
+                for row in rows
+                for value in (
+                    row["geographicOptions"] if field == "geographicOption" else [row[field]]
+                )
+                if value
+            }
+            phrases.extend(mention_phrases(field, values))
+        # Longest phrases first, so "non college" wins over "college"
+        phrases.sort(key=lambda phrase: -len(phrase[0]))
+        # Job roles and entity names mask the filter values inside them, so
+        # "Pharmaceutical Sales Representative" is not a "Sales" filter
+        roles = {row["jobRole"] for row in rows if row["jobRole"]}
+        masks = [(phrase, None, value) for phrase, _, value in mention_phrases("jobRole", roles)]
+        masks.extend(
+            (normalize_text(row["name"]), None, row["name"])
+            for row in graph.query(names_query)
+            if row["name"]
+        )
+        masked = "".join(phrase for phrase, _, _ in masks)
+        # A phrase that is also part of a name or of another filter value,
+        # like "college" in "non college", does not say which one is meant
+        ambiguous = {
+            phrase
+            for phrase, field, value in phrases
+            if phrase in masked
+            or any(
+                phrase in other and (other_field, other_value) != (field, value)
+                for other, other_field, other_value in phrases
+            )
+        }
+        self.profiles, self.phrases, self.ambiguous = profiles, phrases, ambiguous
+        # Filter phrases first, so they win ties with a name of the same length
+        self.vocabulary = MentionIndex(phrases + masks)
+        self.total_chunks = sum(row["chunks"] for row in rows)
+        logging.info(f"Loaded profile catalog with {len(profiles)} profiles.")
+
+    def matches(self, profile: Dict, filters: RetrievalFilters) -> bool:
+        for field in PROFILE_FILTER_FIELDS:
+            value = getattr(filters, field)
+            if value is not None and profile[field] != value:
+                return False
+        if (
+            filters.geographicOption is not None
+            and filters.geographicOption not in profile["geographicOptions"]
+        ):
+            return False
+        return filters.deleted is None or profile["deleted"] == filters.deleted
+
+    def matching(self, filters: RetrievalFilters) -> Set[str]:
+        return {
+            id for id, profile in self.profiles.items() if self.matches(profile, filters)
+        }
+
+    def selectivity(self, profile_ids: Set[str]) -> float:
+        """
+        Share of all chunks that belong to the given profiles
+        """
+        if not self.total_chunks:
+            return 1.0
+        chunks = sum(self.profiles[id]["chunks"] for id in profile_ids)
+        return chunks / self.total_chunks
+
+    def boost(self, documents: List, boosts: Optional[RetrievalFilters], k: int) -> List:
+        """
+        The top `k` documents after moving those whose profile matches
+        `boosts` up FILTER_BOOST_RANKS places
+        """
+        if boosts is None or boosts.is_empty():
+            return documents[:k]
+
+        def rank(item):
+            position, document = item
+            profile = self.profiles.get(document.metadata.get("profileId"))
+            if profile is not None and self.matches(profile, boosts):
+                # Half a place more, so a boosted document passes the one it lands on
+                return position - FILTER_BOOST_RANKS - 0.5
+            return position
+
+        return [document for _, document in sorted(enumerate(documents), key=rank)][:k]
+
+    def extract(self, question: str) -> ExtractedFilters:
+        """
+        Filter values mentioned in the question, matched on whole words
+        outside job role and entity names. A value only becomes a filter
+        when its phrase is unambiguous and some profile matches; otherwise
+        it is a boost.
+        """
+        text = normalize_text(question)
+        filters, boosts = {}, {}
+        mentions = self.vocabulary.find(text)
+        # Longest mention first when a field is mentioned more than once
+        for start, stop, field, value in sorted(mentions, key=lambda m: m[0] - m[1]):
+            if field is None or field in filters or field in boosts:
+                continue
+            if f" {text[start:stop]} " in self.ambiguous:
+                boosts[field] = value
+            else:
+                filters[field] = value
+        if filters and not self.matching(RetrievalFilters(**filters)):
+            boosts, filters = {**filters, **boosts}, {}
+        return ExtractedFilters(RetrievalFilters(**filters), RetrievalFilters(**boosts))
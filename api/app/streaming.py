@@ -0,0 +1,104 @@
+import json
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+READ_CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_SEPARATORS = _WHITESPACE + ","
+
+
+def iter_json_records(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Lazily yield records from a JSON array dump or an NDJSON file.
+
+    Only the record currently being decoded is held in memory, so exports of
+    any size can be streamed with a flat memory profile.
+    """
+    # utf-8-sig drops a leading byte order mark
+    with open(path, "r", encoding="utf-8-sig") as file:
+        is_array = _skip_whitespace(file, chunk_size).startswith("[")
+        file.seek(0)
+        if is_array:
+            yield from _iter_array(file, chunk_size)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def count_json_records(
+    path: str,
+    chunk_size: int = READ_CHUNK_SIZE,
+    check: Optional[Callable[[], None]] = None,
+) -> Optional[int]:
+    """
+    Number of records in an NDJSON file, counted from its non-blank lines
+    without decoding them, calling `check` every few thousand lines. None
+    for a JSON array dump, which cannot be counted without decoding it.
+    """
+    with open(path, "r", encoding="utf-8-sig") as file:
+        if _skip_whitespace(file, chunk_size).startswith("["):
+            return None
+        file.seek(0)
+        count = 0
+        for number, line in enumerate(file):
+            if check is not None and number % 4096 == 0:
+                check()
+            if line.strip():
+                count += 1
+        return count
+
+
+def _skip_whitespace(file, chunk_size: int) -> str:
+    """
+    Read past leading whitespace however many chunks it spans, returning
+    the buffer from the first other character ("" at end of file)
+    """
+    while more := file.read(chunk_size):
+        buffer = more.lstrip(_WHITESPACE)
+        if buffer:
+            return buffer
+    return ""
+
+
+def _iter_array(file, chunk_size: int) -> Iterator[Any]:
+    # The caller checked that the first other character is "["
+    buffer = _skip_whitespace(file, chunk_size)
+    pos = 1
+    eof = False
+    while True:
+        # Skip separators between elements
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos < len(buffer):
+            try:
+                record, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = len(buffer)
+            # A value touching the end of the buffer may still be truncated
+            if end < len(buffer) or eof:
+                yield record
+                buffer, pos = buffer[end:], 0
+                continue
+        if eof:
+            raise ValueError(f"Unterminated JSON array in {file.name}")
+        more = file.read(chunk_size)
+        eof = not more
+        buffer, pos = buffer[pos:] + more, 0
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Group an iterable into lists of at most `size` items.
+    """
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,95 @@
+"""
+CypherTemplateCache question templating, parameterization and invalidation
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from cypher_cache import CypherTemplateCache, QuestionTemplate
+
+PROFILES = {
+    "a": {"jobRole": "Nurse", "sector": "Healthcare", "geographicOptions": ["Large Cities"]},
+    "b": {
+        "jobRole": "Data Entry Clerk",
+        "sector": "IT / ITeS",
+        "geographicOptions": ["Towns & Villages", "Large Cities"],
+    },
+}
+
+SALARY_QUERY = (
+    "MATCH (j:JobProfile {jobRole: 'Nurse'})-[r:HAS_GEOGRAPHIC_DETAIL]->"
+    "(g:GeographicDetail {option: \"Large Cities\"}) RETURN r.estimatedSalaryRange"
+)
+
+
+@pytest.fixture
+def cache():
+    return CypherTemplateCache(SimpleNamespace(profiles=dict(PROFILES)), max_entries=2, enabled=True)
+
+
+def test_template_replaces_entities(cache):
+    nurse = cache.template("Salary of a Nurse in big cities?")
+    clerk = cache.template("salary of a data entry clerk in metros")
+    assert nurse == QuestionTemplate(
+        "salary of a {jobRole} in {geographicOption}",
+        {"jobRole": "Nurse", "geographicOption": "Large Cities"},
+    )
+    assert clerk.key == nurse.key
+    assert clerk.params["jobRole"] == "Data Entry Clerk"
+
+
+def test_template_numbers_repeated_fields(cache):
+    template = cache.template("Compare a Nurse and a Data Entry Clerk")
+    assert template == QuestionTemplate(
+        "compare a {jobRole} and a {jobRole2}",
+        {"jobRole": "Nurse", "jobRole2": "Data Entry Clerk"},
+    )
+
+
+def test_template_follows_catalog_refresh(cache):
+    assert cache.template("jobs for a pilot").params == {}
+    pilot = {"jobRole": "Pilot", "sector": "Aviation", "geographicOptions": []}
+    cache.catalog.profiles = {**PROFILES, "c": pilot}
+    assert cache.template("jobs for a pilot").params == {"jobRole": "Pilot"}
+
+
+def test_parameterize(cache):
+    template = cache.template("Salary of a Nurse in big cities?")
+    assert cache.parameterize(SALARY_QUERY, template) == (
+        "MATCH (j:JobProfile {jobRole: $jobRole})-[r:HAS_GEOGRAPHIC_DETAIL]->"
+        "(g:GeographicDetail {option: $geographicOption}) RETURN r.estimatedSalaryRange"
+    )
+    # Matched with CONTAINS, so not reusable for another role
+    assert cache.parameterize(
+        "MATCH (j:JobProfile) WHERE j.jobRole CONTAINS 'Nur' RETURN j", template
+    ) is None
+    assert cache.parameterize("MERGE (j:JobProfile {jobRole: 'Nurse'})", template) is None
+
+
+def test_store_and_lookup(cache):
+    nurse = cache.template("Salary of a Nurse in big cities?")
+    cache.store(nurse, SALARY_QUERY, "schema v1")
+    clerk = cache.template("salary of a data entry clerk in metros")
+    assert "$jobRole" in cache.lookup(clerk, "schema v1")
+    assert cache.stats()["hits"] == 1
+
+
+def test_schema_change_drops_entries(cache):
+    template = cache.template("Salary of a Nurse in big cities?")
+    cache.store(template, SALARY_QUERY, "schema v1")
+    assert cache.lookup(template, "schema v2") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_evicts_least_recently_used(cache):
+    templates = [
+        QuestionTemplate(f"question {i} about {{jobRole}}", {"jobRole": "Nurse"}) for i in range(3)
+    ]
+    query = "MATCH (j:JobProfile {jobRole: 'Nurse'}) RETURN j"
+    cache.store(templates[0], query, "schema")
+    cache.store(templates[1], query, "schema")
+    cache.lookup(templates[0], "schema")
+    cache.store(templates[2], query, "schema")
+    assert cache.lookup(templates[1], "schema") is None
+    assert cache.lookup(templates[0], "schema") is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,82 @@
+"""
+CypherGuard rewrites and plan decisions, with plans shaped like the
+driver's `ResultSummary.plan`
+"""
+import pytest
+
+from cypher_guard import CypherGuard, CypherRejected
+
+
+def plan(operator, rows, details="", children=()):
+    return {
+        "operatorType": f"{operator}@neo4j",
+        "args": {"EstimatedRows": rows, "Details": details},
+        "identifiers": [],
+        "children": list(children),
+    }
+
+
+@pytest.fixture
+def guard():
+    return CypherGuard(max_rows=1_000_000, max_flagged_rows=100_000, row_limit=100, max_hops=4)
+
+
+def test_rejects_expensive_cartesian_product(guard):
+    explained = plan(
+        "ProduceResults", 10,
+        children=[plan("CartesianProduct", 5e6, children=[plan("NodeByLabelScan", 2000)])],
+    )
+    with pytest.raises(CypherRejected, match="CartesianProduct"):
+        guard.decide("MATCH (a), (b) RETURN a, b", [], explained, "r")
+    assert guard.counts["rejected"] == 1
+
+
+def test_rejects_plan_above_max_rows(guard):
+    explained = plan("ProduceResults", 10, children=[plan("Expand(All)", 2e6)])
+    with pytest.raises(CypherRejected, match="exceeds"):
+        guard.decide("MATCH (j)--(x) RETURN x", [], explained, "r")
+
+
+def test_flags_unbounded_var_length_expand(guard):
+    cheap = plan("ProduceResults", 10, children=[plan("VarLengthExpand(All)", 50, "(j)-[*]->(x)")])
+    decision = guard.decide("MATCH (j)-[*]->(x) RETURN x", [], cheap, "r")
+    assert decision.flags == ["VarLengthExpand(All) (~50 rows)"]
+    assert decision.estimated_rows == 50
+
+    expensive = plan("ProduceResults", 10, children=[plan("VarLengthExpand(All)", 5e5, "(j)-[*]->(x)")])
+    with pytest.raises(CypherRejected):
+        guard.decide("MATCH (j)-[*]->(x) RETURN x", [], expensive, "r")
+
+
+def test_rejects_writes(guard):
+    with pytest.raises(CypherRejected, match="not read-only"):
+        guard.decide("CREATE (j:JobProfile)", [], plan("Create", 1), "w")
+
+
+def test_accepts_cheap_read(guard):
+    explained = plan("ProduceResults", 3, children=[plan("NodeIndexSeek", 3)])
+    decision = guard.decide("MATCH (j:JobProfile) RETURN j", ["added LIMIT 100"], explained, "r")
+    assert decision.flags == []
+    assert guard.counts == {"run": 1, "rewritten": 1, "rejected": 0}
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("MATCH (j)-[*]->(x) RETURN x LIMIT 5", "MATCH (j)-[*..4]->(x) RETURN x LIMIT 5"),
+        ("MATCH (j)-[*2..]->(x) RETURN x LIMIT 5", "MATCH (j)-[*2..4]->(x) RETURN x LIMIT 5"),
+        ("MATCH (j)-[*1..3]->(x) RETURN x LIMIT 5", "MATCH (j)-[*1..3]->(x) RETURN x LIMIT 5"),
+        ("MATCH (j)-[*6..]->(x) RETURN x LIMIT 5", "MATCH (j)-[*6..6]->(x) RETURN x LIMIT 5"),
+    ],
+)
+def test_caps_var_length_patterns(guard, query, expected):
+    assert guard.rewrite(query)[0] == expected
+
+
+def test_limits(guard):
+    assert guard.rewrite("MATCH (j) RETURN j;")[0] == "MATCH (j) RETURN j\nLIMIT 100"
+    assert guard.rewrite("MATCH (j) RETURN j LIMIT 500")[0] == "MATCH (j) RETURN j LIMIT 100"
+    assert guard.rewrite("MATCH (j) RETURN j LIMIT 5") == ("MATCH (j) RETURN j LIMIT 5", [])
+    union, rewrites = guard.rewrite("RETURN 1 AS x UNION RETURN 2 AS x")
+    assert union == "CALL {\nRETURN 1 AS x UNION RETURN 2 AS x\n}\nRETURN * LIMIT 100"
+    assert rewrites == ["wrapped with LIMIT 100"]
@@ -0,0 +1,122 @@
+"""
+EmbeddingStage with the benchmark fake embedder, run from api/app:
+
+    python -m pytest tests
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import embedding
+from benchmarks.fakes import FakeEmbeddings
+from embedding import EmbeddingStage
+
+
+class RecordingEmbeddings(FakeEmbeddings):
+    """
+    Records each batch it is asked for. Earlier batches answer more slowly,
+    so batches finish out of order.
+    """
+
+    def __init__(self):
+        super().__init__(dimensions=8)
+        self.batches = []
+        self.batch_lock = threading.Lock()
+
+    def embed_documents_array(self, texts):
+        with self.batch_lock:
+            self.batches.append(list(texts))
+            slower = max(0, 5 - len(self.batches))
+        time.sleep(0.01 * slower)
+        return super().embed_documents_array(texts)
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """
+    Fails its first `failures` calls with a transient error
+    """
+
+    def __init__(self, failures: int):
+        super().__init__(dimensions=8)
+        self.failures = failures
+        self.attempts = 0
+
+    def embed_documents_array(self, texts):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("rate limited")
+        return super().embed_documents_array(texts)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    # Only the stage's backoff sleeps are recorded instead of slept
+    monkeypatch.setattr(embedding, "time", SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def texts(count: int):
+    return [f"chunk {i}" for i in range(count)]
+
+
+def test_batches_are_at_most_batch_size():
+    fake = RecordingEmbeddings()
+    stage = EmbeddingStage(fake, batch_size=4, max_workers=4)
+    try:
+        stage.embed(texts(10))
+    finally:
+        stage.shutdown()
+    assert sorted(len(batch) for batch in fake.batches) == [2, 4, 4]
+    assert sorted(text for batch in fake.batches for text in batch) == sorted(texts(10))
+
+
+def test_vectors_follow_input_order():
+    fake = RecordingEmbeddings()
+    stage = EmbeddingStage(fake, batch_size=3, max_workers=4)
+    try:
+        vectors = stage.embed(texts(11))
+    finally:
+        stage.shutdown()
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (11, 8)
+    for text, vector in zip(texts(11), vectors):
+        np.testing.assert_array_equal(vector, fake._vector(text))
+
+
+def test_empty_input():
+    stage = EmbeddingStage(FakeEmbeddings(dimensions=8))
+    try:
+        assert stage.embed([]).shape[0] == 0
+    finally:
+        stage.shutdown()
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    fake = FlakyEmbeddings(failures=3)
+    stage = EmbeddingStage(fake, batch_size=8, max_retries=5, backoff_seconds=1.0)
+    try:
+        vectors = stage.embed(texts(5))
+    finally:
+        stage.shutdown()
+    assert fake.attempts == 4
+    assert vectors.shape == (5, 8)
+    # Exponential backoff plus up to one backoff of jitter
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 2 ** attempt <= delay < 2 ** attempt + 1
+
+
+def test_gives_up_after_max_retries(sleeps):
+    fake = FlakyEmbeddings(failures=10)
+    stage = EmbeddingStage(fake, batch_size=8, max_retries=2, backoff_seconds=0.5)
+    try:
+        with pytest.raises(ConnectionError):
+            stage.embed(texts(5))
+    finally:
+        stage.shutdown()
+    assert fake.attempts == 3
+    assert len(sleeps) == 2
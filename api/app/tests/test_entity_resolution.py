@@ -0,0 +1,102 @@
+"""
+EntityResolver's banded edit distance, trigram shortlist and fulltext
+fallback
+"""
+import random
+
+import pytest
+
+from entity_resolution import EntityResolver, _edit_distance, _trigrams, names_query
+
+NAMES = [
+    ("JobProfile", "Software Engineer"),
+    ("JobProfile", "Data Entry Clerk"),
+    ("JobProfile", "Nurse"),
+    ("Employer", "Infosys"),
+    ("Employer", "Tata Consultancy Services"),
+    ("Aptitude", "Numerical Aptitude"),
+]
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+class NamesGraph:
+    def __init__(self, names=NAMES, fallback=None):
+        self.names = names
+        self.fallback = fallback or {}
+        self.fallback_calls = []
+
+    def query(self, query, params=None):
+        if query == names_query:
+            return [{"label": label, "name": name} for label, name in self.names]
+        self.fallback_calls.append(params)
+        return [
+            {"name": entity["name"], "result": self.fallback[entity["name"]]}
+            for entity in params["entities"]
+            if entity["name"] in self.fallback
+        ]
+
+
+@pytest.fixture
+def resolver():
+    resolver = EntityResolver(threshold=0.8, candidate_threshold=0.5, shortlist=20)
+    resolver.refresh(NamesGraph())
+    return resolver
+
+
+def test_edit_distance_matches_levenshtein_within_bound():
+    rng = random.Random(7)
+    for _ in range(2000):
+        a = "".join(rng.choices("abc", k=rng.randint(0, 8)))
+        b = "".join(rng.choices("abc", k=rng.randint(0, 8)))
+        bound = rng.randint(0, 4)
+        expected = levenshtein(a, b)
+        assert _edit_distance(a, b, bound) == (expected if expected <= bound else bound + 1)
+
+
+def test_trigrams_pad_word_boundaries():
+    assert _trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_exact_and_misspelled_names(resolver):
+    assert resolver.resolve(["software engineers", "Data Entry Clerck", "NURSE", "pilot"]) == [
+        "Software Engineer", "Data Entry Clerk", "Nurse", None,
+    ]
+
+
+def test_shortlist_limits_edit_distance_to_most_shared_trigrams():
+    names = [("Employer", f"Company {i:04d}") for i in range(500)] + [("Employer", "Infosys")]
+    resolver = EntityResolver(threshold=0.8, shortlist=5)
+    resolver.refresh(NamesGraph(names))
+    assert resolver.search("Infosis", 0.8)[0].name == "Infosys"
+
+
+def test_candidates_respect_labels(resolver):
+    assert resolver.candidates("Tata Consultancy Service", labels=("Employer",)) == [
+        "Tata Consultancy Services"
+    ]
+    assert resolver.candidates("Infosys", labels=("JobProfile",)) == []
+
+
+def test_map_sends_only_misses_to_fulltext(resolver):
+    graph = NamesGraph(fallback={"Google": "Google India"})
+    assert resolver.map(["Nurses", "Google", "pilot"], graph) == ["Nurse", "Google India", None]
+    [params] = graph.fallback_calls
+    assert [entity["name"] for entity in params["entities"]] == ["Google", "pilot"]
+    assert resolver.stats() == {"names": len(NAMES), "resolved": 1, "fallback": 1, "unresolved": 1}
+
+
+def test_map_survives_failing_fallback(resolver):
+    class FailingGraph:
+        def query(self, query, params=None):
+            raise RuntimeError("fulltext index missing")
+
+    assert resolver.map(["Nurse", "Google"], FailingGraph()) == ["Nurse", None]
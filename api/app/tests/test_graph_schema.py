@@ -0,0 +1,122 @@
+"""
+GraphSchema refresh, on-disk cache and question-scoped rendering
+"""
+import pytest
+
+from graph_schema import GraphSchema
+
+
+def props(*names, type="STRING"):
+    return [{"property": name, "type": type} for name in names]
+
+
+def rel(start, type, end):
+    return {"start": start, "type": type, "end": end}
+
+
+SCHEMA = {
+    "node_props": {
+        "JobProfile": props("jobRole", "sector", "embedding", "text"),
+        "GeographicDetail": props("option"),
+        "Employer": props("name"),
+        "Aptitude": props("attribute"),
+        "CareerPathway": props("title"),
+        "JobRole": props("title"),
+        "_SchemaMigration": props("version"),
+    },
+    "rel_props": {
+        "HAS_GEOGRAPHIC_DETAIL": props("estimatedSalaryRange"),
+        "HAS_APTITUDE": props("score", type="INTEGER"),
+    },
+    "relationships": [
+        rel("JobProfile", "HAS_GEOGRAPHIC_DETAIL", "GeographicDetail"),
+        rel("JobProfile", "EMPLOYED_BY", "Employer"),
+        rel("JobProfile", "HAS_APTITUDE", "Aptitude"),
+        rel("JobProfile", "HAS_CAREER_PATHWAY", "CareerPathway"),
+        rel("CareerPathway", "HAS_ROLE", "JobRole"),
+    ],
+}
+
+
+class SchemaGraph:
+    def __init__(self):
+        self.labels = list(SCHEMA["node_props"])
+        self.introspections = 0
+
+    def query(self, query, params=None):
+        return [{"labels": self.labels, "types": ["HAS_ROLE"], "keys": ["title"]}]
+
+    def refresh_schema(self):
+        self.introspections += 1
+        self.structured_schema = SCHEMA
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "graph_schema.json")
+
+
+@pytest.fixture
+def schema(path):
+    schema = GraphSchema(path, compact=True)
+    schema.refresh(SchemaGraph())
+    return schema
+
+
+def test_refresh_introspects_only_when_names_change(path):
+    graph = SchemaGraph()
+    schema = GraphSchema(path)
+    assert schema.refresh(graph)
+    assert not schema.refresh(graph)
+    assert GraphSchema(path).refresh(graph)
+    assert graph.introspections == 1
+    graph.labels.append("NewLabel")
+    assert schema.refresh(graph)
+    assert graph.introspections == 2
+    assert schema.version == 2
+
+
+def test_full_schema_hides_internal_labels_and_properties(schema):
+    assert "_SchemaMigration" not in schema.full
+    assert "JobProfile {jobRole: STRING, sector: STRING}" in schema.full
+    assert "(:CareerPathway)-[:HAS_ROLE]->(:JobRole)" in schema.full
+
+
+def test_render_keeps_labels_the_question_points_at(schema):
+    rendered = schema.render("What is the salary of a nurse in small cities?")
+    assert rendered == "\n".join([
+        "Node properties:",
+        "JobProfile {jobRole: STRING, sector: STRING}",
+        "GeographicDetail {option: STRING}",
+        "Relationship properties:",
+        "HAS_GEOGRAPHIC_DETAIL {estimatedSalaryRange: STRING}",
+        "The relationships:",
+        "(:JobProfile)-[:HAS_GEOGRAPHIC_DETAIL]->(:GeographicDetail)",
+    ])
+
+
+def test_render_adds_the_path_to_job_profiles(schema):
+    rendered = schema.render("Which job roles follow a career in nursing?")
+    assert "CareerPathway {title: STRING}" in rendered
+    assert "(:CareerPathway)-[:HAS_ROLE]->(:JobRole)" in rendered
+    assert "Employer" not in rendered
+
+
+def test_render_uses_mentioned_entity_labels(schema):
+    rendered = schema.render("Tell me about Acme", labels=["Employer"])
+    assert "(:JobProfile)-[:EMPLOYED_BY]->(:Employer)" in rendered
+    assert "GeographicDetail" not in rendered
+
+
+def test_render_falls_back_to_full_schema(schema):
+    assert schema.render("Tell me about nurses") == schema.full
+    assert schema.stats()["full"] == 1
+    uncompacted = GraphSchema(schema.path, compact=False)
+    uncompacted.refresh(SchemaGraph())
+    assert uncompacted.render("What is the salary of a nurse?") == schema.full
+
+
+def test_correct_fixes_relationship_direction(schema):
+    assert schema.correct(
+        "MATCH (g:GeographicDetail)-[:HAS_GEOGRAPHIC_DETAIL]->(j:JobProfile) RETURN g"
+    ) == "MATCH (g:GeographicDetail)<-[:HAS_GEOGRAPHIC_DETAIL]-(j:JobProfile) RETURN g"
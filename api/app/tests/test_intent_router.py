@@ -0,0 +1,111 @@
+"""
+IntentRouter routing, fallbacks and rendering against a fake vocabulary
+"""
+import pytest
+
+from intent_router import INTENT_ROUTER_MAX_LIMIT, IntentRouter, vocabulary_query
+
+VOCABULARY = {
+    "jobRoles": ["Retail Sales Associate", "Automotive Engineer", "Software Engineer", "Nurse"],
+    "sectors": ["Healthcare", "IT / ITeS (Information Technology)"],
+    "collegeCategories": ["College", "Non-College"],
+    "geographicOptions": ["Large Cities", "Medium & Small Cities", "Towns & Villages"],
+    "aptitudes": ["Numerical Aptitude", "Interpersonal Skills"],
+    "interests": ["Realistic", "Social"],
+    "values": ["Compensation", "Work-Life Balance"],
+}
+
+
+class VocabularyGraph:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.queries = []
+
+    def query(self, query, params=None):
+        if query == vocabulary_query:
+            return [VOCABULARY]
+        self.queries.append((query, params))
+        return self.rows
+
+
+@pytest.fixture
+def router():
+    router = IntentRouter(min_confidence=0.75, enabled=True)
+    router.refresh(VocabularyGraph())
+    return router
+
+
+@pytest.mark.parametrize(
+    "question, intent, params",
+    [
+        (
+            "Top 3 aptitudes needed for excelling as a Retail Sales Associate?",
+            "top_aptitudes", {"jobRole": "Retail Sales Associate", "limit": 3},
+        ),
+        (
+            "What is the salary of a Nurse in big cities?",
+            "salary", {"jobRole": "Nurse", "geographicOption": "Large Cities", "limit": 5},
+        ),
+        (
+            "Companies recognized for hiring Software Engineers?",
+            "employers_by_role", {"jobRole": "Software Engineer", "limit": 10},
+        ),
+        (
+            "Which employers are notable for hiring in the healthcare industry?",
+            "employers_by_sector", {"sector": "Healthcare", "limit": 10},
+        ),
+        (
+            "Which jobs need Numerical Aptitude the most?",
+            "roles_by_aptitude", {"aptitude": "Numerical Aptitude", "limit": 5},
+        ),
+    ],
+)
+def test_routes_common_questions(router, question, intent, params):
+    route = router.route(question)
+    assert route.intent.name == intent
+    assert route.params == params
+
+
+def test_caps_requested_limit(router):
+    route = router.route("Top 500 aptitudes for a Nurse")
+    assert route.params["limit"] == INTENT_ROUTER_MAX_LIMIT
+
+
+@pytest.mark.parametrize(
+    "question, reason",
+    [
+        ("Compare salaries of a Nurse and a Software Engineer", "repeated_slot"),
+        ("Salary and employers for a Nurse", "ambiguous"),
+        ("How do I become a pilot?", "no_intent"),
+        ("What aptitudes does a Nurse need if they want to move abroad later in life?", "low_confidence"),
+    ],
+)
+def test_falls_back(router, question, reason):
+    assert router.route(question) is None
+    assert router.stats()[f"fallback.{reason}"] == 1
+
+
+def test_not_ready_without_vocabulary():
+    router = IntentRouter(enabled=True)
+    assert not router.ready
+    assert router.route("What is the salary of a Nurse?") is None
+
+
+def test_labels(router):
+    assert router.labels("Salary of a Nurse in big cities") == ["GeographicDetail", "JobProfile"]
+    assert router.labels("How do I become a pilot?") == []
+
+
+def test_answer_renders_rows(router):
+    graph = VocabularyGraph([{"option": "Large Cities", "salaryRange": "1-2", "availability": "High"}])
+    answer = router.answer("What is the salary of a Nurse in big cities?", graph)
+    assert answer == (
+        "Salary for Nurse (Large Cities):\n- Large Cities: 1-2 (job availability: High)"
+    )
+    [(_, params)] = graph.queries
+    assert params["jobRole"] == "Nurse"
+
+
+def test_answer_falls_back_without_rows(router):
+    assert router.answer("What is the salary of a Nurse?", VocabularyGraph()) is None
+    assert router.stats()["fallback.no_rows"] == 1
@@ -1,7 +1,7 @@
 import re
-from typing import List, Optional, Union
+import logging
+from typing import Dict, List, NamedTuple, Optional, Union
 
-from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 from langchain_core.messages import (
     AIMessage,
     SystemMessage,
@@ -14,33 +14,41 @@ from langchain_core.prompts import (
     MessagesPlaceholder,
 )
 from langchain_core.pydantic_v1 import BaseModel
-from langchain_core.runnables import RunnablePassthrough
-from utils import Entities, entity_chain, graph, llm
-
-# Cypher validation tool for relationship directions
-corrector_schema = [
-    Schema(el["start"], el["type"], el["end"])
-    for el in graph.structured_schema.get("relationships")
-]
-cypher_validation = CypherQueryCorrector(corrector_schema)
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from cypher_cache import QuestionTemplate
+from utils import (
+    Entities,
+    async_graph,
+    cypher_cache,
+    cypher_guard,
+    entity_chain,
+    entity_resolver,
+    graph,
+    graph_schema,
+    intent_router,
+    llm,
+    prompt_schema,
+)
 
 
-# Fulltext index query
-def map_to_database(entities: Entities) -> Optional[str]:
+def _format_mappings(entities: Entities, resolved: List[Optional[str]]) -> str:
     result = ""
-    for entity in entities.names:
-        response = graph.query(
-            "CALL db.index.fulltext.queryNodes('entity', $entity + '*', {limit:1})"
-            " YIELD node,score RETURN node.name AS result",
-            {"entity": entity},
-        )
-        try:
-            result += f"{entity} maps to {response[0]['result']} in database\n"
-        except IndexError:
-            pass
+    for entity, value in zip(entities.names, resolved):
+        if value is not None:
+            result += f"{entity} maps to {value} in database\n"
     return result
 
 
+def map_to_database(entities: Entities) -> Optional[str]:
+    return _format_mappings(entities, entity_resolver.map(entities.names, graph))
+
+
+async def amap_to_database(entities: Entities) -> Optional[str]:
+    return _format_mappings(
+        entities, await entity_resolver.amap(entities.names, async_graph)
+    )
+
+
 # Generate Cypher statement based on natural language input
 cypher_template = """Based on the Neo4j graph schema below, write a Cypher query that would answer the user's question:
 {schema}
@@ -62,8 +70,11 @@ cypher_prompt = ChatPromptTemplate.from_messages(
 cypher_response = (
     RunnablePassthrough.assign(names=entity_chain)
     | RunnablePassthrough.assign(
-        entities_list=lambda x: map_to_database(x["names"]),
-        schema=lambda _: graph.get_schema,
+        entities_list=RunnableLambda(
+            lambda x: map_to_database(x["names"]),
+            afunc=lambda x: amap_to_database(x["names"]),
+        ),
+        schema=lambda x: prompt_schema(x["question"]),
     )
     | cypher_prompt
     | llm
@@ -94,13 +105,73 @@ def clean_query(query: str) -> str:
     return matches[0] if matches else query.content
 
 
+class CypherStatement(NamedTuple):
+    query: str
+    params: Dict
+    template: QuestionTemplate
+    cached: bool
+
+
+def cypher_statement(x: Dict, config) -> CypherStatement:
+    """
+    Cached Cypher for questions of the same shape, generated otherwise
+    """
+    template = cypher_cache.template(x["question"])
+    query = cypher_cache.lookup(template, graph_schema.fingerprint)
+    if query is not None:
+        return CypherStatement(query, template.params, template, True)
+    query = graph_schema.correct(clean_query(cypher_response.invoke(x, config)))
+    return CypherStatement(query, {}, template, False)
+
+
+async def acypher_statement(x: Dict, config) -> CypherStatement:
+    template = cypher_cache.template(x["question"])
+    query = cypher_cache.lookup(template, graph_schema.fingerprint)
+    if query is not None:
+        return CypherStatement(query, template.params, template, True)
+    query = graph_schema.correct(clean_query(await cypher_response.ainvoke(x, config)))
+    return CypherStatement(query, {}, template, False)
+
+
+def _log_statement(statement: CypherStatement) -> None:
+    source = "Cached" if statement.cached else "Generated"
+    logging.info(f"{source} Cypher: {statement.query} {statement.params}")
+
+
 def get_function_response(
-    query: str, question: str
+    statement: CypherStatement, question: str
 ) -> List[Union[AIMessage, ToolMessage]]:
+    _log_statement(statement)
     try:
-        context = graph.query(cypher_validation(clean_query(query)))
+        query = statement.query
+        if not statement.cached:
+            # Cached queries passed the guard when they were stored
+            query = cypher_guard.check(graph, query, statement.params).query
+        context = cypher_guard.execute(graph, query, statement.params)
+        if not statement.cached:
+            cypher_cache.store(statement.template, query, graph_schema.fingerprint)
     except Exception as e:
         context = str(e)
+    return _function_messages(context, question)
+
+
+async def aget_function_response(
+    statement: CypherStatement, question: str
+) -> List[Union[AIMessage, ToolMessage]]:
+    _log_statement(statement)
+    try:
+        query = statement.query
+        if not statement.cached:
+            query = (await cypher_guard.acheck(async_graph, query, statement.params)).query
+        context = await cypher_guard.aexecute(async_graph, query, statement.params)
+        if not statement.cached:
+            cypher_cache.store(statement.template, query, graph_schema.fingerprint)
+    except Exception as e:
+        context = str(e)
+    return _function_messages(context, question)
+
+
+def _function_messages(context, question: str) -> List[Union[AIMessage, ToolMessage]]:
     TOOL_ID = "call_H7fABDuzEau48T10Qn0Lsh0D"
     messages = [
         AIMessage(
@@ -123,16 +194,38 @@ def get_function_response(
     return messages
 
 
-text2cypher_chain = (
-    RunnablePassthrough.assign(query=cypher_response)
+generated_answer = (
+    RunnablePassthrough.assign(
+        query=RunnableLambda(cypher_statement, afunc=acypher_statement)
+    )
     | RunnablePassthrough.assign(
-        function_response=lambda x: get_function_response(x["query"], x["question"])
+        function_response=RunnableLambda(
+            lambda x: get_function_response(x["query"], x["question"]),
+            afunc=lambda x: aget_function_response(x["query"], x["question"]),
+        )
     )
     | response_prompt
     | llm
     | StrOutputParser()
 )
 
+
+def routed_answer(x: Dict):
+    """
+    Curated answer for questions the intent router recognises, without any
+    LLM call; other questions go through Cypher generation
+    """
+    answer = intent_router.answer(x["question"], graph)
+    return generated_answer if answer is None else answer
+
+
+async def arouted_answer(x: Dict):
+    answer = await intent_router.aanswer(x["question"], async_graph)
+    return generated_answer if answer is None else answer
+
+
+text2cypher_chain = RunnableLambda(routed_answer, afunc=arouted_answer)
+
 # Add typing for input
 
 
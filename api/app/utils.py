@@ -1,18 +1,31 @@
-from typing import Any, Dict, List, Tuple
+import logging
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain_community.graphs import Neo4jGraph
-from langchain_community.vectorstores import Neo4jVector
-from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+from langchain_core.documents import Document
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_text_splitters import TokenTextSplitter
 
+from async_graph import AsyncNeo4jGraph
+from chunking import ChunkingPool, make_text_splitter
+from context_packer import get_encoder, pack_context
+from cypher_cache import CypherTemplateCache
+from cypher_guard import CypherGuard
+from embedding import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, EmbeddingStage
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from entity_resolution import EntityResolver, generate_full_text_query
+from fact_cards import FactCardRetriever
+from graph_schema import GraphSchema
+from hybrid_search import HybridRetriever
+from intent_router import IntentRouter
+from migrations import apply_migrations
+from retrieval_filters import ProfileCatalog, RetrievalFilters
+from vector_mirror import VectorMirror
 from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.schema import LLMResult
 from typing import Any, Dict, List
-import tiktoken
 
 # MODEL_COST_PER_1K_TOKENS = {
 #     "gpt-4": 0.03,
@@ -91,7 +104,7 @@ class CostCalcAsyncHandler(AsyncCallbackHandler):
        self.token_cost_process = token_cost_process
 
     def on_llm_start( self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
-       encoding = tiktoken.encoding_for_model( self.model )
+       encoding = get_encoder( self.model )
        if self.token_cost_process == None: return
 
        for prompt in prompts:
@@ -105,53 +118,149 @@ class CostCalcAsyncHandler(AsyncCallbackHandler):
     def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
       self.token_cost_process.sum_successful_requests( 1 )
 
-index_name = "jobProfile_vector"
-keyword_index_name = "jobProfile_fulltext"
-
 token_cost_process = TokenCostProcess()
 llm = ChatOpenAI(temperature=0, callbacks=[  CostCalcAsyncHandler( "gpt-4o-mini", token_cost_process ) ], model="gpt-4o-mini", streaming=True)
 
 
-def setup_indices():
-    graph.query(
-        "CREATE INDEX jobRole_Range IF NOT EXISTS FOR (n:`JobProfile`) ON (n.jobRole);"
-    )
-    graph.query(
-        f"CREATE FULLTEXT INDEX {keyword_index_name} IF NOT EXISTS FOR (n:JobProfile) ON EACH [n.text]",
-    )
-    graph.query(
-        f"""CREATE VECTOR INDEX {index_name} IF NOT EXISTS
-    FOR (n: JobProfile) ON (n.embedding)
-    OPTIONS {{indexConfig: {{
-    `vector.dimensions`: 1536,
-    `vector.similarity_function`: 'cosine'
-    }}}}""",
-    )
+# The schema is introspected by graph_schema below, only when it changed
+graph = Neo4jGraph(enhanced_schema=False, refresh_schema=False)
+# Used by the async request path (ainvoke/astream), so Bolt round trips do
+# not hold a worker thread
+async_graph = AsyncNeo4jGraph()
 
+# Chunk and query embeddings are served from a persistent cache where possible
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+embeddings = CachedEmbeddings(
+    OpenAIEmbeddings(model=EMBEDDING_MODEL), embedding_cache
+)
+embedding_stage = EmbeddingStage(embeddings)
 
-graph = Neo4jGraph(enhanced_schema=False, refresh_schema=True)
+# Bring constraints and indexes up to the latest schema migration
+apply_migrations(graph)
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# In-process copy of the chunk embeddings, reloaded from disk and then
+# refreshed from Neo4j in the background
+vector_mirror = VectorMirror()
+vector_mirror.load()
+vector_mirror.refresh(graph)
 
-# Setup vector and keyword indices
-setup_indices()
+# Filterable profile properties for scoped retrieval, reloaded after imports
+profile_catalog = ProfileCatalog()
+profile_catalog.refresh(graph)
 
-vector_index = Neo4jVector.from_existing_index(
-    embeddings,
-    graph=graph,
-    index_name=index_name,
-    keyword_index_name=keyword_index_name,
-    search_type="hybrid",
+hybrid_retriever = HybridRetriever(
+    graph, async_graph, embeddings, vector_mirror, profile_catalog
 )
 
-text_splitter = TokenTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50,
-)
+fact_card_retriever = FactCardRetriever(graph, async_graph, embeddings, profile_catalog)
+
+# Generated Cypher reused across questions of the same shape, dropped when
+# the graph schema changes
+cypher_cache = CypherTemplateCache(profile_catalog)
+# EXPLAIN check, limits and timeout for LLM-generated Cypher
+cypher_guard = CypherGuard()
+
+# Curated Cypher for the common question shapes, vocabulary reloaded after imports
+intent_router = IntentRouter()
+try:
+    intent_router.refresh(graph)
+except Exception:
+    # Without a vocabulary every question falls back to text2cypher
+    logging.exception("Loading the intent router vocabulary failed")
+
+# Canonical entity names for text2cypher and the prefiltering agent
+entity_resolver = EntityResolver()
+entity_resolver.refresh(graph)
+
+# Versioned schema for the Cypher prompts, corrector and cache, refreshed
+# after imports
+graph_schema = GraphSchema()
+graph_schema.refresh(graph)
+
+
+def prompt_schema(question: str) -> str:
+    """
+    The part of the graph schema relevant to the question
+    """
+    return graph_schema.render(question, intent_router.labels(question))
+
+
+def similarity_search(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> List[Document]:
+    """
+    Hybrid vector + fulltext chunk search fused with reciprocal rank fusion,
+    restricted to profiles matching `filters` and ranking those matching
+    `boosts` higher
+    """
+    return hybrid_retriever.search(query, k, filters, boosts)
+
+
+async def asimilarity_search(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> List[Document]:
+    return await hybrid_retriever.asearch(query, k, filters, boosts)
+
+
+def similarity_search_with_profiles(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> Tuple[List[Document], List[Dict]]:
+    """
+    Hybrid chunk search that also returns the JobProfiles behind the chunks
+    with their aptitudes, salaries, employers and pathways
+    """
+    return hybrid_retriever.search_with_profiles(query, k, filters, boosts)
+
+
+async def asimilarity_search_with_profiles(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> Tuple[List[Document], List[Dict]]:
+    return await hybrid_retriever.asearch_with_profiles(query, k, filters, boosts)
+
+
+
+def fact_card_search(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> List[Document]:
+    """
+    Closest JobProfile fact cards, one compact document per profile
+    """
+    return fact_card_retriever.search(query, k, filters, boosts)
+
+
+async def afact_card_search(
+    query: str,
+    k: int = 4,
+    filters: Optional[RetrievalFilters] = None,
+    boosts: Optional[RetrievalFilters] = None,
+) -> List[Document]:
+    return await fact_card_retriever.asearch(query, k, filters, boosts)
+
+
+text_splitter = make_text_splitter()
+chunking_pool = ChunkingPool()
 
 
 def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+    """
+    Retrieved chunks packed into prompt context within CONTEXT_TOKEN_BUDGET
+    """
+    return pack_context(docs)
 
 
 # def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
@@ -190,23 +299,6 @@ prompt = ChatPromptTemplate.from_messages(
 entity_chain = prompt | llm.with_structured_output(Entities)
 
 
-def generate_full_text_query(input: str) -> str:
-    """
-    Generate a full-text search query for a given input string.
-
-    This function constructs a query string suitable for a full-text search.
-    It processes the input string by splitting it into words and appending a
-    similarity threshold (~2 changed characters) to each word, then combines
-    them using the AND operator. Useful for mapping entities from user questions
-    to database values, and allows for some misspelings.
-    """
-    full_text_query = ""
-    words = [el for el in remove_lucene_chars(input).split() if el]
-    for word in words[:-1]:
-        full_text_query += f" {word}~2 AND"
-    full_text_query += f" {words[-1]}~2"
-    return full_text_query.strip()
-
 def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
     buffer = []
     for human, ai in chat_history:
@@ -238,116 +330,3 @@ def remove_null_properties(data: Dict[str, Any]):
             relationship["properties"].pop(key)
 
     return data
-
-import_cypher_query = """
-UNWIND $data AS row  
-// Create or merge a JobProfile node  
-MERGE (j:JobProfile {id: row.id})  
-SET j.id = row.id,
-    j.sector = row.sector,  
-    j.subSector = row.subSector,  
-    j.descriptionText = row.jobProfile.generalDescription.text,  
-    j.mediaURL = row.jobProfile.generalDescription.mediaURL,  
-    j.mediaURLsMale = row.jobProfile.generalDescription.mediaURLs.male,  
-    j.mediaURLsFemale = row.jobProfile.generalDescription.mediaURLs.female,  
-    j.collegeCategory = row.collegeCategory,  
-    j.jobRole = row.jobRole,  
-    j.jobLocation = row.jobLocation,  
-    j.experienceLevel = row.experienceLevel,
-    j.dayInTheLifeText = row.jobProfile.dayInTheLife.text,
-    j.text = row.text,
-    j.deleted = row.deleted
-
-WITH j, row, row.jobProfile.prepareForRole.educationVsDegreeHeading as heading
-MERGE (p:PrepareForRole {heading: heading})
-MERGE (j)-[rel:ForRole]->(p)
-SET rel.educationVsDegree = row.jobProfile.prepareforRole.educationVsDegree,
-    rel.trainingNeeded = row.jobProfile.prepareforRole.trainingNeeded,
-    rel.priorWorkExperience = row.jobProfile.prepareforRole.priorWorkExperience
-
-// Handling Reason Liked  
-WITH j, row
-FOREACH (reasonLiked in row.jobProfile.reasonLiked |  
-  MERGE (rl:ReasonLiked {reason: reasonLiked})  
-  MERGE (j)-[:LIKED_FOR]->(rl)  
-)  
-
-// Handling Reason Disliked 
-WITH j, row 
-FOREACH (reasonDisliked in row.jobProfile.reasonsDisliked |  
-  MERGE (rd:ReasonDisliked {reason: reasonDisliked})  
-  MERGE (j)-[:DISLIKED_FOR]->(rd)  
-)  
-
-// Handling Aptitude Ratings  
-WITH j, row
-FOREACH (aptitude in row.aptitudeRatings |  
-  MERGE (a:Aptitude {attribute: aptitude.attribute})  
-  MERGE (j)-[rel:HAS_APTITUDE]->(a)
-  SET rel.score = toFloat(aptitude.score)  
-)  
-
-// Handling Interested Ratings  
-WITH j, row
-FOREACH (interest in row.interestRatings |  
-  MERGE (ir:Interest {attribute: interest.attribute})  
-  MERGE (j)-[rel:HAS_INTEREST]->(ir)  
-  SET rel.score = toFloat(interest.score)  
-)  
-
-// Handling Value Ratings  
-WITH j, row
-FOREACH (value in row.valueRatings |  
-  MERGE (vr:Value {attribute: value.attribute})  
-  MERGE (j)-[rel:HAS_VALUE]->(vr)  
-  SET rel.score = toFloat(value.score)  
-)  
-
-// Handling Career Pathways  
-WITH j, row
-UNWIND row.careerPathways AS pathway  
-  MERGE (cp:CareerPathway {title: pathway.pathwayTitle})  
-  SET cp.description = pathway.description  
-  MERGE (j)-[:HAS_CAREER_PATHWAY]->(cp)  
-  // Handling Job Roles within Career Pathways  
-  FOREACH (jobRole in pathway.jobRoles |  
-    MERGE (jr:JobRole {title: jobRole.title, years: jobRole.years})  
-    MERGE (cp)-[:HAS_JOB_ROLE]->(jr)  
-  )  
-
-// Handling Employers  
-WITH j, row
-FOREACH (employer in row.employers.wellKnownEmployers |  
-  MERGE (e:Employer {name: employer.name})  
-  SET e.description = employer.description,  
-      e.website = employer.website  
-  MERGE (j)-[:EMPLOYED_BY]->(e)  
-)  
-
-// Handling Employer Profiles  
-WITH j, row
-FOREACH (profile in row.employers.employerProfiles |  
-  MERGE (ep:EmployerProfile {geographicOption: profile.geographicOption})  
-  MERGE (j)-[rel:HAS_EMPLOYER_PROFILE]->(ep)  
-  SET rel.profiles = profile.profiles  
-)  
-
-// Handling Geographic Job Details  
-WITH j, row
-FOREACH (geoDetail in row.geographicJobDetails |  
-  MERGE (g:GeographicDetail {option: geoDetail.geographicOption})  
-  MERGE (j)-[rel:HAS_GEOGRAPHIC_DETAIL]->(g)  
-  SET rel.jobAvailability = geoDetail.jobAvailability,  
-      rel.estimatedSalaryRange = geoDetail.estimatedSalaryRange,  
-      rel.maximumSalary = geoDetail.maximumSalary,  
-      rel.minimumSalary = geoDetail.minimumSalary  
-)
-WITH j, row
-UNWIND row.chunks AS chunk
-  MERGE (c:Chunk {id: chunk.index})
-  SET c.text = chunk.text,
-      c.index = chunk.index
-  MERGE (j)-[:HAS_CHUNK]->(c)
-  WITH c, chunk
-  CALL db.create.setNodeVectorProperty(c, 'embedding', chunk.embedding)
-"""
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from functools import cached_property
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding import EMBEDDING_DIMENSIONS
+from retrieval_filters import FILTER_EXACT_SELECTIVITY, oversample_factor
+
+VECTOR_MIRROR_ENABLED = os.environ.get("VECTOR_MIRROR_ENABLED", "true").lower() == "true"
+VECTOR_MIRROR_DIR = os.environ.get("VECTOR_MIRROR_DIR", "cache/vector_mirror")
+VECTOR_MIRROR_PAGE_SIZE = int(os.environ.get("VECTOR_MIRROR_PAGE_SIZE", 5000))
+# Rows scored per matrix product, bounds the temporary score buffer
+VECTOR_MIRROR_BLOCK_ROWS = int(os.environ.get("VECTOR_MIRROR_BLOCK_ROWS", 65536))
+
+# Keyset pagination over the Chunk.id uniqueness constraint
+chunk_page_query = """
+MATCH (c:Chunk)
+WHERE c.id > $after AND c.embedding IS NOT NULL
+WITH c ORDER BY c.id LIMIT $limit
+OPTIONAL MATCH (j:JobProfile)-[:HAS_CHUNK]->(c)
+RETURN c.id AS id, j.id AS profileId, c.text AS text, c.embedding AS embedding
+"""
+
+
+def iter_chunk_pages(graph, page_size: int = VECTOR_MIRROR_PAGE_SIZE) -> Iterable[List[Dict]]:
+    after = ""
+    while True:
+        page = graph.query(chunk_page_query, params={"after": after, "limit": page_size})
+        if not page:
+            return
+        yield page
+        after = page[-1]["id"]
+
+
+class MirrorSnapshot:
+    """
+    One immutable generation of the mirror, memory-mapped from disk. Vectors
+    are L2-normalised so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "ids.json")) as f:
+            ids = json.load(f)
+        self.chunk_ids: List[str] = ids["chunkIds"]
+        self.profile_ids: List[Optional[str]] = ids["profileIds"]
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        count = len(self.chunk_ids)
+        self.vectors = (
+            np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r")
+            .reshape(count, -1)
+            if count
+            else np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        )
+        self.texts = (
+            np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r")
+            if self.offsets[-1]
+            else np.empty(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def text(self, row: int) -> str:
+        return bytes(self.texts[self.offsets[row] : self.offsets[row + 1]]).decode("utf-8")
+
+    @cached_property
+    def profile_rows(self) -> Dict[Optional[str], np.ndarray]:
+        rows: Dict[Optional[str], List[int]] = {}
+        for row, profile_id in enumerate(self.profile_ids):
+            rows.setdefault(profile_id, []).append(row)
+        return {id: np.asarray(ids, dtype=np.int64) for id, ids in rows.items()}
+
+    def rows_for(self, profile_ids: Set[str]) -> np.ndarray:
+        rows = [self.profile_rows[id] for id in profile_ids if id in self.profile_rows]
+        return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        block_rows: int = VECTOR_MIRROR_BLOCK_ROWS,
+        rows: Optional[np.ndarray] = None,
+    ):
+        """
+        Exact top-k rows by cosine similarity, as (rows, scores) best first.
+        With `rows` only those rows are scored.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        total = len(self) if rows is None else len(rows)
+        top_rows = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float32)
+        for start in range(0, total, block_rows):
+            if rows is None:
+                block_ids = np.arange(start, min(start + block_rows, total))
+                block = self.vectors[start : start + block_rows] @ query
+            else:
+                block_ids = rows[start : start + block_rows]
+                block = self.vectors[block_ids] @ query
+            if len(block) > k:
+                top = np.argpartition(block, -k)[-k:]
+            else:
+                top = np.arange(len(block))
+            top_rows = np.concatenate([top_rows, block_ids[top]])
+            scores = np.concatenate([scores, block[top]])
+            if len(top_rows) > k:
+                keep = np.argpartition(scores, -k)[-k:]
+                top_rows, scores = top_rows[keep], scores[keep]
+        order = np.argsort(-scores)
+        return top_rows[order], scores[order]
+
+    def filtered_search(self, vector: np.ndarray, k: int, profile_ids: Set[str]):
+        """
+        Top-k rows among the chunks of `profile_ids`. A selective filter
+        scores just those rows; otherwise a full scan is oversampled and
+        post-filtered, falling back to the exact subset if too few survive.
+        """
+        rows = self.rows_for(profile_ids)
+        selectivity = len(rows) / max(len(self), 1)
+        if selectivity > FILTER_EXACT_SELECTIVITY:
+            top_rows, scores = self.search(vector, k * oversample_factor(selectivity))
+            keep = np.isin(top_rows, rows)
+            if keep.sum() >= k:
+                return top_rows[keep][:k], scores[keep][:k]
+        return self.search(vector, k, rows=rows)
+
+
+class VectorMirror:
+    """
+    In-process copy of every Chunk embedding with its text and JobProfile id,
+    searched by blocked brute force. Each rebuild writes a new generation
+    directory and then swaps it in, so searches never see a partial index.
+    """
+
+    def __init__(
+        self, directory: str = VECTOR_MIRROR_DIR, enabled: bool = VECTOR_MIRROR_ENABLED
+    ):
+        self.directory = directory
+        self.enabled = enabled
+        self.snapshot: Optional[MirrorSnapshot] = None
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.stale = False
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def load(self) -> bool:
+        """
+        Open the current generation left on disk by a previous run, if any
+        """
+        if not self.enabled:
+            return False
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                generation = f.read().strip()
+            self.snapshot = MirrorSnapshot(os.path.join(self.directory, generation))
+        except (OSError, ValueError, KeyError) as e:
+            logging.info(f"No usable vector mirror on disk ({e}).")
+            return False
+        logging.info(f"Loaded vector mirror {generation} with {len(self.snapshot)} chunks.")
+        return True
+
+    def build(self, pages: Iterable[List[Dict]]) -> MirrorSnapshot:
+        generation = f"{time.time_ns()}"
+        path = os.path.join(self.directory, generation)
+        os.makedirs(path)
+        try:
+            self._write(path, pages)
+            snapshot = MirrorSnapshot(path)
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        pointer = os.path.join(self.directory, "CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(self.directory, "CURRENT"))
+        self.snapshot = snapshot
+        # Open memory maps keep the old files readable until searches finish
+        for name in os.listdir(self.directory):
+            if name not in (generation, "CURRENT"):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        return snapshot
+
+    @staticmethod
+    def _write(path: str, pages: Iterable[List[Dict]]) -> None:
+        chunk_ids, profile_ids, offsets = [], [], [0]
+        with open(os.path.join(path, "vectors.f32"), "wb") as vectors, open(
+            os.path.join(path, "texts.bin"), "wb"
+        ) as texts:
+            for page in pages:
+                matrix = np.asarray([el["embedding"] for el in page], dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                vectors.write((matrix / np.where(norms == 0, 1, norms)).tobytes())
+                for el in page:
+                    encoded = (el["text"] or "").encode("utf-8")
+                    texts.write(encoded)
+                    offsets.append(offsets[-1] + len(encoded))
+                    chunk_ids.append(el["id"])
+                    profile_ids.append(el["profileId"])
+        np.save(os.path.join(path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        with open(os.path.join(path, "ids.json"), "w") as f:
+            json.dump({"chunkIds": chunk_ids, "profileIds": profile_ids}, f)
+
+    def rebuild(self, graph) -> int:
+        start = time.perf_counter()
+        snapshot = self.build(iter_chunk_pages(graph))
+        logging.info(
+            f"Rebuilt vector mirror with {len(snapshot)} chunks "
+            f"in {time.perf_counter() - start:.1f}s."
+        )
+        return len(snapshot)
+
+    def refresh(self, graph) -> None:
+        """
+        Rebuild on a background thread. Calls made while a rebuild is running
+        are coalesced into one more rebuild once it finishes.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.rebuilding:
+                self.stale = True
+                return
+            self.rebuilding = True
+        threading.Thread(
+            target=self._refresh, args=(graph,), name="vector-mirror", daemon=True
+        ).start()
+
+    def _refresh(self, graph) -> None:
+        while True:
+            try:
+                self.rebuild(graph)
+            except Exception:
+                logging.exception("Vector mirror rebuild failed")
+            with self.lock:
+                if not self.stale:
+                    self.rebuilding = False
+                    return
+                self.stale = False
+
+    def similarity_search_by_vector(
+        self, vector, k: int = 4, profile_ids: Optional[Set[str]] = None
+    ) -> List[Document]:
+        """
+        Top-k chunks, restricted to the chunks of `profile_ids` if given
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Vector mirror is not loaded")
+        if profile_ids is None:
+            rows, scores = snapshot.search(vector, k)
+        else:
+            rows, scores = snapshot.filtered_search(vector, k, profile_ids)
+        return [
+            Document(
+                page_content=snapshot.text(row),
+                metadata={
+                    "id": snapshot.chunk_ids[row],
+                    "profileId": snapshot.profile_ids[row],
+                    "score": float(score),
+                },
+            )
+            for row, score in zip(rows, scores)
+        ]
+
+    def stats(self) -> Dict:
+        snapshot = self.snapshot
+        return {
+            "enabled": self.enabled,
+            "ready": snapshot is not None,
+            "chunks": len(snapshot) if snapshot is not None else 0,
+            "generation": os.path.basename(snapshot.path) if snapshot is not None else None,
+            "rebuilding": self.rebuilding,
+        }
@@ -0,0 +1,436 @@
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence
+
+from neo4j.exceptions import TransientError
+from streaming import batched
+
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", 500))
+WRITE_MAX_RETRIES = int(os.environ.get("WRITE_MAX_RETRIES", 5))
+WRITE_BACKOFF_SECONDS = float(os.environ.get("WRITE_BACKOFF_SECONDS", 0.5))
+
+
+class WriteStep(NamedTuple):
+    name: str
+    query: str
+    # Builds the rows contributed by a single import param
+    rows: Callable[[Dict], List[Dict[str, Any]]]
+    # Shared nodes are deduplicated before writing to avoid lock contention
+    distinct: bool = False
+    # Fields the query MERGEs or MATCHes on; a deduplicated row missing one is
+    # dropped, while other fields may be null
+    keys: Sequence[str] = ()
+
+
+def merge_nodes_query(label: str, keys: Sequence[str], props: Sequence[str] = ()) -> str:
+    key_map = ", ".join(f"{key}: row.{key}" for key in keys)
+    query = f"UNWIND $rows AS row\nMERGE (n:{label} {{{key_map}}})"
+    if props:
+        query += "\nSET " + ", ".join(f"n.{prop} = row.{prop}" for prop in props)
+    return query
+
+
+def merge_relationships_query(
+    start: str,
+    start_keys: Sequence[str],
+    type: str,
+    end: str,
+    end_keys: Sequence[str],
+    props: Sequence[str] = (),
+) -> str:
+    start_map = ", ".join(f"{key}: row.start.{key}" for key in start_keys)
+    end_map = ", ".join(f"{key}: row.end.{key}" for key in end_keys)
+    query = (
+        "UNWIND $rows AS row\n"
+        f"MATCH (s:{start} {{{start_map}}})\n"
+        f"MATCH (e:{end} {{{end_map}}})\n"
+        f"MERGE (s)-[r:{type}]->(e)"
+    )
+    if props:
+        query += "\nSET " + ", ".join(f"r.{prop} = row.{prop}" for prop in props)
+    return query
+
+
+def _ratings(param: Dict, key: str) -> List[Dict]:
+    return [
+        {"start": {"id": param["id"]}, "end": {"attribute": el["attribute"]}, "score": float(el["score"])}
+        for el in param[key]
+    ]
+
+
+def _geo_details(param: Dict) -> List[Dict]:
+    return [
+        {
+            "start": {"id": param["id"]},
+            "end": {"option": el["geographicOption"]},
+            "jobAvailability": el["jobAvailability"],
+            "estimatedSalaryRange": el["estimatedSalaryRange"],
+            "maximumSalary": el["maximumSalary"],
+            "minimumSalary": el["minimumSalary"],
+        }
+        for el in param["geographicJobDetails"]
+    ]
+
+
+def _profile(param: Dict) -> Dict:
+    general = param["jobProfile"]["generalDescription"]
+    return {
+        "id": param["id"],
+        "sector": param["sector"],
+        "subSector": param["subSector"],
+        "descriptionText": general["text"],
+        "mediaURL": general["mediaURL"],
+        "mediaURLsMale": general["mediaURLs"]["male"],
+        "mediaURLsFemale": general["mediaURLs"]["female"],
+        "collegeCategory": param["collegeCategory"],
+        "jobRole": param["jobRole"],
+        "jobLocation": param["jobLocation"],
+        "experienceLevel": param["experienceLevel"],
+        "dayInTheLifeText": param["jobProfile"]["dayInTheLife"]["text"],
+        "text": param["text"],
+        "contentHash": param["contentHash"],
+        "deleted": param["deleted"],
+        "lastImport": param["lastImport"],
+    }
+
+
+PROFILE_PROPS = (
+    "sector",
+    "subSector",
+    "descriptionText",
+    "mediaURL",
+    "mediaURLsMale",
+    "mediaURLsFemale",
+    "collegeCategory",
+    "jobRole",
+    "jobLocation",
+    "experienceLevel",
+    "dayInTheLifeText",
+    "text",
+    "contentHash",
+    "deleted",
+    "lastImport",
+)
+
+chunk_write_query = """
+UNWIND $rows AS row
+MATCH (j:JobProfile {id: row.profileId})
+MERGE (c:Chunk {id: row.index})
+SET c.text = row.text,
+    c.index = row.index
+MERGE (j)-[:HAS_CHUNK]->(c)
+WITH c, row
+CALL db.create.setNodeVectorProperty(c, 'embedding', row.embedding)
+"""
+
+fact_card_write_query = """
+UNWIND $rows AS row
+MATCH (j:JobProfile {id: row.id})
+SET j.factCard = row.text
+WITH j, row
+CALL db.create.setNodeVectorProperty(j, 'factCardEmbedding', row.embedding)
+"""
+
+# Shared dimension nodes first, then profiles, then relationships, then chunks
+WRITE_STEPS = [
+    WriteStep(
+        "PrepareForRole",
+        merge_nodes_query("PrepareForRole", ["heading"]),
+        lambda p: [{"heading": p["jobProfile"]["prepareForRole"]["educationVsDegreeHeading"]}],
+        distinct=True,
+        keys=("heading",),
+    ),
+    WriteStep(
+        "ReasonLiked",
+        merge_nodes_query("ReasonLiked", ["reason"]),
+        lambda p: [{"reason": el} for el in p["jobProfile"]["reasonLiked"]],
+        distinct=True,
+        keys=("reason",),
+    ),
+    WriteStep(
+        "ReasonDisliked",
+        merge_nodes_query("ReasonDisliked", ["reason"]),
+        lambda p: [{"reason": el} for el in p["jobProfile"]["reasonsDisliked"]],
+        distinct=True,
+        keys=("reason",),
+    ),
+    WriteStep(
+        "Aptitude",
+        merge_nodes_query("Aptitude", ["attribute"]),
+        lambda p: [{"attribute": el["attribute"]} for el in p["aptitudeRatings"]],
+        distinct=True,
+        keys=("attribute",),
+    ),
+    WriteStep(
+        "Interest",
+        merge_nodes_query("Interest", ["attribute"]),
+        lambda p: [{"attribute": el["attribute"]} for el in p["interestRatings"]],
+        distinct=True,
+        keys=("attribute",),
+    ),
+    WriteStep(
+        "Value",
+        merge_nodes_query("Value", ["attribute"]),
+        lambda p: [{"attribute": el["attribute"]} for el in p["valueRatings"]],
+        distinct=True,
+        keys=("attribute",),
+    ),
+    WriteStep(
+        "CareerPathway",
+        merge_nodes_query("CareerPathway", ["title"], ["description"]),
+        lambda p: [
+            {"title": el["pathwayTitle"], "description": el["description"]}
+            for el in p["careerPathways"]
+        ],
+        distinct=True,
+        keys=("title",),
+    ),
+    WriteStep(
+        "JobRole",
+        merge_nodes_query("JobRole", ["title", "years"]),
+        lambda p: [
+            {"title": jr["title"], "years": jr["years"]}
+            for el in p["careerPathways"]
+            for jr in el["jobRoles"]
+        ],
+        distinct=True,
+        keys=("title", "years"),
+    ),
+    WriteStep(
+        "Employer",
+        merge_nodes_query("Employer", ["name"], ["description", "website"]),
+        lambda p: p["employers"]["wellKnownEmployers"],
+        distinct=True,
+        keys=("name",),
+    ),
+    WriteStep(
+        "EmployerProfile",
+        merge_nodes_query("EmployerProfile", ["geographicOption"]),
+        lambda p: [
+            {"geographicOption": el["geographicOption"]}
+            for el in p["employers"]["employerProfiles"]
+        ],
+        distinct=True,
+        keys=("geographicOption",),
+    ),
+    WriteStep(
+        "GeographicDetail",
+        merge_nodes_query("GeographicDetail", ["option"]),
+        lambda p: [{"option": el["geographicOption"]} for el in p["geographicJobDetails"]],
+        distinct=True,
+        keys=("option",),
+    ),
+    WriteStep(
+        "JobProfile",
+        merge_nodes_query("JobProfile", ["id"], PROFILE_PROPS),
+        lambda p: [_profile(p)],
+    ),
+    WriteStep(
+        "ForRole",
+        merge_relationships_query(
+            "JobProfile",
+            ["id"],
+            "ForRole",
+            "PrepareForRole",
+            ["heading"],
+            ["educationVsDegree", "trainingNeeded", "priorWorkExperience"],
+        ),
+        lambda p: [
+            {
+                "start": {"id": p["id"]},
+                "end": {"heading": p["jobProfile"]["prepareForRole"]["educationVsDegreeHeading"]},
+                "educationVsDegree": p["jobProfile"]["prepareForRole"]["educationVsDegree"],
+                "trainingNeeded": p["jobProfile"]["prepareForRole"]["trainingNeeded"],
+                "priorWorkExperience": p["jobProfile"]["prepareForRole"]["priorWorkExperience"],
+            }
+        ],
+    ),
+    WriteStep(
+        "LIKED_FOR",
+        merge_relationships_query("JobProfile", ["id"], "LIKED_FOR", "ReasonLiked", ["reason"]),
+        lambda p: [
+            {"start": {"id": p["id"]}, "end": {"reason": el}}
+            for el in p["jobProfile"]["reasonLiked"]
+        ],
+    ),
+    WriteStep(
+        "DISLIKED_FOR",
+        merge_relationships_query(
+            "JobProfile", ["id"], "DISLIKED_FOR", "ReasonDisliked", ["reason"]
+        ),
+        lambda p: [
+            {"start": {"id": p["id"]}, "end": {"reason": el}}
+            for el in p["jobProfile"]["reasonsDisliked"]
+        ],
+    ),
+    WriteStep(
+        "HAS_APTITUDE",
+        merge_relationships_query(
+            "JobProfile", ["id"], "HAS_APTITUDE", "Aptitude", ["attribute"], ["score"]
+        ),
+        lambda p: _ratings(p, "aptitudeRatings"),
+    ),
+    WriteStep(
+        "HAS_INTEREST",
+        merge_relationships_query(
+            "JobProfile", ["id"], "HAS_INTEREST", "Interest", ["attribute"], ["score"]
+        ),
+        lambda p: _ratings(p, "interestRatings"),
+    ),
+    WriteStep(
+        "HAS_VALUE",
+        merge_relationships_query(
+            "JobProfile", ["id"], "HAS_VALUE", "Value", ["attribute"], ["score"]
+        ),
+        lambda p: _ratings(p, "valueRatings"),
+    ),
+    WriteStep(
+        "HAS_CAREER_PATHWAY",
+        merge_relationships_query(
+            "JobProfile", ["id"], "HAS_CAREER_PATHWAY", "CareerPathway", ["title"]
+        ),
+        lambda p: [
+            {"start": {"id": p["id"]}, "end": {"title": el["pathwayTitle"]}}
+            for el in p["careerPathways"]
+        ],
+    ),
+    WriteStep(
+        "HAS_JOB_ROLE",
+        merge_relationships_query(
+            "CareerPathway", ["title"], "HAS_JOB_ROLE", "JobRole", ["title", "years"]
+        ),
+        lambda p: [
+            {
+                "start": {"title": el["pathwayTitle"]},
+                "end": {"title": jr["title"], "years": jr["years"]},
+            }
+            for el in p["careerPathways"]
+            for jr in el["jobRoles"]
+        ],
+        distinct=True,
+        keys=("start", "end"),
+    ),
+    WriteStep(
+        "EMPLOYED_BY",
+        merge_relationships_query("JobProfile", ["id"], "EMPLOYED_BY", "Employer", ["name"]),
+        lambda p: [
+            {"start": {"id": p["id"]}, "end": {"name": el["name"]}}
+            for el in p["employers"]["wellKnownEmployers"]
+        ],
+    ),
+    WriteStep(
+        "HAS_EMPLOYER_PROFILE",
+        merge_relationships_query(
+            "JobProfile",
+            ["id"],
+            "HAS_EMPLOYER_PROFILE",
+            "EmployerProfile",
+            ["geographicOption"],
+            ["profiles"],
+        ),
+        lambda p: [
+            {
+                "start": {"id": p["id"]},
+                "end": {"geographicOption": el["geographicOption"]},
+                "profiles": el["profiles"],
+            }
+            for el in p["employers"]["employerProfiles"]
+        ],
+    ),
+    WriteStep(
+        "HAS_GEOGRAPHIC_DETAIL",
+        merge_relationships_query(
+            "JobProfile",
+            ["id"],
+            "HAS_GEOGRAPHIC_DETAIL",
+            "GeographicDetail",
+            ["option"],
+            ["jobAvailability", "estimatedSalaryRange", "maximumSalary", "minimumSalary"],
+        ),
+        _geo_details,
+    ),
+    WriteStep(
+        "FactCard",
+        fact_card_write_query,
+        lambda p: [
+            {"id": p["id"], "text": p["factCard"], "embedding": p["factCardEmbedding"]}
+        ],
+    ),
+    WriteStep(
+        "Chunk",
+        chunk_write_query,
+        lambda p: [
+            {
+                "profileId": p["id"],
+                "index": chunk["index"],
+                "text": chunk["text"],
+                "embedding": chunk["embedding"],
+            }
+            for chunk in p["chunks"]
+        ],
+    ),
+]
+
+
+def _missing(value: Any) -> bool:
+    # Relationship rows carry their endpoint keys as dicts
+    if isinstance(value, dict):
+        return any(_missing(el) for el in value.values())
+    return value is None
+
+
+def _distinct_rows(rows: List[Dict], keys: Sequence[str]) -> List[Dict]:
+    # MERGE on a null key fails, so rows missing a key are dropped
+    unique = {}
+    for row in rows:
+        if any(_missing(row.get(key)) for key in keys):
+            continue
+        unique.setdefault(repr(sorted(row.items())), row)
+    return list(unique.values())
+
+
+def query_with_retry(
+    graph,
+    query: str,
+    params: Dict,
+    max_retries: int = WRITE_MAX_RETRIES,
+    backoff_seconds: float = WRITE_BACKOFF_SECONDS,
+):
+    """
+    Run a write query, retrying transient failures such as deadlocks
+    """
+    attempt = 0
+    while True:
+        try:
+            return graph.query(query, params)
+        except TransientError as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = backoff_seconds * 2 ** (attempt - 1) + random.uniform(0, backoff_seconds)
+            logging.warning(
+                f"Transient write error ({e.code}), retry {attempt}/{max_retries} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+def write_profiles(graph, params: List[Dict], batch_size: int = WRITE_BATCH_SIZE) -> None:
+    """
+    Write import params step by step, committing every `batch_size` rows
+    """
+    for step in WRITE_STEPS:
+        rows = [row for param in params for row in step.rows(param)]
+        if step.distinct:
+            rows = _distinct_rows(rows, step.keys)
+        if not rows:
+            continue
+        start = time.perf_counter()
+        for batch in batched(rows, batch_size):
+            query_with_retry(graph, step.query, {"rows": batch})
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"Wrote {len(rows)} {step.name} rows in {elapsed:.2f}s "
+            f"({len(rows) / max(elapsed, 1e-9):.0f} rows/s)"
+        )
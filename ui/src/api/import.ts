@@ -1,5 +1,22 @@
 import { apiClient } from "./axios";
 
+export interface ImportJobStatus {
+  id: string;
+  status: "pending" | "running" | "succeeded" | "failed" | "cancelled";
+  delta: boolean;
+  total: number | null;
+  parsed: number;
+  chunksEmbedded: number;
+  rowsWritten: number;
+  processed: number;
+  elapsedSeconds: number;
+  rowsPerSecond: number;
+  etaSeconds: number | null;
+  stageSeconds: Record<string, number>;
+  result: Record<string, number> | null;
+  error: string | null;
+}
+
 export async function importArticles() {
   try {
     const response = await apiClient.get("/import_articles/");
@@ -9,3 +26,43 @@ export async function importArticles() {
     throw error;
   }
 }
+
+export async function startImportJob(delta = false): Promise<ImportJobStatus> {
+  try {
+    const response = await apiClient.post("/import_jobs/", null, {
+      params: { delta },
+    });
+    return response.data;
+  } catch (error) {
+    console.log(error);
+    throw error;
+  }
+}
+
+export async function cancelImportJob(id: string): Promise<ImportJobStatus> {
+  try {
+    const response = await apiClient.post(`/import_jobs/${id}/cancel`);
+    return response.data;
+  } catch (error) {
+    console.log(error);
+    throw error;
+  }
+}
+
+export function subscribeImportJob(
+  id: string,
+  onStatus: (status: ImportJobStatus) => void
+): () => void {
+  const source = new EventSource(
+    `${apiClient.defaults.baseURL}/import_jobs/${id}/events`
+  );
+  source.onmessage = (event) => {
+    const status: ImportJobStatus = JSON.parse(event.data);
+    onStatus(status);
+    if (!["pending", "running"].includes(status.status)) {
+      source.close();
+    }
+  };
+  source.onerror = () => source.close();
+  return () => source.close();
+}
@@ -163,6 +163,8 @@ export function Chat() {
       if (context.length === 0) {
         switch (retrievalMode) {
           case "basic_hybrid_search":
+          case "graph_expanded_search":
+          case "fact_card_search":
             context = extractContext(
               state?.logs?.["ChatPromptTemplate"]?.final_output?.lc_kwargs
                 .messages[0].content,
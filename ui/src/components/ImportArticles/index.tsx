@@ -13,28 +13,58 @@ import {
   Notification,
   rem,
   Alert,
+  Progress,
 } from "@mantine/core";
 import { useMutation } from "@tanstack/react-query";
-import { importArticles } from "../../api";
-import { FormEvent, useState } from "react";
+import {
+  ImportJobStatus,
+  cancelImportJob,
+  startImportJob,
+  subscribeImportJob,
+} from "../../api";
+import { FormEvent, useEffect, useRef, useState } from "react";
 import { IconCheck, IconInfoCircle, IconX } from "@tabler/icons-react";
 
 export function ImportArticles() {
   const [successMessage, setSuccessMessage] = useState("");
   const [errorMessage, setErrorMessage] = useState("");
+  const [job, setJob] = useState<ImportJobStatus | null>(null);
+  const unsubscribe = useRef<(() => void) | null>(null);
 
   const form = useForm({});
 
+  useEffect(() => () => unsubscribe.current?.(), []);
+
+  const handleJobStatus = (status: ImportJobStatus) => {
+    setJob(status);
+    if (status.status === "succeeded") {
+      setSuccessMessage(
+        `Successfully imported ${status.result?.rows ?? status.processed} articles!`
+      );
+    } else if (status.status === "cancelled") {
+      setErrorMessage("Import cancelled.");
+    } else if (status.status === "failed") {
+      setErrorMessage(`Failed to import articles. ${status.error ?? ""}`);
+    }
+  };
+
   const mutation = useMutation({
-    mutationFn: importArticles,
-    onSuccess: () => {
-      setSuccessMessage(`Successfully imported articles!`);
+    mutationFn: () => startImportJob(),
+    onSuccess: (status) => {
+      setJob(status);
+      unsubscribe.current?.();
+      unsubscribe.current = subscribeImportJob(status.id, handleJobStatus);
     },
     onError: () => {
       setErrorMessage("Failed to import articles.");
     },
   });
 
+  const isRunning =
+    job !== null && ["pending", "running"].includes(job.status);
+  const percent =
+    job?.total ? Math.min(100, (100 * job.processed) / job.total) : 0;
+
   const handleFormSubmit = (event: FormEvent<HTMLFormElement>) => {
     event.preventDefault();
     setSuccessMessage("");
@@ -101,10 +131,34 @@ export function ImportArticles() {
                   {form.errors["query.tag"]}
                 </Notification>
               )}
+              {isRunning && job && (
+                <Box mt="lg">
+                  <Progress value={percent} animated />
+                  <Text size="sm" c="dimmed" mt="xs">
+                    {job.parsed} profiles parsed · {job.chunksEmbedded} chunks
+                    embedded · {job.rowsWritten} rows written ·{" "}
+                    {job.rowsPerSecond} rows/s
+                    {job.etaSeconds !== null &&
+                      ` · ETA ${Math.ceil(job.etaSeconds)}s`}
+                  </Text>
+                </Box>
+              )}
               <Group mt="lg">
-                <Button color="teal" loading={mutation.isPending} type="submit">
+                <Button
+                  color="teal"
+                  loading={mutation.isPending || isRunning}
+                  type="submit"
+                >
                   Import
                 </Button>
+                {isRunning && job && (
+                  <Button
+                    variant="default"
+                    onClick={() => cancelImportJob(job.id)}
+                  >
+                    Cancel
+                  </Button>
+                )}
               </Group>
             </form>
           </>
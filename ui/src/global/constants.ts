@@ -4,6 +4,16 @@ export const RETRIEVAL_MODES = [
     label: "Vector + KG",
     endpoint: "chat",
   },
+  {
+    name: "graph_expanded_search",
+    label: "Vector + graph expansion",
+    endpoint: "chat",
+  },
+  {
+    name: "fact_card_search",
+    label: "Fact cards",
+    endpoint: "chat",
+  },
   {
     name: "basic_hybrid_search",
     label: "Vector only",